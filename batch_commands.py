@@ -0,0 +1,105 @@
+"""
+批量 actor 命令
+
+把销毁、自动驾驶、位姿、物理和车灯等操作收集起来，
+通过一次 client.apply_batch_sync 发送，并逐条返回执行结果。
+"""
+
+import carla
+
+
+# carla 默认的 Traffic Manager 端口
+DEFAULT_TM_PORT = 8000
+
+
+class BatchResult:
+    """
+    apply 的结果：actor_ids 与命令一一对应（生成命令为新 actor 的 id，失败为 0），
+    errors 为 [(命令说明, actor_id, 错误信息)]
+    """
+
+    def __init__(self, labels, responses):
+        self.actor_ids = []
+        self.errors = []
+        for label, response in zip(labels, responses):
+            self.actor_ids.append(response.actor_id)
+            if response.has_error():
+                self.errors.append((label, response.actor_id, response.error))
+
+    @property
+    def total(self):
+        return len(self.actor_ids)
+
+    @property
+    def succeeded(self):
+        return self.total - len(self.errors)
+
+    def report(self, action):
+        """打印汇总，并列出前几条失败原因"""
+        if not self.errors:
+            print(f"✅ {action}: {self.succeeded}/{self.total}")
+            return
+        print(f"⚠️ {action}: 成功 {self.succeeded}/{self.total}，失败 {len(self.errors)}")
+        for label, actor_id, error in self.errors[:5]:
+            print(f"   ❌ {label} (actor {actor_id}): {error}")
+
+
+class CommandBatch:
+    """
+    用法:
+        batch = CommandBatch(client)
+        for actor_id in ids:
+            batch.destroy(actor_id)
+        result = batch.apply()
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self._commands = []
+        self._labels = []
+
+    def __len__(self):
+        return len(self._commands)
+
+    def _add(self, label, command):
+        self._commands.append(command)
+        self._labels.append(label)
+        return self
+
+    def destroy(self, actor_id):
+        return self._add("destroy", carla.command.DestroyActor(actor_id))
+
+    def set_autopilot(self, actor_id, enabled=True, tm_port=DEFAULT_TM_PORT):
+        return self._add("autopilot", carla.command.SetAutopilot(actor_id, enabled, tm_port))
+
+    def set_transform(self, actor_id, transform):
+        return self._add("transform", carla.command.ApplyTransform(actor_id, transform))
+
+    def set_simulate_physics(self, actor_id, enabled=True):
+        return self._add("physics", carla.command.SetSimulatePhysics(actor_id, enabled))
+
+    def set_light_state(self, actor_id, light_state):
+        return self._add("light_state", carla.command.SetVehicleLightState(actor_id, light_state))
+
+    def spawn(self, blueprint, transform, *then, parent_id=None):
+        """
+        生成 actor；then 为生成成功后对新 actor 执行的命令，
+        其中的 actor id 用 carla.command.FutureActor 占位。
+        parent_id 不为空时把新 actor 挂载到该 actor 上（如行人的 AI 控制器）
+        """
+        if parent_id is None:
+            command = carla.command.SpawnActor(blueprint, transform)
+        else:
+            command = carla.command.SpawnActor(blueprint, transform, parent_id)
+        for follow_up in then:
+            command = command.then(follow_up)
+        return self._add(f"spawn {blueprint.id}", command)
+
+    def apply(self, do_tick=False):
+        """一次往返发送所有命令，之后清空；do_tick 用于同步模式下让命令立即生效"""
+        commands, labels = self._commands, self._labels
+        self._commands, self._labels = [], []
+        if not commands:
+            return BatchResult([], [])
+        responses = self.client.apply_batch_sync(commands, do_tick)
+        return BatchResult(labels, responses)
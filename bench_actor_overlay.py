@@ -0,0 +1,204 @@
+"""
+Benchmark for snapshot-based actor pose reads on the 2D map overlay
+
+Compares the previous per-actor path (get_actors().filter() + one
+get_transform() round-trip per vehicle, projected one marker at a time)
+against one world.get_snapshot() per tick with vectorized projection.
+The fake world counts simulated RPC calls and can add a fixed latency to
+each of them to approximate a remote CARLA server.
+
+    python bench_actor_overlay.py --actors 1000 10000 --frames 20 --rpc-latency-ms 0.2
+"""
+
+import argparse
+import itertools
+import random
+import time
+
+import carla
+import numpy as np
+
+from map_2d_viewer import Map2dViewer, MapGenerator, PIXELS_PER_METER
+
+
+class _RpcCounter:
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+        self.calls = 0
+
+    def call(self):
+        self.calls += 1
+        if self.latency_s:
+            time.sleep(self.latency_s)
+
+
+class _FakeActor:
+    def __init__(self, rpc, actor_id, type_id, x, y, yaw):
+        self._rpc = rpc
+        self.id = actor_id
+        self.type_id = type_id
+        self.attributes = {"role_name": "autopilot"}
+        self.transform = carla.Transform(carla.Location(x=x, y=y), carla.Rotation(yaw=yaw))
+
+    def get_transform(self):
+        self._rpc.call()
+        return self.transform
+
+
+class _FakeActorList(list):
+    def filter(self, pattern):
+        prefix = pattern.rstrip("*")
+        return _FakeActorList(a for a in self if a.type_id.startswith(prefix))
+
+
+class _FakeActorSnapshot:
+    _zero = carla.Vector3D(0.0, 0.0, 0.0)
+
+    def __init__(self, actor):
+        self.id = actor.id
+        self._transform = actor.transform
+
+    def get_transform(self):
+        return self._transform
+
+    def get_velocity(self):
+        return self._zero
+
+    def get_angular_velocity(self):
+        return self._zero
+
+
+class _FakeTimestamp:
+    def __init__(self, frame):
+        self.elapsed_seconds = frame * 0.05
+
+
+class _FakeSnapshot(list):
+    def __init__(self, frame, actors):
+        super().__init__(_FakeActorSnapshot(a) for a in actors)
+        self.frame = frame
+        self.timestamp = _FakeTimestamp(frame)
+
+
+class _FakeWorld:
+    _ids = itertools.count(1)
+
+    def __init__(self, rpc, actors):
+        self.id = next(self._ids)
+        self._rpc = rpc
+        self._actors = _FakeActorList(actors)
+        self.frame = 0
+
+    def tick(self):
+        self.frame += 1
+
+    def get_actors(self, actor_ids=None):
+        self._rpc.call()
+        if actor_ids is None:
+            return self._actors
+        wanted = set(actor_ids)
+        return _FakeActorList(a for a in self._actors if a.id in wanted)
+
+    def get_snapshot(self):
+        self._rpc.call()
+        return _FakeSnapshot(self.frame, self._actors)
+
+
+class _FakeMap:
+    name = "Bench"
+
+
+def make_world(rpc, count, world_size, rnd):
+    actors = []
+    for i in range(count):
+        # 约 1/10 为行人，另有少量传感器等不参与绘制的 actor
+        kind = rnd.random()
+        if kind < 0.1:
+            type_id = "walker.pedestrian.0001"
+        elif kind < 0.12:
+            type_id = "sensor.camera.rgb"
+        else:
+            type_id = "vehicle.tesla.model3"
+        actors.append(_FakeActor(
+            rpc, 1000 + i, type_id,
+            rnd.uniform(0, world_size), rnd.uniform(0, world_size), rnd.uniform(-180, 180),
+        ))
+    return _FakeWorld(rpc, actors)
+
+
+def make_map_generator(pixel_size):
+    world_size = pixel_size / PIXELS_PER_METER
+    raster = np.full((pixel_size, pixel_size, 3), 84, dtype=np.uint8)
+    meta = {
+        "world_offset": [0.0, 0.0],
+        "world_width": world_size,
+        "world_height": world_size,
+        "pixels_per_meter": PIXELS_PER_METER,
+        "pixel_width": pixel_size,
+        "pixel_height": pixel_size,
+    }
+    return MapGenerator.from_raster(None, _FakeMap(), raster, meta), world_size
+
+
+def legacy_markers(viewer, world, ego_vehicle):
+    """改造前的读取方式：每辆车一次 get_transform()，逐个投影"""
+    points = []
+    for v in list(world.get_actors().filter("vehicle.*")):
+        if v.id == ego_vehicle.id:
+            continue
+        points.append(viewer._to_screen(v.get_transform().location))
+    return points
+
+
+def snapshot_markers(viewer, world):
+    poses = viewer.read_poses(world)
+    return viewer._to_screen_array(poses.xy)
+
+
+def time_frames(world, frames, fn):
+    t_start = time.perf_counter()
+    for _ in range(frames):
+        world.tick()
+        fn()
+    return (time.perf_counter() - t_start) * 1000 / frames
+
+
+def run(actor_counts, frames, latency_ms, map_size):
+    rnd = random.Random(0)
+    map_gen, world_size = make_map_generator(map_size)
+    print(f"{'actors':>7} {'path':>9} {'rpc/frame':>10} {'read ms':>9} {'render ms':>10}")
+    for count in actor_counts:
+        rpc = _RpcCounter(latency_ms / 1000.0)
+        world = make_world(rpc, count, world_size, rnd)
+        ego = world._actors.filter("vehicle.*")[0]
+        viewer = Map2dViewer()
+        viewer.update_with_ego(world, ego, map_gen=map_gen)
+
+        rpc.calls = 0
+        read_ms = time_frames(world, frames, lambda: legacy_markers(viewer, world, ego))
+        legacy_calls = rpc.calls / frames
+        print(f"{count:>7} {'legacy':>9} {legacy_calls:>10.0f} {read_ms:>9.2f} {'-':>10}")
+
+        # 预热类别缓存，只统计稳态下的每帧开销
+        viewer.read_poses(world)
+        rpc.calls = 0
+        read_ms = time_frames(world, frames, lambda: snapshot_markers(viewer, world))
+        snapshot_calls = rpc.calls / frames
+        render_ms = time_frames(world, frames, lambda: viewer.update_with_ego(world, ego, map_gen=map_gen))
+        print(f"{count:>7} {'snapshot':>9} {snapshot_calls:>10.0f} {read_ms:>9.2f} {render_ms:>10.2f}")
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Snapshot-based actor overlay benchmark')
+    argparser.add_argument('--actors', nargs='*', type=int, default=[1000, 10000],
+                           help='number of actors in the fake world')
+    argparser.add_argument('--frames', type=int, default=20, help='frames per measurement')
+    argparser.add_argument('--rpc-latency-ms', type=float, default=0.0,
+                           help='simulated latency added to every RPC call')
+    argparser.add_argument('--map-size', type=int, default=2000, help='square base raster size in pixels')
+    args = argparser.parse_args()
+    run(args.actors, args.frames, args.rpc_latency_ms, args.map_size)
+
+
+if __name__ == '__main__':
+    main()
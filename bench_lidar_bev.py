@@ -0,0 +1,88 @@
+"""
+Benchmark for the LiDAR bird's-eye-view rasterizer
+
+Compares the previous per-frame path (fresh image, np.fabs projection and
+fancy-index scatter) against LidarBevRasterizer in each colouring mode.
+Point clouds are synthetic: points_per_second / rotation_frequency points
+per frame, spread over a disc slightly larger than the sensor range so
+that out-of-range points are part of the workload.
+
+    python bench_lidar_bev.py --pps 250000 1000000 --frames 200
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from lidar_bev import BEV_MODES, LidarBevRasterizer
+
+
+def make_points(count, lidar_range, rng):
+    radius = lidar_range * 1.2 * np.sqrt(rng.random(count))
+    angle = rng.random(count) * 2 * np.pi
+    points = np.empty((count, 4), dtype=np.float32)
+    points[:, 0] = radius * np.cos(angle)
+    points[:, 1] = radius * np.sin(angle)
+    points[:, 2] = rng.normal(-2.0, 1.0, count)
+    points[:, 3] = rng.random(count)
+    return points
+
+
+def legacy_rasterize(points, disp_size, lidar_range):
+    scale = min(disp_size) / (2.0 * lidar_range)
+    px = np.fabs(points[:, 0] * scale + 0.5 * disp_size[0]).astype(np.int32)
+    py = np.fabs(points[:, 1] * scale + 0.5 * disp_size[1]).astype(np.int32)
+    inside = (px < disp_size[0]) & (py < disp_size[1])
+    image = np.zeros((disp_size[1], disp_size[0], 3), dtype=np.uint8)
+    image[py[inside], px[inside]] = 255
+    return image
+
+
+def time_frames(frames, clouds, fn):
+    fn(clouds[0])
+    t_start = time.perf_counter()
+    for i in range(frames):
+        fn(clouds[i % len(clouds)])
+    return (time.perf_counter() - t_start) * 1000 / frames
+
+
+def run(pps_list, rotation_frequency, frames, width, height, lidar_range, seed):
+    rng = np.random.default_rng(seed)
+    out = np.zeros((height, width, 3), dtype=np.uint8)
+    frame_budget_ms = 1000.0 / rotation_frequency
+    print(f"{width}x{height} cell, range {lidar_range} m, {rotation_frequency} Hz "
+          f"(frame budget {frame_budget_ms:.1f} ms)")
+    print(f"{'pps':>9} {'pts/frame':>10} {'path':>16} {'ms/frame':>9} {'Mpts/s':>8} {'budget':>7}")
+    for pps in pps_list:
+        count = int(pps / rotation_frequency)
+        clouds = [make_points(count, lidar_range, rng) for _ in range(4)]
+        paths = [("legacy", lambda p: legacy_rasterize(p, (width, height), lidar_range))]
+        for mode in BEV_MODES:
+            bev = LidarBevRasterizer(width, height, lidar_range, mode=mode)
+            paths.append((mode, lambda p, bev=bev: bev.rasterize(p, out=out)))
+        bev = LidarBevRasterizer(width, height, lidar_range, mode="density", align="world")
+        paths.append(("density+world", lambda p, bev=bev: bev.rasterize(p, yaw=37.0, out=out)))
+        for name, fn in paths:
+            ms = time_frames(frames, clouds, fn)
+            print(f"{pps:>9} {count:>10} {name:>16} {ms:>9.3f} {count / ms / 1000:>8.1f} "
+                  f"{ms / frame_budget_ms:>6.1%}")
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='LiDAR BEV rasterizer benchmark')
+    argparser.add_argument('--pps', nargs='*', type=int, default=[250000, 1000000],
+                           help='LiDAR points_per_second to simulate')
+    argparser.add_argument('--rotation-frequency', type=float, default=20.0,
+                           help='LiDAR rotation frequency in Hz (one point cloud per rotation)')
+    argparser.add_argument('--frames', type=int, default=200, help='frames per measurement')
+    argparser.add_argument('--width', type=int, default=320, help='BEV width in pixels')
+    argparser.add_argument('--height', type=int, default=270, help='BEV height in pixels')
+    argparser.add_argument('--range', type=float, default=100.0, help='LiDAR range in meters')
+    argparser.add_argument('--seed', type=int, default=0, help='random seed for the point clouds')
+    args = argparser.parse_args()
+    run(args.pps, args.rotation_frequency, args.frames, args.width, args.height, args.range, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark for parallel road geometry extraction
+
+Times extract_road_geometry in the current process against
+ParallelRoadGeometry with several worker counts on the map that is loaded
+on a running CARLA server. The parallel column includes starting the
+spawn workers, rebuilding carla.Map from OpenDRIVE in each of them and
+merging the shards, so it is the wall time MapGenerator actually waits.
+The row with the lowest time tells which MAP_BUILD_WORKERS pays off on
+this machine.
+
+    python bench_map_geometry.py --host 127.0.0.1 --port 2000 --workers 2 4 8
+"""
+
+import argparse
+import os
+import time
+
+import carla
+
+from map_geometry import ParallelRoadGeometry, extract_road_geometry
+
+
+def time_call(repeat, fn):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t_start)
+    return best, result
+
+
+def run(host, port, workers_list, repeat, step):
+    client = carla.Client(host, port)
+    client.set_timeout(30.0)
+    carla_map = client.get_world().get_map()
+    opendrive = carla_map.to_opendrive()
+    print(f"map {carla_map.name}, {len(carla_map.get_topology())} topology segments, "
+          f"{os.cpu_count()} CPUs, best of {repeat}")
+
+    serial_s, serial = time_call(repeat, lambda: extract_road_geometry(carla_map, step=step))
+    print(f"{'workers':>8} {'seconds':>9} {'speedup':>8} {'polygons':>9}")
+    print(f"{'serial':>8} {serial_s:>9.3f} {1.0:>7.2f}x {serial.num_polygons:>9}")
+    for workers in workers_list:
+        seconds, geometry = time_call(
+            repeat, lambda: ParallelRoadGeometry(carla_map.name, opendrive, workers, step=step).result()
+        )
+        print(f"{workers:>8} {seconds:>9.3f} {serial_s / seconds:>7.2f}x {geometry.num_polygons:>9}")
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Parallel road geometry benchmark')
+    argparser.add_argument('--host', default='127.0.0.1', help='CARLA server host')
+    argparser.add_argument('--port', type=int, default=2000, help='CARLA server port')
+    argparser.add_argument('--workers', nargs='*', type=int, default=[2, 4, 8],
+                           help='worker process counts to compare with the serial path')
+    argparser.add_argument('--repeat', type=int, default=3, help='runs per measurement (best is reported)')
+    argparser.add_argument('--step', type=float, default=2.0, help='waypoint sampling step in meters')
+    args = argparser.parse_args()
+    run(args.host, args.port, args.workers, args.repeat, args.step)
+
+
+if __name__ == '__main__':
+    main()
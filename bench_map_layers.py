@@ -0,0 +1,102 @@
+"""
+Benchmark for the layered 2D map renderer
+
+Builds synthetic base rasters of increasing size and measures the one-off cost
+of producing the scaled base layer versus the per-frame cost of drawing the
+dynamic overlay (ego arrow, NPC markers, route) on top of it. The per-frame
+column should stay flat while the map grows.
+
+    python bench_map_layers.py --sizes 1000 4000 8000 --frames 50
+"""
+
+import argparse
+import math
+import random
+import time
+
+import carla
+import numpy as np
+
+from map_2d_viewer import MapGenerator, Map2dViewer, PIXELS_PER_METER
+
+
+class _FakeActor:
+    def __init__(self, actor_id, x, y, yaw):
+        self.id = actor_id
+        self._transform = carla.Transform(carla.Location(x=x, y=y), carla.Rotation(yaw=yaw))
+
+    def get_transform(self):
+        return self._transform
+
+
+class _FakeActorList(list):
+    def filter(self, pattern):
+        return self
+
+
+class _FakeWorld:
+    def __init__(self, actors):
+        self._actors = _FakeActorList(actors)
+
+    def get_actors(self):
+        return self._actors
+
+
+class _FakeMap:
+    name = "Bench"
+
+
+def make_map_generator(pixel_size):
+    world_size = pixel_size / PIXELS_PER_METER
+    raster = np.full((pixel_size, pixel_size, 3), 84, dtype=np.uint8)
+    meta = {
+        "world_offset": [0.0, 0.0],
+        "world_width": world_size,
+        "world_height": world_size,
+        "pixels_per_meter": PIXELS_PER_METER,
+        "pixel_width": pixel_size,
+        "pixel_height": pixel_size,
+    }
+    return MapGenerator.from_raster(None, _FakeMap(), raster, meta), world_size
+
+
+def run(sizes, frames, actors):
+    rnd = random.Random(0)
+    print(f"{'map px':>8} {'base layer ms':>14} {'per frame ms':>13}")
+    for size in sizes:
+        map_gen, world_size = make_map_generator(size)
+        npcs = [
+            _FakeActor(i, rnd.uniform(0, world_size), rnd.uniform(0, world_size), rnd.uniform(-180, 180))
+            for i in range(actors)
+        ]
+        ego = npcs[0]
+        world = _FakeWorld(npcs)
+        route = [
+            carla.Location(x=world_size * 0.5 + 50 * math.cos(a / 10), y=world_size * 0.5 + 50 * math.sin(a / 10))
+            for a in range(60)
+        ]
+        viewer = Map2dViewer()
+
+        t_start = time.perf_counter()
+        viewer.update_with_ego(world, ego, map_gen=map_gen, route=route)
+        base_ms = (time.perf_counter() - t_start) * 1000
+
+        t_start = time.perf_counter()
+        for _ in range(frames):
+            viewer.update_with_ego(world, ego, map_gen=map_gen, route=route)
+        frame_ms = (time.perf_counter() - t_start) * 1000 / frames
+        print(f"{size:>8} {base_ms:>14.1f} {frame_ms:>13.2f}")
+
+
+def main():
+    argparser = argparse.ArgumentParser(description='Layered 2D map renderer benchmark')
+    argparser.add_argument('--sizes', nargs='*', type=int, default=[1000, 2000, 4000, 8000],
+                           help='square base raster sizes in pixels')
+    argparser.add_argument('--frames', type=int, default=50, help='frames per size')
+    argparser.add_argument('--actors', type=int, default=50, help='vehicles drawn per frame')
+    args = argparser.parse_args()
+    run(args.sizes, args.frames, args.actors)
+
+
+if __name__ == '__main__':
+    main()
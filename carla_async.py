@@ -0,0 +1,120 @@
+"""
+CarlaClientManager 的异步封装
+
+NiceGUI 的事件处理函数运行在 asyncio 事件循环上，直接调用阻塞的 carla RPC
+（连接超时 10 秒、load_world、批量删除等）会让所有浏览器会话一起卡住。
+AsyncCarlaClient 把这些调用放到线程池中执行，事件循环只 await 结果:
+
+    carla_async = AsyncCarlaClient()
+    await carla_async.connect(ip, port)
+    status = await carla_async.get_status()
+    vehicles, walkers = await carla_async.run(traffic.spawn, 30, 10)
+
+CarlaClientManager 不是线程安全的，会修改状态的调用（连接、切换地图、生成 / 删除车辆、
+自动驾驶、观察者视角等）都在同一个单线程执行器中按提交顺序执行，快速连点时
+后一次操作不会先于前一次完成。只读查询在一个有界线程池中并发执行，
+参数相同的查询在前一个尚未完成时直接共享同一个结果，不会重复发给服务器。
+"""
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from carla_client import CarlaClientManager
+
+
+# 只读查询同时执行的上限；carla.Client 内部是单连接，再多的线程也只会排队
+MAX_RPC_WORKERS = 4
+
+# 只读查询：在线程池中并发执行，参数相同的并发请求合并为一次调用。
+# 其余方法都会修改状态，在单线程执行器中按顺序执行，每次点击都单独执行一次
+COALESCED_METHODS = frozenset({
+    "get_status",
+    "get_maps",
+    "get_vehicles",
+    "get_available_vehicle_blueprints",
+})
+
+
+def _make_key(name, args, kwargs):
+    try:
+        key = (name, args, tuple(sorted(kwargs.items())))
+        hash(key)
+    except TypeError:
+        # 参数不可哈希（如 carla.Transform）时不合并
+        return None
+    return key
+
+
+class AsyncCarlaClient:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, "_initialized", False):
+            return
+        self.client_manager = CarlaClientManager()
+        self._read_executor = ThreadPoolExecutor(max_workers=MAX_RPC_WORKERS, thread_name_prefix="carla-query")
+        self._serial_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="carla-rpc")
+        # 合并键 -> 正在执行的 asyncio.Future；只在事件循环线程中读写，无需加锁
+        self._inflight = {}
+        self._initialized = True
+
+    @property
+    def pending(self):
+        """正在执行或排队中的合并请求数"""
+        return len(self._inflight)
+
+    async def run(self, fn, *args, key=None, read_only=False, **kwargs):
+        """
+        执行 fn(*args, **kwargs) 并等待结果。默认在单线程执行器中按提交顺序执行；
+        read_only=True 的只读查询在线程池中并发执行。
+        key 只能用于只读查询：同一 key 已有未完成的请求则直接等待该请求的结果
+        """
+        if key is not None and not read_only:
+            raise ValueError("只有只读查询可以合并")
+        if key is not None:
+            future = self._inflight.get(key)
+            if future is not None:
+                # shield: 某个页面关闭取消了等待，不影响共享同一结果的其他页面
+                return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        executor = self._read_executor if read_only else self._serial_executor
+        future = loop.run_in_executor(executor, functools.partial(fn, *args, **kwargs))
+        if key is not None:
+            self._inflight[key] = future
+            future.add_done_callback(lambda f: self._release(key, f))
+        return await asyncio.shield(future)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        从任意线程（例如推流编码线程）把修改状态的调用加入顺序执行队列，不等待结果；
+        返回 concurrent.futures.Future
+        """
+        return self._serial_executor.submit(fn, *args, **kwargs)
+
+    def _release(self, key, future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
+    def __getattr__(self, name):
+        """把 CarlaClientManager 的方法包装成协程函数，例如 await carla_async.change_map(name)"""
+        if name.startswith("_") or name == "client_manager":
+            raise AttributeError(name)
+        method = getattr(self.client_manager, name)
+        if not callable(method):
+            raise AttributeError(f"{name} 不是 CarlaClientManager 的方法")
+
+        read_only = name in COALESCED_METHODS
+
+        async def call(*args, **kwargs):
+            key = _make_key(name, args, kwargs) if read_only else None
+            return await self.run(method, *args, key=key, read_only=read_only, **kwargs)
+
+        call.__name__ = name
+        return call
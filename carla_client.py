@@ -1,8 +1,13 @@
-from bottle import thread
 import carla
 from typing import Optional
 import random
 import math
+from world_state import WorldStateCache, ACTOR_CLASS_VEHICLE
+from batch_commands import CommandBatch, DEFAULT_TM_PORT
+from tick_scheduler import TickScheduler
+from spectator_controller import SpectatorController
+from debug_overlay import VehicleLabelOverlay
+from client_status import ClientStatus, REFRESH_INTERVAL as STATUS_REFRESH_INTERVAL
 
 
 class CarlaClientManager:
@@ -25,7 +30,26 @@ class CarlaClientManager:
         self.ego_vehicle = None
         self._show_speed = False
         self._show_pose = False
-        self._display_info_thread_running = False
+        self._map_change_listeners = []
+        # SetAutopilot 等命令使用的 Traffic Manager 端口
+        self.tm_port = DEFAULT_TM_PORT
+        # 所有读取方共享的按 tick 刷新的世界状态，由下面的 tick 调度器线程刷新
+        self.world_state = WorldStateCache()
+        self.add_map_change_listener(self.world_state.attach)
+        # 车辆信息显示、观察者跟随等周期任务共用一个 tick 线程
+        self.scheduler = TickScheduler(self.world_state)
+        self.add_map_change_listener(self.scheduler.attach)
+        # 跟随模式的相机平滑与死区，位姿变化很小时不发送 set_transform
+        self.spectator_controller = SpectatorController()
+        # 车速 / 坐标文字：距离剔除、按车限频，以有限 life_time 绘制
+        self.label_overlay = VehicleLabelOverlay()
+        # 所有页面共享的状态文本，由 tick 调度器按墙钟定期刷新（仿真暂停时也刷新），不再每个页面轮询服务器
+        self.status = ClientStatus(self)
+        self.add_map_change_listener(self.status.reset)
+        self.scheduler.register(
+            "status", lambda world, state: self.status.refresh(), priority=100,
+            interval=STATUS_REFRESH_INTERVAL, wall_clock=True,
+        )
 
     @property
     def is_connected(self) -> bool:
@@ -50,6 +74,7 @@ class CarlaClientManager:
             self.port = port
 
             self._is_connected = True
+            self._notify_map_change()
 
             self.get_status()
 
@@ -58,6 +83,7 @@ class CarlaClientManager:
             self.client = None
             self.world = None
             self._status_message = f"连接失败: {str(e)}"
+            self.status.reset(None)
             raise e
 
     def disconnect(self) -> None:
@@ -66,16 +92,22 @@ class CarlaClientManager:
         self.world = None
         self._is_connected = False
         self._status_message = "已断开连接"
+        self._notify_map_change()
+
+    def add_map_change_listener(self, callback):
+        """注册地图变化（切换地图、重连、断开）回调，用于让地图相关缓存失效"""
+        self._map_change_listeners.append(callback)
+
+    def _notify_map_change(self):
+        for callback in self._map_change_listeners:
+            try:
+                callback(self.world)
+            except Exception as e:
+                print(f"地图变化回调执行失败: {e}")
 
     def get_status(self) -> str:
-        if self._is_connected:
-            self.mode_info = (
-                "同步模式" if self.world.get_settings().synchronous_mode else "异步模式"
-            )
-            self.current_map_name = self.world.get_map().name.split("/")[-1]
-            spectator_info = self.get_spectator_info()
-            self._status_message = f"成功连接到 CARLA ({self.ip}:{self.port})\nServer Version: {self.client.get_server_version()}\n{self.mode_info}\n当前地图: {self.current_map_name}\nSpectator Info: {spectator_info}"
-        return self._status_message
+        """返回共享的状态文本；服务器版本、地图名等只在连接或切换地图后查询一次"""
+        return self.status.refresh()
 
     def get_spectator_info(self):
         if self.world:
@@ -107,8 +139,11 @@ class CarlaClientManager:
         """切换到指定地图"""
         if self.client and self._is_connected:
             try:
-                self.client.load_world(map_name)
+                # load_world 之后旧的 World 对象会失效，需要替换为新世界
+                self.world = self.client.load_world(map_name)
+                self.ego_vehicle = None
                 self._status_message = f"已切换到地图: {map_name}"
+                self._notify_map_change()
             except Exception as e:
                 self._status_message = f"切换地图失败: {str(e)}"
                 raise e
@@ -151,15 +186,22 @@ class CarlaClientManager:
             self._status_message = f"设置天气失败: {str(e)}"
             raise e
 
+    def new_batch(self) -> CommandBatch:
+        """创建批量命令，apply 时一次 apply_batch_sync 往返发送"""
+        return CommandBatch(self.client)
+
     def delete_all_vehicles(self) -> None:
         """删除所有车辆"""
         if self.world:
-            count = 0
-            for actor in self.world.get_actors():
-                if actor.type_id.find("vehicle.") != -1:
-                    actor.destroy()
-                    count += 1
-            self._status_message = f"已删除所有车辆, 共{count}个"
+            self.world_state.get(self.world)
+            batch = self.new_batch()
+            for actor_id in self.world_state.metadata.ids_of_class(ACTOR_CLASS_VEHICLE):
+                batch.destroy(actor_id)
+            result = batch.apply()
+            result.report("删除车辆")
+            if self.ego_vehicle is not None and self.ego_vehicle.id in result.actor_ids:
+                self.ego_vehicle = None
+            self._status_message = f"已删除所有车辆, 共{result.succeeded}个"
 
     def get_auto_vehicle_spawnpoint(self):
         """获取自动生成车辆的出生点"""
@@ -170,23 +212,23 @@ class CarlaClientManager:
             spec_transform = spectator.get_transform()
             spec_location = spec_transform.location
 
-            # 2. 在地图上查找最近的“可驾驶”路点 (Waypoint)
-            carla_map = self.world.get_map()
-            waypoint = carla_map.get_waypoint(
-                spec_location, 
-                project_to_road=True, # 强制投射到最近的道路中心线上
-                lane_type=carla.LaneType.Driving # 仅限机动车道（排除人行道等）
-            )
+            # 2. 在本地路点索引中查找最近的“可驾驶”路点，不再每次下载地图并调用 get_waypoint
+            from waypoint_index import get_waypoint_index
 
-            if waypoint:
+            waypoint_index = get_waypoint_index(self.world)
+            indices, _ = waypoint_index.query_nearest(
+                [(spec_location.x, spec_location.y, spec_location.z)]
+            )
+            target_transform = None
+            if indices[0] >= 0:
                 # 3. 如果找到了路点，将生成点设置为该路点的位姿
-                target_transform = waypoint.transform
-                target_transform.location.z += 0.3 # 稍微抬高一点，防止车辆轮胎陷入地下
+                # 稍微抬高一点，防止车辆轮胎陷入地下
+                target_transform = waypoint_index.transform(indices[0], z_offset=0.3)
                 print(
                     f"✅ 已自动吸附到最近道路: (X:{target_transform.location.x:.1f}, Y:{target_transform.location.y:.1f})"
                 )
             else:
-                # 4. 如果附近没有路（例如在荒野），则无法吸附
+                # 4. 如果地图上没有可行驶道路，则无法吸附
                 print("⚠️ 当前位置附近未检测到可行驶道路。")
             return target_transform
         return None
@@ -206,6 +248,8 @@ class CarlaClientManager:
         try:
             if transform:
                 vehicle = self.world.spawn_actor(car_bp, transform)
+                # 立即登记到元数据索引，按 role_name 查找时不必等下一帧快照
+                self.world_state.metadata.register(vehicle)
                 print(f"✅ 成功生成车辆: {vehicle.attributes.get('role_name', '')}")
                 return vehicle
             else:
@@ -216,12 +260,8 @@ class CarlaClientManager:
 
     def set_vehicle_pose(self, transform,rolename='hero'):
         """设置车辆位置"""
-        hero_vehicles = [actor for actor in self.world.get_actors()
-                            if 'vehicle' in actor.type_id and actor.attributes['role_name'] == rolename]
-        self.ego_vehicle = None
-        print(f"发现{len(hero_vehicles)}辆车辆")
-        if len(hero_vehicles) > 0:
-            self.ego_vehicle = hero_vehicles[-1]
+        self.get_ego_vehicle(rolename)
+        if self.ego_vehicle is not None:
             if transform:
                 self.ego_vehicle.set_transform(transform)
                 print(f"✅ 已设置车辆 {self.ego_vehicle.attributes.get('role_name', '')} 位置")
@@ -233,141 +273,113 @@ class CarlaClientManager:
         if not self.world:
             return
 
-        hero_vehicles = [actor for actor in self.world.get_actors()
-                            if 'vehicle' in actor.type_id and actor.attributes['role_name'] == rolename]
-        self.ego_vehicle = None
-        print(f"发现{len(hero_vehicles)}辆车辆")
-        for vehicle in hero_vehicles:
-            vehicle.set_autopilot(enabled)
+        hero_ids = self.find_vehicle_ids(rolename)
+        print(f"发现{len(hero_ids)}辆车辆")
+        batch = self.new_batch()
+        for actor_id in hero_ids:
+            batch.set_autopilot(actor_id, enabled, self.tm_port)
+        batch.apply().report("启用自动驾驶" if enabled else "禁用自动驾驶")
         # if len(hero_vehicles) > 0:
         #     self.ego_vehicle = random.choice(hero_vehicles)
         #     self.ego_vehicle.set_autopilot(enabled)
         #     print(f"✅ 已{'启用' if enabled else '禁用'}自动驾驶")
     
+    def find_vehicle_ids(self, rolename="hero"):
+        """按 role_name 查找车辆 id（按出现顺序），由元数据索引直接给出，不再遍历所有 actor"""
+        if not self.world:
+            return []
+        # 确保索引已按最新一帧快照更新
+        self.world_state.get(self.world)
+        return self.world_state.metadata.ids_with_role(rolename)
+
+    def get_actor(self, actor_id):
+        """按 id 获取 actor，当前主车直接复用已有的句柄"""
+        if self.ego_vehicle is not None and self.ego_vehicle.id == actor_id:
+            return self.ego_vehicle
+        return self.world.get_actor(actor_id)
+
     def get_ego_vehicle(self,rolename="hero"):
         """获取当前自动驾驶车辆"""
-        hero_vehicles = [actor for actor in self.world.get_actors()
-                            if 'vehicle' in actor.type_id and actor.attributes['role_name'] == rolename]
-        self.ego_vehicle = None
-        print(f"发现{len(hero_vehicles)}辆车辆")
-        if len(hero_vehicles) > 0:
-            self.ego_vehicle = hero_vehicles[-1]
+        hero_ids = self.find_vehicle_ids(rolename)
+        self.ego_vehicle = self.get_actor(hero_ids[-1]) if hero_ids else None
         return self.ego_vehicle
 
     def get_vehicles(self):
         """获取所有车辆"""
-        hero_vehicles = self.world.get_actors().filter("vehicle.*")
-        print(f"发现{len(hero_vehicles)}辆车辆")
-        return hero_vehicles
+        return self.world.get_actors().filter("vehicle.*")
 
     def get_available_vehicle_blueprints(self):
         """获取所有可用的车辆蓝图"""
         vehicle_blueprints = self.world.get_blueprint_library().filter('vehicle')
         return vehicle_blueprints
 
-    def run_display_info(self):
+    def draw_display_info(self, world, state):
         """
-        统一的车辆信息显示线程。
-        只要 _show_speed 或 _show_pose 为 True，就持续更新车辆信息显示。
+        车辆信息显示任务，由 tick 调度器每个 tick 调用一次。
+        速度和位姿都取自当前 tick 的共享状态；只绘制观察者附近的车辆，并按车限频
         """
-        self._display_info_thread_running = True
-        while self._show_speed or self._show_pose:
-            try:
-                vehicle_list = self.world.get_actors().filter('vehicle.*')
-
-                if not vehicle_list:
-                    self.world.wait_for_tick()
-                    continue
-
-                for vehicle in vehicle_list:
-                    if not vehicle.is_alive:
-                        continue
-
-                    lines = []
-                    
-                    # 收集速度信息
-                    if self._show_speed:
-                        velocity = vehicle.get_velocity()
-                        speed_kmh = 3.6 * math.sqrt(velocity.x ** 2 + velocity.y ** 2 + velocity.z ** 2)
-                        lines.append((f"{speed_kmh:.1f} km/h", carla.Color(r=255, g=0, b=0)))
-
-                    # 收集坐标信息
-                    if self._show_pose:
-                        transform = vehicle.get_transform()
-                        loc = transform.location
-                        rot = transform.rotation
-                        lines.append((f"X:{loc.x:.1f} Y:{loc.y:.1f} Yaw:{rot.yaw:.1f}", carla.Color(r=0, g=255, b=0)))
-
-                    # 统一显示
-                    if lines:
-                        base_location = vehicle.get_location()
-                        # 基础高度，从车辆上方开始
-                        current_z = 2.5
-                        
-                        for text, color in lines:
-                            text_location = base_location + carla.Location(y=1.0, z=current_z)
-                            self.world.debug.draw_string(
-                                location=text_location,
-                                text=text,
-                                draw_shadow=True,
-                                color=color,
-                                persistent_lines=True
-                            )
-                            # 每行增加高度偏移，避免重叠
-                            current_z += 1.2
-
-                self.world.wait_for_tick()
-
-            except RuntimeError as e:
-                print(f"线程运行时发生错误 (可能CARLA已关闭): {e}")
-                break
-            except Exception as e:
-                print(f"多车信息显示线程发生未知异常: {e}")
-                break
-        
-        self._display_info_thread_running = False
-        print("多车信息显示线程已退出。")
+        self.label_overlay.draw(world, state, self._show_speed, self._show_pose)
+
+    def set_display_radius(self, radius: float) -> None:
+        """设置车辆信息的显示半径（米），只为观察者附近的车辆绘制"""
+        self.label_overlay.radius = max(float(radius), 0.0)
 
-    def _ensure_display_thread_running(self):
-        if (self._show_speed or self._show_pose) and not self._display_info_thread_running:
-            thread.start_new_thread(self.run_display_info, ())
+    def _update_display_job(self):
+        """显示车速或坐标任一开启时注册显示任务，都关闭时取消"""
+        if self._show_speed or self._show_pose:
+            if not self.scheduler.is_registered("display_info"):
+                self.scheduler.register("display_info", self.draw_display_info, priority=50)
+        elif self.scheduler.cancel("display_info"):
+            print("多车信息显示已停止。")
 
     def set_display_speed(self, enabled: bool) -> None:
         """设置是否显示车速"""
         if not self.world:
             return
         self._show_speed = enabled
-        self._ensure_display_thread_running()
+        self._update_display_job()
 
     def set_display_pose(self, enabled: bool) -> None:
         """设置是否显示车坐标"""
         if not self.world:
             return
         self._show_pose = enabled
-        self._ensure_display_thread_running()
+        self._update_display_job()
 
     def set_spectator_pose(self, transform):
         """设置 spectator 位置"""
         if not self.world:
             return False
-        spectator = self.world.get_spectator()
-        spectator.set_transform(transform)
+        self.move_spectator(transform, smooth=False)
+
+    def move_spectator(self, transform, smooth=True):
+        """
+        通过 SpectatorController 移动相机；smooth 为 False 时立即跳到目标。
+        所有 spectator 位姿设置都经过这里，保证本地记录的相机位姿与服务器一致
+        """
+        state = self.world_state.get(self.world)
+        return self.spectator_controller.move_to(
+            self.world, transform, sim_time=state.timestamp, snap=not smooth
+        )
+
+    def get_actor_transform(self, actor):
+        """优先从共享的世界状态读取 actor 位姿，状态中没有时才远程调用 get_transform"""
+        state = self.world_state.get(self.world)
+        index = state.index_of(actor.id)
+        if index is None:
+            return actor.get_transform()
+        return state.transform(index)
 
     def set_spectator_to_vehicle(self, rolename="hero") -> bool:
         if not self.world:
             return False
-        hero_vehicles = [
-            actor
-            for actor in self.world.get_actors()
-            if "vehicle" in actor.type_id and actor.attributes.get("role_name") == rolename
-        ]
-        self.ego_vehicle = None
-        print(f"发现{len(hero_vehicles)}辆车辆")
-        if not hero_vehicles:
+        hero_ids = self.find_vehicle_ids(rolename)
+        print(f"发现{len(hero_ids)}辆车辆")
+        if not hero_ids:
+            self.ego_vehicle = None
             return False
-        self.ego_vehicle = random.choice(hero_vehicles)
-        spectator = self.world.get_spectator()
-        transform = self.ego_vehicle.get_transform()
+        self.ego_vehicle = self.get_actor(random.choice(hero_ids))
+        transform = self.get_actor_transform(self.ego_vehicle)
         location = transform.location
         rotation = transform.rotation
         spectator_location = location + carla.Location(
@@ -377,16 +389,18 @@ class CarlaClientManager:
         )
         spectator_rotation = carla.Rotation(pitch=-15, yaw=rotation.yaw, roll=0)
         spectator_transform = carla.Transform(spectator_location, spectator_rotation)
-        spectator.set_transform(spectator_transform)
+        self.move_spectator(spectator_transform, smooth=False)
         print("已将 spectator 位置设置到当前车辆")
         return True
 
-    def set_spectator_to_vehicle_shoudler_view(self,  x_offset=-20, z_offset=15, look_at_offset=5,rolename="hero") -> bool:
+    def set_spectator_to_vehicle_shoudler_view(self,  x_offset=-20, z_offset=15, look_at_offset=5,rolename="hero", smooth=False) -> bool:
         if not self.world:
             return False
 
         if self.ego_vehicle is None:
             self.ego_vehicle = self.get_ego_vehicle(rolename)
+        if self.ego_vehicle is None:
+            return False
         # hero_vehicles = [
         #     actor
         #     for actor in self.world.get_actors()
@@ -397,11 +411,10 @@ class CarlaClientManager:
         # if not hero_vehicles:
         #     return False
         # self.ego_vehicle = random.choice(hero_vehicles)
-        spectator = self.world.get_spectator()
 
-        # 1. 获取车辆当前的位姿信息
-        vehicle_transform = self.ego_vehicle.get_transform()
-        vehicle_location = self.ego_vehicle.get_transform().location
+        # 1. 获取车辆当前的位姿信息（取自共享的世界状态，不发起 RPC）
+        vehicle_transform = self.get_actor_transform(self.ego_vehicle)
+        vehicle_location = vehicle_transform.location
         vehicle_forward_vector = vehicle_transform.get_forward_vector() # 获取车辆正前方方向向量
 
         # 2. 计算摄像机（Spectator）的放置位置：
@@ -432,41 +445,35 @@ class CarlaClientManager:
 
         # 6. 应用新的变换：移动摄像机到计算出的位置并旋转朝向
         new_spectator_transform = carla.Transform(spectator_location, spectator_rotation)
-        spectator.set_transform(new_spectator_transform)
-        print("已将 spectator 位置设置到当前车辆")
+        self.move_spectator(new_spectator_transform, smooth)
+        if not smooth:
+            print("已将 spectator 位置设置到当前车辆")
         return True
 
-    def run_spectator_follow_vehicle_shoulder_view(self):
-        while self._is_running_follow_vehicle_shoulder_view:
-            try:
-                self.set_spectator_to_vehicle_shoudler_view()
-            except:
-                pass
-            self.world.wait_for_tick()
-
-
     def set_spectator_follow_vehicle_shoulder_view(self,enabled: bool) -> None:
         if not self.world:
-            ui.notify("请先连接到 CARLA 服务器", type="warning")
+            print("❌ 请先连接到 CARLA")
             return
         if enabled:
-            self._is_running_follow_vehicle_shoulder_view = True
-            thread.start_new_thread(self.run_spectator_follow_vehicle_shoulder_view, ())
+            self.spectator_controller.reset()
+            self.scheduler.register("follow_shoulder_view", lambda world, state: self.set_spectator_to_vehicle_shoudler_view(smooth=True), priority=10)
         else:
-            self._is_running_follow_vehicle_shoulder_view = False
+            self.scheduler.cancel("follow_shoulder_view")
 
-    def set_spectator_to_vehicle_monitor_view(self,  x_offset=110, y_offset=60, z_offset=40, tolerance=2,rolename="hero") -> bool:
+    def set_spectator_to_vehicle_monitor_view(self,  x_offset=110, y_offset=60, z_offset=40, tolerance=2,rolename="hero", smooth=False) -> bool:
         if not self.world:
             return False
         if self.ego_vehicle is None:
             self.ego_vehicle = self.get_ego_vehicle(rolename)
-        spectator = self.world.get_spectator()
+        if self.ego_vehicle is None:
+            return False
 
-        # 1. 获取车辆和摄像机当前位置
-        vehicle_transform = self.ego_vehicle.get_transform()
-        vehicle_location = self.ego_vehicle.get_transform().location
-        spectator_transform = spectator.get_transform()
-        spectator_location = spectator_transform.location
+        # 1. 获取车辆和摄像机当前位置；相机位置优先用本地记录的位姿，不再向服务器查询
+        vehicle_transform = self.get_actor_transform(self.ego_vehicle)
+        vehicle_location = vehicle_transform.location
+        spectator_location = self.spectator_controller.location
+        if spectator_location is None:
+            spectator_location = self.get_actor_transform(self.world.get_spectator()).location
 
         # 2. 定义距离约束区间
         # min_distance: 最小距离限制（防止相机穿模进入车内或离得太近）
@@ -483,8 +490,8 @@ class CarlaClientManager:
             # Case A: 距离超出范围（太远或太近）
             # 强制重置相机位置到理想的跟随位置 (get_spectator_transform 会计算最佳位置)
             # 这种“瞬移”机制保证了车辆永远不会跑出视野
-            new_transform = self.get_spectator_transform(self.ego_vehicle,x_offset,y_offset,z_offset)
-            spectator.set_transform(new_transform)
+            new_transform = self.get_spectator_transform(vehicle_transform,x_offset,y_offset,z_offset)
+            self.move_spectator(new_transform, smooth=False)
         else:
             # Case B: 距离在合理范围内
             # 此时保持相机位置不变，只旋转镜头跟踪车辆
@@ -492,19 +499,22 @@ class CarlaClientManager:
             # 允许车辆在画面中自由移动一段距离，增加临场感
             new_rotation = self.get_rotation_towards(vehicle_transform, spectator_location)
             new_transform = carla.Transform(spectator_location, new_rotation)
-            spectator.set_transform(new_transform)
+            self.move_spectator(new_transform, smooth)
 
         return True
 
-    def get_spectator_transform(self,vehicle,x_offset,y_offset,z_offset):
-        transform = vehicle.get_transform()
+    def get_spectator_transform(self,transform,x_offset,y_offset,z_offset):
         location = transform.location
         forward = transform.get_forward_vector()
         right = transform.get_right_vector()
 
         # 1. 获取车辆角速度，判断转向趋势
-        angular_velocity = vehicle.get_angular_velocity()
-        yaw_rate = angular_velocity.z # z轴角速度代表车辆的转向快慢（Yaw Rate）
+        state = self.world_state.get(self.world)
+        index = state.index_of(self.ego_vehicle.id)
+        if index is not None:
+            yaw_rate = float(state.angular_velocity[index, 2])
+        else:
+            yaw_rate = self.ego_vehicle.get_angular_velocity().z # z轴角速度代表车辆的转向快慢（Yaw Rate）
         threshold = 0.05 
 
         # 2. 动态决定相机侧向偏移方向
@@ -550,31 +560,26 @@ class CarlaClientManager:
         return carla.Rotation(pitch=pitch, yaw=yaw, roll=0)
 
 
-    def run_spectator_follow_vehicle_monitor_view(self):
-        while self._is_running_follow_vehicle_monitor_view:
-            self.set_spectator_to_vehicle_monitor_view()
-            self.world.wait_for_tick()
-
-
     def set_spectator_follow_vehicle_monitor_view(self,enabled: bool) -> None:
         if not self.world:
-            ui.notify("请先连接到 CARLA 服务器", type="warning")
+            print("❌ 请先连接到 CARLA")
             return
         if enabled:
-            self._is_running_follow_vehicle_monitor_view = True
-            thread.start_new_thread(self.run_spectator_follow_vehicle_monitor_view, ())
+            self.spectator_controller.reset()
+            self.scheduler.register("follow_monitor_view", lambda world, state: self.set_spectator_to_vehicle_monitor_view(smooth=True), priority=10)
         else:
-            self._is_running_follow_vehicle_monitor_view = False
+            self.scheduler.cancel("follow_monitor_view")
 
-    def set_spectator_to_vehicle_bev_view(self, z_offset=50, rolename="hero") -> bool:
+    def set_spectator_to_vehicle_bev_view(self, z_offset=50, rolename="hero", smooth=False) -> bool:
         if not self.world:
             return False
         if self.ego_vehicle is None:
             self.ego_vehicle = self.get_ego_vehicle(rolename)
-        spectator = self.world.get_spectator()
+        if self.ego_vehicle is None:
+            return False
         # 车辆位置
-        vehicle_transform = self.ego_vehicle.get_transform()
-        vehicle_location = self.ego_vehicle.get_transform().location
+        vehicle_transform = self.get_actor_transform(self.ego_vehicle)
+        vehicle_location = vehicle_transform.location
          # 计算旁观者的新位置
         spectator_location = carla.Location(
             x=vehicle_location.x,
@@ -585,22 +590,17 @@ class CarlaClientManager:
         spectator_rotation = carla.Rotation(pitch=-92, yaw=0, roll=0)
         # 更新旁观者的变换
         new_spectator_transform = carla.Transform(spectator_location, spectator_rotation)
-        spectator.set_transform(new_spectator_transform)
-        print("已将 spectator 位置设置到当前BEV")
+        self.move_spectator(new_spectator_transform, smooth)
+        if not smooth:
+            print("已将 spectator 位置设置到当前BEV")
         return True
 
-    def run_spectator_follow_vehicle_bev_view(self):
-        while self._is_running_follow_vehicle_bev_view:
-            self.set_spectator_to_vehicle_bev_view()
-            self.world.wait_for_tick()
-
-
     def set_spectator_follow_vehicle_bev_view(self,enabled: bool) -> None:
         if not self.world:
-            ui.notify("请先连接到 CARLA 服务器", type="warning")
+            print("❌ 请先连接到 CARLA")
             return
         if enabled:
-            self._is_running_follow_vehicle_bev_view = True
-            thread.start_new_thread(self.run_spectator_follow_vehicle_bev_view, ())
+            self.spectator_controller.reset()
+            self.scheduler.register("follow_bev_view", lambda world, state: self.set_spectator_to_vehicle_bev_view(smooth=True), priority=10)
         else:
-            self._is_running_follow_vehicle_bev_view = False
+            self.scheduler.cancel("follow_bev_view")
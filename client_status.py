@@ -0,0 +1,92 @@
+"""
+连接状态文本
+
+之前每个页面每 3 秒调用一次 get_status()，每次都要 get_settings、get_map（会在客户端
+下载并解析 OpenDRIVE）、get_server_version 和读取 spectator 位姿。ClientStatus 把状态分为三类:
+- 不变的信息（服务器版本、地图名、spectator id）：连接或切换地图后只查询一次
+- 运行模式（同步 / 异步）：世界设置很少变化，最多每 SETTINGS_TTL 秒查询一次
+- 帧号、仿真时间、actor 数量和 spectator 位姿：直接取自按 tick 共享的 WorldState
+
+状态在进程内只有一份，所有浏览器会话绑定到同一个 text 属性，不再各自轮询服务器。
+"""
+
+import threading
+import time
+
+from map_identity import get_current_map
+from world_state import ACTOR_CLASS_VEHICLE, ACTOR_CLASS_WALKER
+
+
+# 世界设置的缓存时间（秒）
+SETTINGS_TTL = 10.0
+# text 的最短刷新间隔（秒），多个会话同时读取时共享同一次刷新
+REFRESH_INTERVAL = 1.0
+
+
+class ClientStatus:
+    def __init__(self, client_manager):
+        self.client_manager = client_manager
+        self._lock = threading.Lock()
+        self.text = client_manager.status_message
+        self._refreshed_at = 0.0
+        self.reset(None)
+
+    def reset(self, world):
+        """连接、断开或切换地图后清空缓存的信息；可作为地图变化监听器"""
+        with self._lock:
+            self._world_id = None if world is None else world.id
+            self.server_version = None
+            self.map_name = None
+            self._spectator_id = None
+            self.synchronous_mode = None
+            self._settings_at = 0.0
+            self._refreshed_at = 0.0
+            self.text = self.client_manager.status_message
+
+    def _load_facts(self, client, world):
+        self.server_version = client.get_server_version()
+        # 与路径规划等共用同一个 carla.Map，不再为地图名单独下载 OpenDRIVE
+        self.map_name = get_current_map(world)[0].name.split("/")[-1]
+        self._spectator_id = world.get_spectator().id
+        self._world_id = world.id
+
+    def refresh(self, force=False):
+        """按需刷新 text 并返回；REFRESH_INTERVAL 内的重复调用直接返回缓存"""
+        client_manager = self.client_manager
+        now = time.monotonic()
+        if not force and now - self._refreshed_at < REFRESH_INTERVAL:
+            return self.text
+        with self._lock:
+            if not force and now - self._refreshed_at < REFRESH_INTERVAL:
+                return self.text
+            world, client = client_manager.world, client_manager.client
+            if not client_manager.is_connected or world is None or client is None:
+                self.text = client_manager.status_message
+            else:
+                if self._world_id != world.id or self.server_version is None:
+                    self._load_facts(client, world)
+                if self.synchronous_mode is None or now - self._settings_at >= SETTINGS_TTL:
+                    self.synchronous_mode = world.get_settings().synchronous_mode
+                    self._settings_at = now
+                self.text = self._compose(world)
+            self._refreshed_at = now
+            return self.text
+
+    def _compose(self, world):
+        client_manager = self.client_manager
+        state = client_manager.world_state.get(world)
+        mode_info = "同步模式" if self.synchronous_mode else "异步模式"
+        vehicles = int((state.cls == ACTOR_CLASS_VEHICLE).sum())
+        walkers = int((state.cls == ACTOR_CLASS_WALKER).sum())
+        spectator_info = None
+        index = state.index_of(self._spectator_id)
+        if index is not None:
+            x, y, z = state.location[index].tolist()
+            spectator_info = f"{x:.2f}, {y:.2f}, {z:.2f}\nYaw: {state.rotation[index, 1]:.2f}"
+        return (
+            f"成功连接到 CARLA ({client_manager.ip}:{client_manager.port})\n"
+            f"Server Version: {self.server_version}\n"
+            f"{mode_info}  帧: {state.frame}  仿真时间: {state.timestamp:.1f}s\n"
+            f"当前地图: {self.map_name}  车辆: {vehicles}  行人: {walkers}\n"
+            f"Spectator Info: {spectator_info}"
+        )
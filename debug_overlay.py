@@ -0,0 +1,108 @@
+"""
+车辆信息调试文字（车速 / 坐标）
+
+每个 tick 只读取一次共享的 WorldState，在本地完成筛选:
+- 只为观察者附近 radius 米内的车辆绘制，最多 max_labels 个（由近到远）
+- 每辆车至少间隔 interval 秒（仿真时间）才重绘一次
+- 文字以有限的 life_time 绘制，到期由服务器自动清除，不再使用 persistent_lines 持续堆积
+"""
+
+import carla
+import numpy as np
+
+from world_state import ACTOR_CLASS_VEHICLE
+
+
+DEFAULT_LABEL_RADIUS = 80.0
+DEFAULT_LABEL_INTERVAL = 0.2
+DEFAULT_MAX_LABELS = 50
+# life_time 略长于重绘间隔，避免两次绘制之间出现闪烁
+LIFE_TIME_MARGIN = 1.1
+
+SPEED_COLOR = carla.Color(r=255, g=0, b=0)
+POSE_COLOR = carla.Color(r=0, g=255, b=0)
+
+
+class VehicleLabelOverlay:
+    def __init__(self, radius=DEFAULT_LABEL_RADIUS, interval=DEFAULT_LABEL_INTERVAL,
+                 max_labels=DEFAULT_MAX_LABELS):
+        self.radius = radius
+        self.interval = interval
+        self.max_labels = max_labels
+        self._world_id = None
+        self._spectator_id = None
+        # actor id -> 上次绘制时的仿真时间
+        self._last_drawn = {}
+
+    def reset(self):
+        self._world_id = None
+        self._spectator_id = None
+        self._last_drawn = {}
+
+    def _center(self, world, state):
+        """观察者在本帧快照中的位置；快照里没有时返回 None（不做距离剔除）"""
+        if self._world_id != world.id:
+            self.reset()
+            self._spectator_id = world.get_spectator().id
+            self._world_id = world.id
+        index = state.index_of(self._spectator_id)
+        if index is None:
+            return None
+        return state.location[index, :2]
+
+    def select(self, world, state):
+        """返回本 tick 需要重绘的车辆下标（按距离由近到远）"""
+        indices = state.indices_of_class(ACTOR_CLASS_VEHICLE)
+        if not len(indices):
+            return indices
+        center = self._center(world, state)
+        if center is not None:
+            distance = np.linalg.norm(state.location[indices, :2] - center, axis=1)
+            near = distance <= self.radius
+            indices, distance = indices[near], distance[near]
+            indices = indices[np.argsort(distance, kind="stable")]
+        indices = indices[: self.max_labels]
+
+        now = state.timestamp
+        last_drawn = self._last_drawn
+        due = []
+        for i, actor_id in zip(indices.tolist(), state.ids[indices].tolist()):
+            last = last_drawn.get(actor_id)
+            # 留一点浮点余量，固定步长下恰好间隔 interval 的帧也算到期
+            if last is None or now - last >= self.interval - 1e-6 or now < last:
+                due.append(i)
+        return np.array(due, dtype=np.int64)
+
+    def draw(self, world, state, show_speed, show_pose):
+        """绘制到期的标签，返回本次绘制的车辆数"""
+        if not (show_speed or show_pose):
+            return 0
+        due = self.select(world, state)
+        life_time = self.interval * LIFE_TIME_MARGIN
+        now = state.timestamp
+        for i in due.tolist():
+            x, y, z = state.location[i].tolist()
+            lines = []
+            if show_speed:
+                lines.append((f"{3.6 * state.speed(i):.1f} km/h", SPEED_COLOR))
+            if show_pose:
+                lines.append((f"X:{x:.1f} Y:{y:.1f} Yaw:{state.rotation[i, 1]:.1f}", POSE_COLOR))
+
+            # 从车辆上方开始，每行增加高度偏移，避免重叠
+            current_z = 2.5
+            for text, color in lines:
+                world.debug.draw_string(
+                    carla.Location(x=x, y=y + 1.0, z=z + current_z),
+                    text,
+                    draw_shadow=True,
+                    color=color,
+                    life_time=life_time,
+                )
+                current_z += 1.2
+            self._last_drawn[int(state.ids[i])] = now
+
+        # 已消失的车辆不再保留记录
+        if len(self._last_drawn) > 2 * max(len(state), 1):
+            alive = set(state.ids.tolist())
+            self._last_drawn = {k: v for k, v in self._last_drawn.items() if k in alive}
+        return len(due)
@@ -3,6 +3,7 @@ from nicegui import ui
 from tkinter import Tk, filedialog
 from carla_manager import CarlaSimulatorManager
 from carla_client import CarlaClientManager
+from carla_async import AsyncCarlaClient
 from i18n import t, add_language_listener
 import os
 import subprocess
@@ -12,6 +13,7 @@ import sys
 def build_home_tab():
     manager = CarlaSimulatorManager()
     client_manager = CarlaClientManager()
+    carla_async = AsyncCarlaClient()
     map_select = None
 
     def run_script():
@@ -62,15 +64,15 @@ def build_home_tab():
         dialog.open()
 
 
-    def on_connection_toggle(e):
+    async def on_connection_toggle(e):
         nonlocal map_select
         if e.value:
             try:
                 status_text.value = f"正在连接到 {ip_input.value}:{int(port_input.value)}..."
-                client_manager.connect(ip_input.value, int(port_input.value))
+                await carla_async.connect(ip_input.value, int(port_input.value))
                 status_text.value = client_manager.status_message
                 if map_select is not None:
-                    map_select.options = client_manager.get_maps()
+                    map_select.options = await carla_async.get_maps()
                     if map_select.options:
                         map_select.value = map_select.options[0]
                 ui.notify("已连接到 CARLA", type="positive")
@@ -80,11 +82,11 @@ def build_home_tab():
                 ui.notify("连接失败", type="negative")
         else:
             if client_manager.is_connected:
-                client_manager.disconnect()
+                await carla_async.disconnect()
                 status_text.value = client_manager.status_message
                 ui.notify("已断开连接", type="info")
 
-    def on_change_map():
+    async def on_change_map():
         if not client_manager.is_connected:
             ui.notify("请先连接到 CARLA 服务器", type="warning")
             return
@@ -92,8 +94,8 @@ def build_home_tab():
             ui.notify("请选择要切换的地图", type="warning")
             return
         try:
-            client_manager.change_map(map_select.value)
-            status_text.value = client_manager.get_status()
+            await carla_async.change_map(map_select.value)
+            status_text.value = await carla_async.get_status()
             ui.notify(f"已切换到地图: {map_select.value}", type="positive")
         except Exception as e:
             ui.notify(f"切换地图失败: {e}", type="negative")
@@ -165,12 +167,9 @@ def build_home_tab():
                     ip_input = ui.input(t("home.ip_label"), value="127.0.0.1").classes("w-1/5")
                     port_input = ui.number(t("home.port_label"), value=2000, format="%.0f").classes("w-1/5")
                     conn_switch = ui.switch(t("home.conn_switch"), on_change=on_connection_toggle)
-                status_text = ui.textarea(value="状态: 未连接").props("readonly rows=3").classes("w-full")
-
-                def refresh_client_status():
-                    status_text.value = client_manager.get_status()
-
-                ui.timer(3.0, refresh_client_status)
+                status_text = ui.textarea(value="状态: 未连接").props("readonly rows=6").classes("w-full")
+                # 绑定到进程内共享的状态，所有会话看到同一份，不再各自定时查询服务器
+                status_text.bind_value_from(client_manager.status, "text")
 
         with ui.column():
             with ui.card():
@@ -188,7 +187,7 @@ def build_home_tab():
                         label=t("home.weather_label"),
                     ).classes("w-full")
 
-                    def on_change_weather():
+                    async def on_change_weather():
                         if not client_manager.is_connected:
                             ui.notify("请先连接到 CARLA 服务器", type="warning")
                             return
@@ -196,8 +195,8 @@ def build_home_tab():
                             ui.notify("请选择要切换的天气", type="warning")
                             return
                         try:
-                            client_manager.set_weather(weather_select.value)
-                            status_text.value = client_manager.get_status()
+                            await carla_async.set_weather(weather_select.value)
+                            status_text.value = await carla_async.get_status()
                             ui.notify(f"已设置天气: {weather_select.value}", type="positive")
                         except Exception as e:
                             ui.notify(f"设置天气失败: {e}", type="negative")
@@ -1,16 +1,23 @@
-from nicegui import ui, app
 import time
 import atexit
-from home_view import build_home_tab
-from vehicle_settings_view import build_vehicle_settings_tab
-from navigation_view import build_navigation_tab
-from sensors_settings_view import build_sensors_settings_tab
-from about_view import build_about_tab
-from i18n import t, set_language, get_language
-from carla_manager import CarlaSimulatorManager
+from map_geometry import is_map_worker
 
 
 def run():
+    # 界面相关的模块在这里导入：地图构建子进程（spawn）会以 __mp_main__ 导入本文件，
+    # 不应为此加载 NiceGUI、pygame 等
+    from nicegui import ui, app
+    from home_view import build_home_tab
+    from vehicle_settings_view import build_vehicle_settings_tab
+    from navigation_view import build_navigation_tab
+    from sensors_settings_view import build_sensors_settings_tab
+    from about_view import build_about_tab
+    from i18n import t, set_language, get_language
+    from carla_manager import CarlaSimulatorManager
+    from map_tiles import register_tile_routes
+    from map_vector_stream import register_vector_routes
+    from msf_stream import register_msf_stream_routes
+
     manager = CarlaSimulatorManager()
     set_language(manager.language)
     current_language = get_language()
@@ -43,6 +50,9 @@ def run():
         print("Python process exiting (atexit hook)...")
 
     app.on_shutdown(on_shutdown)
+    register_tile_routes(app)
+    register_vector_routes(app)
+    register_msf_stream_routes(app)
     atexit.register(on_cleanup)
 
     with ui.row().classes("items-stretch justify-between"):
@@ -97,5 +107,6 @@ def run():
     )
 
 
-if __name__ in {"__main__", "__mp_main__"}:
+# __mp_main__ 是 NiceGUI 自动重载时的服务器子进程，需要构建界面；地图构建子进程除外
+if __name__ == "__main__" or (__name__ == "__mp_main__" and not is_map_worker()):
     run()
@@ -3,9 +3,15 @@ import carla
 import os
 import pygame
 import math
+import threading
+import numpy as np
 from io import BytesIO
 import base64
 from PIL import Image, ImageDraw
+from map_disk_cache import MapRasterCache
+from map_identity import get_current_map
+from map_geometry import extract_road_geometry, ParallelRoadGeometry, SegmentGridIndex, LINE_COLOR_YELLOW
+from world_state import ACTOR_CLASS_WALKER
 # 颜色定义
 COLOR_LIGHT_GRAY = pygame.Color(84, 84, 84)
 COLOR_DARK_GRAY = pygame.Color(50, 50, 50)
@@ -13,13 +19,32 @@ COLOR_WHITE = pygame.Color(255, 255, 255)
 COLOR_YELLOW = pygame.Color(255, 255, 0)
 
 PIXELS_PER_METER = 5 
+# 地图边界外预留的边距（米）
+MAP_MARGIN = 5
+# 构建地图时用于提取道路几何的进程数，1 表示在当前进程串行处理；
+# 再多的进程收益有限，反而成倍增加启动开销和内存
+MAP_BUILD_WORKERS = min(os.cpu_count() or 1, 8)
+# 超过该像素数（约 120MB RGB）的地图不再分配整张画布，改为按瓦片懒渲染（如 Town12/Town13）
+MAX_FULL_RASTER_PIXELS = 40_000_000
+# 车道多边形描边宽度与车道线宽度（原始比例下的像素）
+ROAD_OUTLINE_WIDTH = 5
+LANE_LINE_WIDTH = 2
 
 class MapGenerator(object):
-    def __init__(self, carla_world, pixels_per_meter=PIXELS_PER_METER):
+    def __init__(self, carla_world, pixels_per_meter=PIXELS_PER_METER, carla_map=None, workers=1, lazy=None):
         self._pixels_per_meter = pixels_per_meter
         self.scale = 1.0
         self.world = carla_world
-        self.map = self.world.get_map()
+        # 允许调用方传入已获取的 carla.Map，避免重复下载解析 OpenDRIVE
+        self.map = carla_map if carla_map is not None else self.world.get_map()
+
+        # 多进程模式下先把道路几何提取任务提交出去，与下面的边界计算并行
+        pending_geometry = None
+        if workers > 1:
+            try:
+                pending_geometry = ParallelRoadGeometry(self.map.name, self.map.to_opendrive(), workers)
+            except Exception as e:
+                print(f"⚠️ 无法启动多进程地图构建，改为串行: {e}")
 
         pygame.init()
         '''
@@ -29,7 +54,7 @@ class MapGenerator(object):
         waypoints = self.map.generate_waypoints(2)
         #遍历所有生成的路点，找出 X 轴和 Y 轴的最大值和最小值。
         #在计算出的边界外额外预留 5 米的边距，防止地图边缘紧贴画布边缘，更加美观。
-        margin = 5
+        margin = MAP_MARGIN
         max_x = max(waypoints, key=lambda x: x.transform.location.x).transform.location.x + margin
         max_y = max(waypoints, key=lambda x: x.transform.location.y).transform.location.y + margin
         min_x = min(waypoints, key=lambda x: x.transform.location.x).transform.location.x - margin
@@ -42,186 +67,298 @@ class MapGenerator(object):
         self.pixel_width = int(self._pixels_per_meter * self.world_width)
         self.pixel_height = int(self._pixels_per_meter * self.world_height)
         
-        self.big_map_surface = pygame.Surface((self.pixel_width, self.pixel_height))
-        
-        self._draw_road()
-
-    def _draw_road(self):
+        self._raster = None
+        self._segment_index = None
+        self._scaled_bases = {}
+        self._scaled_lock = threading.Lock()
+        self._geometry_lock = threading.Lock()
+
+        # lazy=None 时按地图大小自动决定；懒渲染模式只保留道路几何，由 render_region 按需绘制
+        if lazy is None:
+            lazy = self.pixel_width * self.pixel_height > MAX_FULL_RASTER_PIXELS
+        self.lazy = lazy
+        if lazy:
+            self.big_map_surface = None
+            self.geometry = self._extract_geometry(pending_geometry)
+        else:
+            self.big_map_surface = pygame.Surface((self.pixel_width, self.pixel_height))
+            self._draw_road(pending_geometry)
+
+    @classmethod
+    def from_raster(cls, carla_world, carla_map, raster, meta):
+        """由磁盘缓存的底图构建，跳过路点生成与道路绘制"""
+        map_gen = cls.__new__(cls)
+        map_gen._pixels_per_meter = meta["pixels_per_meter"]
+        map_gen.scale = 1.0
+        map_gen.world = carla_world
+        map_gen.map = carla_map
+        map_gen.world_width = meta["world_width"]
+        map_gen.world_height = meta["world_height"]
+        map_gen._world_offset = tuple(meta["world_offset"])
+        map_gen.pixel_width = int(meta["pixel_width"])
+        map_gen.pixel_height = int(meta["pixel_height"])
+        # 直接引用内存映射的数据，不拷贝
+        map_gen.big_map_surface = pygame.image.frombuffer(
+            raster, (map_gen.pixel_width, map_gen.pixel_height), "RGB"
+        )
+        map_gen._raster = raster
+        map_gen.lazy = False
+        map_gen.geometry = None
+        map_gen._segment_index = None
+        map_gen._scaled_bases = {}
+        map_gen._scaled_lock = threading.Lock()
+        map_gen._geometry_lock = threading.Lock()
+        return map_gen
+
+    def get_metadata(self):
+        return {
+            "map_name": self.map.name,
+            "world_offset": list(self._world_offset),
+            "world_width": self.world_width,
+            "world_height": self.world_height,
+            "pixels_per_meter": self._pixels_per_meter,
+            "pixel_width": self.pixel_width,
+            "pixel_height": self.pixel_height,
+        }
+
+    def get_raw_bytes(self):
+        """整张底图的 RGB 字节；懒渲染模式没有整张画布，返回 None"""
+        if self.big_map_surface is None:
+            return None
+        return pygame.image.tostring(self.big_map_surface, "RGB")
+
+    def _draw_road(self, pending_geometry=None):
         self.big_map_surface.fill(COLOR_LIGHT_GRAY)
-        topology = self.map.get_topology()
-        self._draw_topology(topology)
-
-    def _draw_topology(self, carla_topology, index=0):
-        # 1. 提取拓扑中的路点，并按 Z 轴高度排序，确保渲染顺序（处理立交桥遮挡）
-        topology = [x[index] for x in carla_topology]
-        topology = sorted(topology, key=lambda w: w.transform.location.z)
-        
-        for waypoint in topology:
-            # 2. 构建连续车道段：从当前路点向前搜索，直到路段 ID 变化
-            waypoints = [waypoint]
-            nxt = waypoint.next(2.0)
-            if len(nxt) > 0:
-                nxt = nxt[0]
-                while nxt.road_id == waypoint.road_id:
-                    waypoints.append(nxt)
-                    nxt = nxt.next(2.0)
-                    if len(nxt) > 0:
-                        nxt = nxt[0]
-                    else:
-                        break
-
-            # 3. 计算车道多边形边界：分别计算左右两侧的边界点
-            # _lateral_shift 用于根据车道宽度向左/右平移坐标
-            road_left_side = [self._lateral_shift(w.transform, -w.lane_width * 0.5) for w in waypoints]
-            road_right_side = [self._lateral_shift(w.transform, w.lane_width * 0.5) for w in waypoints]
-
-            # 4. 闭合多边形：左侧点序 + 右侧点序（逆序），形成封闭区域
-            polygon = road_left_side + [x for x in reversed(road_right_side)]
-            # 将世界坐标转换为像素坐标
-            polygon = [self.world_to_pixel(x) for x in polygon]
-
-            # 5. 绘制车道表面
+        self.geometry = self._extract_geometry(pending_geometry)
+        self._draw_geometry(self.geometry)
+
+    def _extract_geometry(self, pending_geometry=None):
+        # 批量提取道路几何，并按 Z 轴高度排序，确保渲染顺序（处理立交桥遮挡）
+        geometry = None
+        if pending_geometry is not None:
+            try:
+                geometry = pending_geometry.result()
+            except Exception as e:
+                print(f"⚠️ 多进程提取道路几何失败，改为串行: {e}")
+        if geometry is None:
+            geometry = extract_road_geometry(self.map)
+        return geometry.sorted_by_z()
+
+    def get_geometry(self):
+        """道路几何；由磁盘缓存加载的地图没有几何，第一次调用时才提取"""
+        with self._geometry_lock:
+            if self.geometry is None:
+                self.geometry = self._extract_geometry()
+            return self.geometry
+
+    def get_segment_index(self):
+        with self._geometry_lock:
+            if self._segment_index is None and self.geometry is not None:
+                self._segment_index = SegmentGridIndex(self.geometry)
+            return self._segment_index
+
+    def render_region(self, left, top, width, height, zoom=1.0):
+        """
+        只光栅化一块区域，返回 width x height 的 pygame.Surface。
+        left / top 为 zoom 缩放后的像素坐标，zoom 相对于 pixels_per_meter。
+        通过路段包围盒索引只绘制与该区域相交的路段。
+        """
+        factor = self.scale * self._pixels_per_meter * zoom
+        surface = pygame.Surface((width, height))
+        surface.fill(COLOR_LIGHT_GRAY)
+        if self.geometry is None:
+            return surface
+        origin = np.array(
+            (self._world_offset[0] + left / factor, self._world_offset[1] + top / factor)
+        )
+        outline_width = max(1, round(ROAD_OUTLINE_WIDTH * zoom))
+        line_width = max(1, round(LANE_LINE_WIDTH * zoom))
+        box = (origin[0], origin[1], origin[0] + width / factor, origin[1] + height / factor)
+        indices = self.get_segment_index().query(box, margin=outline_width / factor)
+        for polygon, lines in self.geometry.iter_segments(indices):
+            polygon = np.floor(factor * (polygon - origin)).astype(np.int32).tolist()
+            if len(polygon) > 2:
+                pygame.draw.polygon(surface, COLOR_DARK_GRAY, polygon, outline_width)
+                pygame.draw.polygon(surface, COLOR_DARK_GRAY, polygon)
+            for points, color in lines:
+                line_color = COLOR_YELLOW if color == LINE_COLOR_YELLOW else COLOR_WHITE
+                points = np.floor(factor * (points - origin)).astype(np.int32).tolist()
+                pygame.draw.lines(surface, line_color, False, points, line_width)
+        return surface
+
+    def _draw_geometry(self, geometry):
+        """光栅化 RoadGeometry：每个车道多边形之后紧接着绘制它的车道线"""
+        pixel_geometry = geometry.to_pixels(self._world_offset, self._pixels_per_meter, self.scale)
+        line_width = LANE_LINE_WIDTH
+        for polygon, lines in pixel_geometry.iter_segments():
+            polygon = polygon.tolist()
             if len(polygon) > 2:
                 # 绘制边缘（宽度5），抗锯齿或加粗效果
-                pygame.draw.polygon(self.big_map_surface, COLOR_DARK_GRAY, polygon, 5)
+                pygame.draw.polygon(self.big_map_surface, COLOR_DARK_GRAY, polygon, ROAD_OUTLINE_WIDTH)
                 # 绘制填充（默认宽度0），填充车道颜色
                 pygame.draw.polygon(self.big_map_surface, COLOR_DARK_GRAY, polygon)
-
-            # 6. 绘制车道线（非路口区域）
-            if not waypoint.is_junction:
-                self._draw_lane_marking_single_side(waypoints, -1) #左侧
-                self._draw_lane_marking_single_side(waypoints, 1)  #右侧
-
-    def _draw_lane_marking_single_side(self, waypoints, sign):
-        """ 绘制单侧车道线逻辑 """
-        lane_marking = None
-        previous_marking_type = carla.LaneMarkingType.NONE
-        previous_marking_color = carla.LaneMarkingColor.Other
-        temp_waypoints = []
-        current_lane_marking = carla.LaneMarkingType.NONE
-
-        for sample in waypoints:
-            # 根据 sign (-1 或 1) 获取左侧或右侧的车道线属性
-            lane_marking = sample.left_lane_marking if sign < 0 else sample.right_lane_marking
-            if lane_marking is None: continue
-
-            # 检测车道线类型是否发生变化（例如从实线变为虚线）
-            if current_lane_marking != lane_marking.type:
-                # 如果变化，先绘制之前积攒的那一段同类型车道线
-                self._draw_line_segment(previous_marking_type, previous_marking_color, temp_waypoints, sign)
-                
-                # 更新当前状态为新的车道线类型，并重新开始积攒点
-                current_lane_marking = lane_marking.type
-                temp_waypoints = [sample] # 新段的起点
-                previous_marking_type = lane_marking.type
-                previous_marking_color = lane_marking.color
-            else:
-                # 如果类型没变，继续将当前点加入到当前段中
-                temp_waypoints.append(sample)
-
-        # 循环结束后，绘制最后剩余的一段车道线
-        self._draw_line_segment(previous_marking_type, previous_marking_color, temp_waypoints, sign)
-
-    def _draw_line_segment(self, marking_type, marking_color, waypoints, sign):
-        if len(waypoints) < 2: return
-
-        # 1. 确定车道线颜色
-        color = COLOR_WHITE
-        if marking_color == carla.LaneMarkingColor.Yellow:
-            color = COLOR_YELLOW
-        
-        # 2. 计算绘制点坐标：基于路点位置向左/右平移半个车道宽，并转为像素坐标
-        points = [self.world_to_pixel(self._lateral_shift(w.transform, sign * w.lane_width * 0.5)) for w in waypoints]
-        
-        line_width = 2
-
-        # 3. 绘制实线 (Solid)
-        if marking_type == carla.LaneMarkingType.Solid or marking_type == carla.LaneMarkingType.SolidSolid:
-            pygame.draw.lines(self.big_map_surface, color, False, points, line_width)
-
-        # 4. 绘制虚线 (Broken)
-        elif marking_type == carla.LaneMarkingType.Broken or marking_type == carla.LaneMarkingType.BrokenBroken:
-            # 这里的切片技巧用于模拟虚线效果：
-            # zip(*(iter(points),) * 4) 将点列表按每4个点分为一组
-            # if n % 2 == 0 隔一组取一组，实现“画一段、空一段”的效果
-            broken_lines = [x for n, x in enumerate(zip(*(iter(points),) * 4)) if n % 2 == 0]
-            for line in broken_lines:
-                pygame.draw.lines(self.big_map_surface, color, False, line, line_width)
-
-    def _lateral_shift(self, transform, shift):
-        # 1. 旋转方向：将当前朝向（yaw）顺时针旋转 90 度，得到垂直于前进方向的“右侧”方向
-        transform.rotation.yaw += 90
-        # 2. 向量计算：
-        # transform.get_forward_vector() 现在返回的是侧向向量
-        # location + shift * vector 实现沿侧向移动指定距离
-        # shift 为正向右平移，为负向左平移
-        return transform.location + shift * transform.get_forward_vector()
+            # 实线与虚线在几何阶段已拆分成独立折线
+            for points, color in lines:
+                line_color = COLOR_YELLOW if color == LINE_COLOR_YELLOW else COLOR_WHITE
+                pygame.draw.lines(self.big_map_surface, line_color, False, points.tolist(), line_width)
 
     def world_to_pixel(self, location):
         x = self.scale * self._pixels_per_meter * (location.x - self._world_offset[0])
         y = self.scale * self._pixels_per_meter * (location.y - self._world_offset[1])
         return [int(x), int(y)]
 
+    def world_to_pixel_array(self, xy):
+        """world_to_pixel 的向量化版本：xy 为 (N, 2) 世界坐标，返回 (N, 2) 浮点像素坐标"""
+        offset = np.asarray(self._world_offset, dtype=np.float64)
+        return (np.asarray(xy, dtype=np.float64) - offset) * (self.scale * self._pixels_per_meter)
+
     def get_pil_image(self):
+        if self.big_map_surface is None:
+            # 懒渲染模式：临时绘制整张图（大地图上很耗内存，优先使用 render_region）
+            surface = self.render_region(0, 0, self.pixel_width, self.pixel_height)
+            return Image.frombytes("RGB", surface.get_size(), pygame.image.tostring(surface, "RGB"))
+        if self._raster is not None:
+            # 磁盘缓存的底图直接从内存映射构建，避免整图拷贝
+            return Image.frombuffer(
+                "RGB", (self.pixel_width, self.pixel_height), self._raster, "raw", "RGB", 0, 1
+            )
         image_str = pygame.image.tostring(self.big_map_surface, "RGB")
         pil_image = Image.frombytes("RGB", self.big_map_surface.get_size(), image_str)
         return pil_image
 
+    def get_scaled_base(self, max_width, max_height):
+        """
+        返回缩放到 max_width x max_height 内的静态底图及缩放比例。
+        每种输出尺寸只缩放一次，之后所有会话共享，调用方需 copy() 后再绘制。
+        """
+        size_key = (int(max_width), int(max_height))
+        with self._scaled_lock:
+            cached = self._scaled_bases.get(size_key)
+            if cached is None:
+                render_scale = min(max_width / self.pixel_width, max_height / self.pixel_height)
+                final_w = int(self.pixel_width * render_scale)
+                final_h = int(self.pixel_height * render_scale)
+                if self.big_map_surface is None:
+                    # 懒渲染模式直接按目标比例绘制，不经过整张大图
+                    surface = self.render_region(0, 0, final_w, final_h, render_scale)
+                    base_image = Image.frombytes("RGB", (final_w, final_h), pygame.image.tostring(surface, "RGB"))
+                else:
+                    base_image = self.get_pil_image().resize((final_w, final_h), Image.Resampling.LANCZOS)
+                cached = (base_image, render_scale)
+                self._scaled_bases[size_key] = cached
+            return cached
+
+
+
+class MapCache:
+    """
+    进程级的 MapGenerator 缓存，键为 (地图名称, OpenDRIVE 内容哈希)。
+    所有浏览器会话、标签页共享同一份已绘制的地图，只有切换地图后才会重新生成。
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, "_initialized", False):
+            return
+        self._lock = threading.Lock()
+        self._generators = {}
+        self._raster_cache = MapRasterCache()
+        self._initialized = True
+        # 切换地图 / 重连时自动失效
+        from carla_client import CarlaClientManager
+        CarlaClientManager().add_map_change_listener(self.invalidate)
+
+    def get(self, world):
+        """返回当前世界对应的 MapGenerator，不存在时构建一次"""
+        # 地图和键由 CurrentMap 按 world 缓存，与路径规划、路点索引共用同一次下载
+        carla_map, key = get_current_map(world)
+        with self._lock:
+            map_gen = self._generators.get(key)
+            if map_gen is None:
+                map_gen = self._load_or_build(world, carla_map, key[1])
+                map_gen.cache_key = key
+                # 只保留当前地图，大地图的画布很占内存
+                self._generators = {key: map_gen}
+            return map_gen
+
+    def _load_or_build(self, world, carla_map, opendrive_hash):
+        raster_key = MapRasterCache.make_key(opendrive_hash, PIXELS_PER_METER, MAP_MARGIN)
+        cached = self._raster_cache.load(raster_key)
+        if cached is not None:
+            raster, meta = cached
+            return MapGenerator.from_raster(world, carla_map, raster, meta)
+        map_gen = MapGenerator(world, carla_map=carla_map, workers=MAP_BUILD_WORKERS)
+        raw_bytes = map_gen.get_raw_bytes()
+        if raw_bytes is not None:
+            self._raster_cache.save(raster_key, raw_bytes, map_gen.get_metadata())
+        return map_gen
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._generators = {}
 
 
 class Map2dViewer:
     def __init__(self):
         self.placeholder = "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAAAXNSR0IArs4c6QAAAA1JREFUGFdjYGBg+A8AAQQBAHAgZQsAAAAASUVORK5CYII="
 
-    def update(self, world, map_gen=None, max_width=500, max_height=400):
+    def _compose_base(self, world, map_gen, max_width, max_height):
+        """静态底图层：按地图和输出尺寸缓存，每帧只拷贝一份缩放后的小图"""
         self.world = world
-        self.map_gen = map_gen if map_gen is not None else MapGenerator(world)
-        self.pil_image = self.map_gen.get_pil_image()
-        self.map_w, self.map_h = self.pil_image.size
-        
-        self.raw_w, self.raw_h = self.pil_image.size
-        scale_w = max_width / self.raw_w
-        scale_h = max_height / self.raw_h
-        self.render_scale = min(scale_w, scale_h)
-        
-        self.final_w = int(self.raw_w * self.render_scale)
-        self.final_h = int(self.raw_h * self.render_scale)
-        # 全局配置
-        self.MAX_FPS = 30  # 根据实际需求调整
-        self.FRAME_QUEUE_SIZE = 2  # 每个流的帧队列大小
-        self.display_image = self.pil_image.resize((self.final_w, self.final_h), Image.Resampling.LANCZOS)
+        self.map_gen = map_gen if map_gen is not None else MapCache().get(world)
+        base_image, self.render_scale = self.map_gen.get_scaled_base(max_width, max_height)
+        self.final_w, self.final_h = base_image.size
+        return base_image.copy()
+
+    def update(self, world, map_gen=None, max_width=500, max_height=400, route=None):
+        self.display_image = self._compose_base(world, map_gen, max_width, max_height)
+        if route:
+            self._draw_route(ImageDraw.Draw(self.display_image), route)
         return self.encode_image_to_base64(self.display_image)
 
-    def update_with_ego(self, world, ego_vehicle, map_gen=None, max_width=500, max_height=400):
-        self.world = world
-        self.map_gen = map_gen if map_gen is not None else MapGenerator(world)
-        self.pil_image = self.map_gen.get_pil_image()
-        self.map_w, self.map_h = self.pil_image.size
-
-        self.raw_w, self.raw_h = self.pil_image.size
-        scale_w = max_width / self.raw_w
-        scale_h = max_height / self.raw_h
-        self.render_scale = min(scale_w, scale_h)
-
-        self.final_w = int(self.raw_w * self.render_scale)
-        self.final_h = int(self.raw_h * self.render_scale)
-        base_image = self.pil_image.resize((self.final_w, self.final_h), Image.Resampling.LANCZOS)
+    def update_with_ego(self, world, ego_vehicle, map_gen=None, max_width=500, max_height=400, route=None):
+        base_image = self._compose_base(world, map_gen, max_width, max_height)
         draw = ImageDraw.Draw(base_image)
 
         try:
-            vehicles = None
-            if self.world is not None:
-                vehicles = list(self.world.get_actors().filter("vehicle.*"))
+            if route:
+                self._draw_route(draw, route)
+
+            poses = self.read_poses(self.world)
+            ego_id = ego_vehicle.id if ego_vehicle is not None else None
+            ego_index = poses.index_of(ego_id)
+            # 所有标记一次性投影到屏幕坐标，并剔除画面外的车辆
+            screen = self._to_screen_array(poses.xy)
+            r_other = 4
+            visible = (
+                (screen[:, 0] >= -r_other) & (screen[:, 0] < self.final_w + r_other)
+                & (screen[:, 1] >= -r_other) & (screen[:, 1] < self.final_h + r_other)
+                & (poses.ids != ego_id)
+            )
+            for (screen_x, screen_y), cls in zip(screen[visible].tolist(), poses.cls[visible].tolist()):
+                draw.ellipse(
+                    (screen_x - r_other, screen_y - r_other, screen_x + r_other, screen_y + r_other),
+                    fill=(255, 170, 60) if cls == ACTOR_CLASS_WALKER else (80, 160, 255),
+                    outline=(255, 255, 255),
+                    width=1,
+                )
 
             if ego_vehicle is not None:
-                transform = ego_vehicle.get_transform()
-                loc = transform.location
-                raw_pixel = self.map_gen.world_to_pixel(loc)
-                screen_x = raw_pixel[0] * self.render_scale
-                screen_y = raw_pixel[1] * self.render_scale
+                if ego_index is not None:
+                    screen_x, screen_y = screen[ego_index].tolist()
+                    yaw = float(poses.yaw[ego_index])
+                else:
+                    transform = ego_vehicle.get_transform()
+                    screen_x, screen_y = self._to_screen(transform.location)
+                    yaw = transform.rotation.yaw
 
                 arrow_len = 12
-                yaw_rad = math.radians(transform.rotation.yaw)
+                yaw_rad = math.radians(yaw)
                 end_x = screen_x + arrow_len * math.cos(yaw_rad)
                 end_y = screen_y + arrow_len * math.sin(yaw_rad)
 
@@ -237,28 +374,49 @@ class Map2dViewer:
                     fill=(255, 255, 85),
                     width=2,
                 )
-
-            if vehicles:
-                for v in vehicles:
-                    if ego_vehicle is not None and v.id == ego_vehicle.id:
-                        continue
-                    t = v.get_transform()
-                    loc = t.location
-                    raw_pixel = self.map_gen.world_to_pixel(loc)
-                    screen_x = raw_pixel[0] * self.render_scale
-                    screen_y = raw_pixel[1] * self.render_scale
-                    r_other = 4
-                    draw.ellipse(
-                        (screen_x - r_other, screen_y - r_other, screen_x + r_other, screen_y + r_other),
-                        fill=(80, 160, 255),
-                        outline=(255, 255, 255),
-                        width=1,
-                    )
         except Exception:
             pass
 
+        self.display_image = base_image
         return self.encode_image_to_base64(base_image)
 
+    def get_overlay(self, world, ego_vehicle):
+        """
+        每次刷新推送给前端的车辆 / 行人状态（世界坐标），数组按 actor 对齐:
+        ids / xy (x0, y0, x1, y1, ...) / yaw / cls (ACTOR_CLASS_*)，ego 为主车 id。
+        """
+        overlay = {"ids": [], "xy": [], "yaw": [], "cls": [], "ego": None}
+        try:
+            if ego_vehicle is not None:
+                overlay["ego"] = ego_vehicle.id
+            poses = self.read_poses(world)
+            overlay["ids"] = poses.ids.tolist()
+            overlay["xy"] = np.round(poses.xy, 1).ravel().tolist()
+            overlay["yaw"] = np.rint(poses.yaw).astype(np.int32).tolist()
+            overlay["cls"] = poses.cls.tolist()
+        except Exception:
+            pass
+        return overlay
+
+    def read_poses(self, world):
+        """车辆和行人位姿，取自 CarlaClientManager 按 tick 共享的世界状态"""
+        from carla_client import CarlaClientManager
+        return CarlaClientManager().world_state.get(world).actor_poses()
+
+    def _to_screen(self, location):
+        raw_pixel = self.map_gen.world_to_pixel(location)
+        return raw_pixel[0] * self.render_scale, raw_pixel[1] * self.render_scale
+
+    def _to_screen_array(self, xy):
+        # 与 _to_screen 一致：先取整到底图像素，再按显示比例缩放
+        return np.trunc(self.map_gen.world_to_pixel_array(xy)) * self.render_scale
+
+    def _draw_route(self, draw, route):
+        """route 为带 x / y 属性的路点位置序列（如 carla.Location）"""
+        points = [self._to_screen(loc) for loc in route]
+        if len(points) >= 2:
+            draw.line(points, fill=(85, 255, 120), width=3)
+
     def encode_image_to_base64(self, image):
         try:
             buffer = BytesIO()
@@ -0,0 +1,139 @@
+"""
+2D 道路底图的磁盘缓存
+
+渲染好的底图以原始 RGB 字节（H x W x 3, uint8）保存为 <key>.raw，
+元数据（世界偏移、pixels_per_meter、像素尺寸）保存为 <key>.json。
+键由 OpenDRIVE 内容哈希与渲染参数共同决定，读取时使用内存映射，
+热启动时无需再生成路点和绘制道路。
+
+预热所有地图的缓存:
+    python map_disk_cache.py --host 127.0.0.1 --port 2000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "maps")
+# 渲染逻辑变化时递增，使旧缓存自动失效
+CACHE_VERSION = 2
+
+
+class MapRasterCache:
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def make_key(opendrive_hash, pixels_per_meter, margin):
+        text = f"{opendrive_hash}:{pixels_per_meter}:{margin}:{CACHE_VERSION}"
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _paths(self, key):
+        base = os.path.join(self.cache_dir, key)
+        return base + ".raw", base + ".json"
+
+    def load(self, key):
+        """读取缓存，返回 (只读内存映射数组, 元数据)；未命中或损坏时返回 None"""
+        raw_path, meta_path = self._paths(key)
+        if not (os.path.isfile(raw_path) and os.path.isfile(meta_path)):
+            return None
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("version") != CACHE_VERSION:
+                return None
+            shape = (int(meta["pixel_height"]), int(meta["pixel_width"]), 3)
+            if os.path.getsize(raw_path) != shape[0] * shape[1] * 3:
+                return None
+            raster = np.memmap(raw_path, dtype=np.uint8, mode="r", shape=shape)
+            return raster, meta
+        except Exception as e:
+            print(f"⚠️ 读取地图缓存失败 ({key}): {e}")
+            return None
+
+    def save(self, key, raw_bytes, meta):
+        """写入缓存；先写临时文件再替换，避免并发读取到半个文件"""
+        raw_path, meta_path = self._paths(key)
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            meta = dict(meta, version=CACHE_VERSION)
+            expected = int(meta["pixel_height"]) * int(meta["pixel_width"]) * 3
+            if len(raw_bytes) != expected:
+                raise ValueError(f"raster size {len(raw_bytes)} != {expected}")
+            tmp_raw = f"{raw_path}.{os.getpid()}.tmp"
+            tmp_meta = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp_raw, "wb") as f:
+                f.write(raw_bytes)
+            with open(tmp_meta, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            # 元数据最后落盘，load 以元数据存在作为缓存完整的标志
+            os.replace(tmp_raw, raw_path)
+            os.replace(tmp_meta, meta_path)
+        except Exception as e:
+            print(f"⚠️ 写入地图缓存失败 ({key}): {e}")
+
+
+def warm_cache(client, map_names=None):
+    """依次加载每张地图并生成底图缓存，完成后恢复原来的地图"""
+    from map_2d_viewer import MapCache
+
+    original_map = client.get_world().get_map().name.split("/")[-1]
+    available = [m.split("/")[-1] for m in client.get_available_maps()]
+    targets = map_names or available
+    map_cache = MapCache()
+    try:
+        for name in targets:
+            if name not in available:
+                print(f"⚠️ 服务器上没有地图 {name}，跳过")
+                continue
+            t_start = time.perf_counter()
+            world = client.load_world(name)
+            map_cache.invalidate()
+            map_cache.get(world)
+            print(f"✅ {name} 缓存完成，用时 {time.perf_counter() - t_start:.1f}s")
+    finally:
+        map_cache.invalidate()
+        current = client.get_world().get_map().name.split("/")[-1]
+        if current != original_map:
+            client.load_world(original_map)
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description='Pre-render the 2D road map cache for CARLA maps')
+    argparser.add_argument(
+        '--host',
+        metavar='H',
+        default='127.0.0.1',
+        help='IP of the host server (default: 127.0.0.1)')
+    argparser.add_argument(
+        '-p', '--port',
+        metavar='P',
+        default=2000,
+        type=int,
+        help='TCP port to listen to (default: 2000)')
+    argparser.add_argument(
+        '--maps',
+        nargs='*',
+        default=None,
+        help='only warm these maps (default: every map from get_available_maps)')
+    args = argparser.parse_args()
+
+    import carla
+
+    client = carla.Client(args.host, args.port)
+    # load_world 在大地图上可能需要较长时间
+    client.set_timeout(120.0)
+    try:
+        warm_cache(client, args.maps)
+    except KeyboardInterrupt:
+        print('\nCancelled by user. Bye!')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+"""
+道路几何提取
+
+把 carla.Map 拓扑中的每个路段采样成连续的 NumPy 数组（位置、俯仰、偏航、车道宽度、车道线类型），
+用批量数组运算计算车道左右边界、车道线偏移和像素坐标，得到可被任意光栅器复用的 RoadGeometry。
+
+ParallelRoadGeometry 把 OpenDRIVE 字符串交给进程池，每个进程自行构建 carla.Map，
+处理拓扑的一个分片，父进程合并后按 (高度, 拓扑序号) 排序，结果与串行路径一致。
+子进程用 spawn 启动并以 MAP_WORKER_PROCESS_NAME 命名，入口脚本用 is_map_worker()
+判断后不再构建界面，子进程只付出导入本模块的开销。
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import carla
+import numpy as np
+
+
+LINE_COLOR_WHITE = 0
+LINE_COLOR_YELLOW = 1
+
+_SOLID_TYPES = (int(carla.LaneMarkingType.Solid), int(carla.LaneMarkingType.SolidSolid))
+_BROKEN_TYPES = (int(carla.LaneMarkingType.Broken), int(carla.LaneMarkingType.BrokenBroken))
+_NONE_TYPE = int(carla.LaneMarkingType.NONE)
+_YELLOW = int(carla.LaneMarkingColor.Yellow)
+
+# 虚线：每 4 个采样点为一组，隔一组画一组
+_DASH_POINTS = 4
+
+# 地图构建子进程的进程名，在子进程导入入口脚本之前就已设置
+MAP_WORKER_PROCESS_NAME = "map-geometry-worker"
+
+
+class RoadGeometry:
+    """
+    紧凑的道路几何，多边形与车道线都存放在连续数组中：
+
+    - polygon_points (P, 2): 所有车道多边形的顶点，第 k 个多边形为
+      polygon_points[polygon_offsets[k]:polygon_offsets[k + 1]]
+    - polygon_z (K,): 路段起点高度，用于处理立交桥遮挡的绘制顺序
+    - polygon_index (K,): 路段在 get_topology() 中的序号，高度相同时保持原顺序
+    - line_points / line_offsets: 车道线折线（虚线已拆成独立短线）
+    - line_colors (M,): LINE_COLOR_WHITE / LINE_COLOR_YELLOW
+    - line_owner (M,): 车道线所属多边形的下标，绘制完该多边形后紧接着绘制
+
+    坐标可以是世界坐标（float64），也可以是 to_pixels() 之后的像素坐标（int32）。
+    """
+
+    def __init__(self, polygon_points, polygon_offsets, polygon_z, polygon_index,
+                 line_points, line_offsets, line_colors, line_owner):
+        self.polygon_points = polygon_points
+        self.polygon_offsets = polygon_offsets
+        self.polygon_z = polygon_z
+        self.polygon_index = polygon_index
+        self.line_points = line_points
+        self.line_offsets = line_offsets
+        self.line_colors = line_colors
+        self.line_owner = line_owner
+
+    @property
+    def num_polygons(self):
+        return len(self.polygon_z)
+
+    @property
+    def num_lines(self):
+        return len(self.line_colors)
+
+    @classmethod
+    def empty(cls):
+        return cls(
+            np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.empty(0), np.empty(0, dtype=np.int64),
+            np.empty((0, 2)), np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.uint8), np.empty(0, dtype=np.int64),
+        )
+
+    @classmethod
+    def concatenate(cls, parts):
+        """合并多个几何（例如多个进程各自处理的分片），多边形下标依次平移"""
+        parts = [p for p in parts if p.num_polygons > 0]
+        if not parts:
+            return cls.empty()
+        if len(parts) == 1:
+            return parts[0]
+        polygon_base = np.cumsum([0] + [p.num_polygons for p in parts[:-1]])
+        return cls(
+            np.concatenate([p.polygon_points for p in parts]),
+            _concat_offsets([p.polygon_offsets for p in parts]),
+            np.concatenate([p.polygon_z for p in parts]),
+            np.concatenate([p.polygon_index for p in parts]),
+            np.concatenate([p.line_points for p in parts]),
+            _concat_offsets([p.line_offsets for p in parts]),
+            np.concatenate([p.line_colors for p in parts]),
+            np.concatenate([p.line_owner + base for p, base in zip(parts, polygon_base)]),
+        )
+
+    def sorted_by_z(self):
+        """按 (高度, 拓扑序号) 稳定排序，返回新的几何"""
+        order = np.lexsort((self.polygon_index, self.polygon_z))
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        polygon_points, polygon_offsets = _gather(self.polygon_points, self.polygon_offsets, order)
+        new_owner = rank[self.line_owner] if self.num_lines else self.line_owner
+        # 同一多边形内的车道线保持原有先后顺序
+        line_order = np.argsort(new_owner, kind="stable")
+        line_points, line_offsets = _gather(self.line_points, self.line_offsets, line_order)
+        return RoadGeometry(
+            polygon_points, polygon_offsets, self.polygon_z[order], self.polygon_index[order],
+            line_points, line_offsets, self.line_colors[line_order], new_owner[line_order],
+        )
+
+    def to_pixels(self, world_offset, pixels_per_meter, scale=1.0):
+        """批量转换为像素坐标，截断规则与 MapGenerator.world_to_pixel 一致"""
+        factor = scale * pixels_per_meter
+        offset = np.asarray(world_offset, dtype=np.float64)
+        return RoadGeometry(
+            (factor * (self.polygon_points - offset)).astype(np.int32),
+            self.polygon_offsets, self.polygon_z, self.polygon_index,
+            (factor * (self.line_points - offset)).astype(np.int32),
+            self.line_offsets, self.line_colors, self.line_owner,
+        )
+
+    def bounding_boxes(self):
+        """每个多边形的包围盒 (K, 4): min_x, min_y, max_x, max_y（车道线都在多边形边上）"""
+        if self.num_polygons == 0:
+            return np.empty((0, 4))
+        starts = self.polygon_offsets[:-1]
+        mins = np.minimum.reduceat(self.polygon_points, starts, axis=0)
+        maxs = np.maximum.reduceat(self.polygon_points, starts, axis=0)
+        return np.hstack((mins, maxs))
+
+    def iter_segments(self, indices=None):
+        """按存储顺序逐个产出 (多边形顶点, [(车道线顶点, 颜色), ...])，indices 须升序"""
+        if indices is None:
+            indices = np.arange(self.num_polygons)
+        line_starts = np.searchsorted(self.line_owner, indices, side="left")
+        line_ends = np.searchsorted(self.line_owner, indices, side="right")
+        for k, line_start, line_end in zip(indices, line_starts, line_ends):
+            polygon = self.polygon_points[self.polygon_offsets[k]:self.polygon_offsets[k + 1]]
+            lines = [
+                (self.line_points[self.line_offsets[m]:self.line_offsets[m + 1]], int(self.line_colors[m]))
+                for m in range(line_start, line_end)
+            ]
+            yield polygon, lines
+
+
+class SegmentGridIndex:
+    """
+    路段包围盒的均匀网格索引，用于按区域查找需要绘制的路段。
+    查询结果按下标升序返回，即保持 RoadGeometry 中的绘制顺序。
+    """
+
+    def __init__(self, geometry, cells_per_side=64):
+        self.boxes = geometry.bounding_boxes()
+        self._cells = {}
+        if len(self.boxes) == 0:
+            self.origin = np.zeros(2)
+            self.cell_size = 1.0
+            self._grid_max = np.zeros(2, dtype=np.int64)
+            return
+        self.origin = self.boxes[:, :2].min(axis=0)
+        extent = self.boxes[:, 2:].max(axis=0) - self.origin
+        self.cell_size = max(float(extent.max()) / cells_per_side, 1.0)
+        lo = np.floor((self.boxes[:, :2] - self.origin) / self.cell_size).astype(np.int64)
+        hi = np.floor((self.boxes[:, 2:] - self.origin) / self.cell_size).astype(np.int64)
+        cells = {}
+        for k in range(len(self.boxes)):
+            for cx in range(lo[k, 0], hi[k, 0] + 1):
+                for cy in range(lo[k, 1], hi[k, 1] + 1):
+                    cells.setdefault((cx, cy), []).append(k)
+        self._cells = {key: np.asarray(value, dtype=np.int64) for key, value in cells.items()}
+        self._grid_max = hi.max(axis=0)
+
+    def query(self, box, margin=0.0):
+        """返回包围盒与 box (min_x, min_y, max_x, max_y) 相交的路段下标"""
+        if not self._cells:
+            return np.empty(0, dtype=np.int64)
+        min_x, min_y = box[0] - margin, box[1] - margin
+        max_x, max_y = box[2] + margin, box[3] + margin
+        # 查询范围裁剪到网格之内，低缩放级别的大范围查询不会遍历空单元格
+        cx0, cy0 = np.maximum(np.floor((np.array((min_x, min_y)) - self.origin) / self.cell_size), 0).astype(np.int64)
+        cx1, cy1 = np.minimum(np.floor((np.array((max_x, max_y)) - self.origin) / self.cell_size), self._grid_max).astype(np.int64)
+        found = [
+            self._cells[(cx, cy)]
+            for cx in range(cx0, cx1 + 1)
+            for cy in range(cy0, cy1 + 1)
+            if (cx, cy) in self._cells
+        ]
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        candidates = np.unique(np.concatenate(found))
+        boxes = self.boxes[candidates]
+        hit = (boxes[:, 0] <= max_x) & (boxes[:, 2] >= min_x) & (boxes[:, 1] <= max_y) & (boxes[:, 3] >= min_y)
+        return candidates[hit]
+
+
+def _concat_offsets(offsets_list):
+    out = [offsets_list[0]]
+    base = offsets_list[0][-1]
+    for offsets in offsets_list[1:]:
+        out.append(offsets[1:] + base)
+        base += offsets[-1]
+    return np.concatenate(out)
+
+
+def _gather(points, offsets, order):
+    """按 order 重新排列变长记录"""
+    lengths = np.diff(offsets)[order]
+    new_offsets = np.zeros(len(order) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=new_offsets[1:])
+    if len(order) == 0:
+        return points[:0], new_offsets
+    index = np.concatenate([np.arange(offsets[k], offsets[k + 1]) for k in order])
+    return points[index], new_offsets
+
+
+def _collect_segment(waypoint, step):
+    """从路段起点向前采样，直到 road_id 变化"""
+    waypoints = [waypoint]
+    nxt = waypoint.next(step)
+    if len(nxt) > 0:
+        nxt = nxt[0]
+        while nxt.road_id == waypoint.road_id:
+            waypoints.append(nxt)
+            nxt = nxt.next(step)
+            if len(nxt) > 0:
+                nxt = nxt[0]
+            else:
+                break
+    return waypoints
+
+
+def _marking_arrays(waypoints, sign):
+    """返回 (有效采样掩码, 类型, 颜色)，车道线为 None 的采样点会被跳过"""
+    n = len(waypoints)
+    valid = np.ones(n, dtype=bool)
+    types = np.full(n, _NONE_TYPE, dtype=np.int32)
+    colors = np.zeros(n, dtype=np.int32)
+    for i, w in enumerate(waypoints):
+        marking = w.left_lane_marking if sign < 0 else w.right_lane_marking
+        if marking is None:
+            valid[i] = False
+            continue
+        types[i] = int(marking.type)
+        colors[i] = int(marking.color)
+    return valid, types, colors
+
+
+def _marking_lines(side, types, colors):
+    """把同类型车道线的连续区间切分为实线或虚线折线"""
+    lines = []
+    n = len(types)
+    if n < 2:
+        return lines
+    change = np.flatnonzero(types[1:] != types[:-1]) + 1
+    starts = np.concatenate(([0], change))
+    ends = np.concatenate((change, [n]))
+    for start, end in zip(starts, ends):
+        if end - start < 2:
+            continue
+        marking_type = int(types[start])
+        color = LINE_COLOR_YELLOW if int(colors[start]) == _YELLOW else LINE_COLOR_WHITE
+        points = side[start:end]
+        if marking_type in _SOLID_TYPES:
+            lines.append((points, color))
+        elif marking_type in _BROKEN_TYPES:
+            for k in range(0, len(points) // _DASH_POINTS, 2):
+                lines.append((points[k * _DASH_POINTS:(k + 1) * _DASH_POINTS], color))
+    return lines
+
+
+def extract_road_geometry(carla_map, indices=None, step=2.0, topology=None):
+    """
+    提取拓扑中各路段的道路几何（世界坐标，未排序）。
+    indices 为要处理的拓扑序号，默认全部；返回的 polygon_index 即拓扑序号。
+    """
+    if topology is None:
+        topology = carla_map.get_topology()
+    starts = [x[0] for x in topology]
+    if indices is None:
+        indices = range(len(starts))
+
+    polygons, polygon_z, polygon_index = [], [], []
+    lines, line_colors, line_owner = [], [], []
+    for index in indices:
+        start = starts[index]
+        waypoints = _collect_segment(start, step)
+        n = len(waypoints)
+        if n < 2:
+            # 不足以构成多边形或车道线
+            continue
+
+        # 1. 每个路点只读取一次 transform，拉平成连续数组
+        samples = np.empty((n, 5), dtype=np.float64)
+        for i, w in enumerate(waypoints):
+            transform = w.transform
+            loc = transform.location
+            rot = transform.rotation
+            samples[i] = (loc.x, loc.y, rot.pitch, rot.yaw, w.lane_width)
+        xy = samples[:, :2]
+
+        # 2. 侧向单位向量：朝向顺时针旋转 90 度（与 get_forward_vector 相同，含俯仰分量）
+        pitch = np.radians(samples[:, 2])
+        yaw = np.radians(samples[:, 3] + 90.0)
+        lateral = np.stack((np.cos(pitch) * np.cos(yaw), np.cos(pitch) * np.sin(yaw)), axis=1)
+        half_width = 0.5 * samples[:, 4:5]
+        left = xy - half_width * lateral
+        right = xy + half_width * lateral
+
+        # 3. 左侧点序 + 右侧点序（逆序）闭合为多边形
+        owner = len(polygons)
+        polygons.append(np.concatenate((left, right[::-1])))
+        polygon_z.append(start.transform.location.z)
+        polygon_index.append(index)
+
+        # 4. 车道线（非路口区域），先左后右
+        if not start.is_junction:
+            for sign, side in ((-1, left), (1, right)):
+                valid, types, colors = _marking_arrays(waypoints, sign)
+                for points, color in _marking_lines(side[valid], types[valid], colors[valid]):
+                    lines.append(points)
+                    line_colors.append(color)
+                    line_owner.append(owner)
+
+    if not polygons:
+        return RoadGeometry.empty()
+    polygon_offsets = np.zeros(len(polygons) + 1, dtype=np.int64)
+    np.cumsum([len(p) for p in polygons], out=polygon_offsets[1:])
+    line_offsets = np.zeros(len(lines) + 1, dtype=np.int64)
+    if lines:
+        np.cumsum([len(p) for p in lines], out=line_offsets[1:])
+    return RoadGeometry(
+        np.concatenate(polygons),
+        polygon_offsets,
+        np.asarray(polygon_z, dtype=np.float64),
+        np.asarray(polygon_index, dtype=np.int64),
+        np.concatenate(lines) if lines else np.empty((0, 2)),
+        line_offsets,
+        np.asarray(line_colors, dtype=np.uint8),
+        np.asarray(line_owner, dtype=np.int64),
+    )
+
+
+def _extract_shard(map_name, opendrive, shard, num_shards, step):
+    """进程池任务：在子进程中由 OpenDRIVE 重建地图并处理第 shard 个分片"""
+    carla_map = carla.Map(map_name, opendrive)
+    topology = carla_map.get_topology()
+    # 交错分片，让各进程分到的大小路段比较均匀
+    indices = range(shard, len(topology), num_shards)
+    return extract_road_geometry(carla_map, indices=indices, step=step, topology=topology)
+
+
+def is_map_worker():
+    """当前进程是否为 ParallelRoadGeometry 的子进程"""
+    return multiprocessing.current_process().name == MAP_WORKER_PROCESS_NAME
+
+
+class _MapWorkerProcess(multiprocessing.context.SpawnProcess):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.name = MAP_WORKER_PROCESS_NAME
+
+
+class _MapWorkerContext(multiprocessing.context.SpawnContext):
+    Process = _MapWorkerProcess
+
+
+class ParallelRoadGeometry:
+    """
+    构造时即向进程池提交全部分片，调用方可以在等待期间做别的事情（例如计算地图边界），
+    result() 等待所有分片完成并合并。
+    """
+
+    def __init__(self, map_name, opendrive, workers=None, step=2.0):
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        # 主进程里已有 NiceGUI、carla 客户端和 tick 线程，fork 可能带着被持有的锁进入子进程；
+        # 分片函数会用 (map_name, opendrive) 重建 carla.Map，可以安全地使用 spawn
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=_MapWorkerContext())
+        self._futures = [
+            self._pool.submit(_extract_shard, map_name, opendrive, shard, self.workers, step)
+            for shard in range(self.workers)
+        ]
+
+    def result(self):
+        try:
+            return RoadGeometry.concatenate([f.result() for f in self._futures])
+        finally:
+            self._pool.shutdown(wait=False, cancel_futures=True)
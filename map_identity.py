@@ -0,0 +1,57 @@
+"""
+当前地图及其缓存键
+
+路径规划、路点索引、交通流出生点等只需要 carla.Map 和一个标识地图内容的键，
+不应为此让 MapCache 构建整张 2D 栅格地图。CurrentMap 对每个 world 只调用一次
+get_map / to_opendrive，键为 (地图名称, OpenDRIVE 内容哈希)，与 MapCache 共用。
+"""
+
+import hashlib
+import threading
+
+
+def make_map_key(carla_map):
+    opendrive_hash = hashlib.sha1(carla_map.to_opendrive().encode("utf-8")).hexdigest()
+    return (carla_map.name, opendrive_hash)
+
+
+class CurrentMap:
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, "_initialized", False):
+            return
+        self._lock = threading.Lock()
+        # world.id 是本地属性，用它判断是否需要重新下载 OpenDRIVE
+        self._world_id = None
+        self._map = None
+        self._key = None
+        self._initialized = True
+        # 切换地图 / 重连时自动失效
+        from carla_client import CarlaClientManager
+        CarlaClientManager().add_map_change_listener(self.invalidate)
+
+    def get(self, world):
+        """返回 (carla.Map, 缓存键)"""
+        with self._lock:
+            if self._key is None or self._world_id != world.id:
+                carla_map = world.get_map()
+                self._key = make_map_key(carla_map)
+                self._map = carla_map
+                self._world_id = world.id
+            return self._map, self._key
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._world_id = None
+            self._map = None
+            self._key = None
+
+
+def get_current_map(world):
+    return CurrentMap().get(world)
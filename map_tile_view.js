@@ -0,0 +1,310 @@
+// 可缩放、平移的 2D 地图，底图有两种模式:
+// - 瓦片模式：只请求当前视口内、当前缩放级别的瓦片
+// - 矢量模式：道路几何以二进制下载一次，在浏览器端绘制
+// 车辆、主车箭头和路线作为独立的叠加层绘制。
+export default {
+  template: `
+    <canvas
+      ref="canvas"
+      :width="width"
+      :height="height"
+      style="cursor: grab; touch-action: none; background: rgb(84, 84, 84)"
+    ></canvas>
+  `,
+  props: {
+    width: Number,
+    height: Number,
+    meta: Object,
+    tiles: String,
+    vector: String,
+  },
+  mounted() {
+    this.tileImages = new Map();
+    this.overlay = null;
+    this.route = null;
+    this.roads = null;
+    this.view = null;
+    this.drawPending = false;
+    this.drag = null;
+
+    const canvas = this.$refs.canvas;
+    canvas.addEventListener("wheel", this.onWheel, { passive: false });
+    canvas.addEventListener("pointerdown", this.onPointerDown);
+    canvas.addEventListener("pointermove", this.onPointerMove);
+    canvas.addEventListener("pointerup", this.onPointerUp);
+    canvas.addEventListener("pointerleave", this.onPointerUp);
+    canvas.addEventListener("dblclick", () => {
+      this.fit();
+      this.scheduleDraw();
+    });
+    this.fit();
+    this.loadVector();
+    this.scheduleDraw();
+  },
+  watch: {
+    meta() {
+      this.tileImages.clear();
+      this.fit();
+      this.scheduleDraw();
+    },
+    vector() {
+      this.loadVector();
+    },
+  },
+  methods: {
+    setOverlay(overlay) {
+      this.overlay = overlay;
+      this.scheduleDraw();
+    },
+    setRoute(route) {
+      this.route = route;
+      this.scheduleDraw();
+    },
+    async loadVector() {
+      this.roads = null;
+      this.scheduleDraw();
+      const url = this.vector;
+      if (!url) return;
+      const response = await fetch((window.path_prefix || "") + url);
+      if (!response.ok || url !== this.vector) return;
+      this.roads = this.decodeRoads(await response.arrayBuffer());
+      this.scheduleDraw();
+    },
+    decodeRoads(buffer) {
+      // 格式见 map_vector_stream.py；坐标解码后换算成底图像素坐标，之后只需整体变换
+      const header = new DataView(buffer, 0, 48);
+      const polygonCount = header.getUint32(4, true);
+      const polygonPointCount = header.getUint32(8, true);
+      const lineCount = header.getUint32(12, true);
+      const linePointCount = header.getUint32(16, true);
+      const originX = header.getFloat64(20, true);
+      const originY = header.getFloat64(28, true);
+      const step = header.getFloat64(36, true);
+      let offset = 48;
+      const polygonOffsets = new Uint32Array(buffer, offset, polygonCount + 1);
+      offset += 4 * (polygonCount + 1);
+      const lineOffsets = new Uint32Array(buffer, offset, lineCount + 1);
+      offset += 4 * (lineCount + 1);
+      const polygonPoints = new Uint16Array(buffer, offset, polygonPointCount * 2);
+      offset += 4 * polygonPointCount;
+      const linePoints = new Uint16Array(buffer, offset, linePointCount * 2);
+      offset += 4 * linePointCount;
+      const lineColors = new Uint8Array(buffer, offset, lineCount);
+
+      const m = this.meta;
+      const k = step * m.pixels_per_meter;
+      const bx = (originX - m.world_offset[0]) * m.pixels_per_meter;
+      const by = (originY - m.world_offset[1]) * m.pixels_per_meter;
+      const addPolyline = (path, points, start, end, close) => {
+        for (let i = start; i < end; i++) {
+          const x = bx + points[2 * i] * k;
+          const y = by + points[2 * i + 1] * k;
+          if (i === start) path.moveTo(x, y);
+          else path.lineTo(x, y);
+        }
+        if (close) path.closePath();
+      };
+      const polygons = new Path2D();
+      for (let p = 0; p < polygonCount; p++) {
+        addPolyline(polygons, polygonPoints, polygonOffsets[p], polygonOffsets[p + 1], true);
+      }
+      const white = new Path2D();
+      const yellow = new Path2D();
+      for (let l = 0; l < lineCount; l++) {
+        addPolyline(lineColors[l] === 1 ? yellow : white, linePoints, lineOffsets[l], lineOffsets[l + 1], false);
+      }
+      return { polygons, white, yellow };
+    },
+    fit() {
+      if (!this.meta) {
+        this.view = null;
+        return;
+      }
+      const scale = Math.min(this.width / this.meta.pixel_width, this.height / this.meta.pixel_height);
+      this.fitScale = scale;
+      this.view = { scale: scale, cx: this.meta.pixel_width / 2, cy: this.meta.pixel_height / 2 };
+    },
+    scheduleDraw() {
+      if (this.drawPending) return;
+      this.drawPending = true;
+      requestAnimationFrame(() => {
+        this.drawPending = false;
+        this.draw();
+      });
+    },
+    toScreen(bx, by) {
+      const v = this.view;
+      return [(bx - v.cx) * v.scale + this.width / 2, (by - v.cy) * v.scale + this.height / 2];
+    },
+    toBase(sx, sy) {
+      const v = this.view;
+      return [(sx - this.width / 2) / v.scale + v.cx, (sy - this.height / 2) / v.scale + v.cy];
+    },
+    worldToBase(x, y) {
+      const m = this.meta;
+      return [(x - m.world_offset[0]) * m.pixels_per_meter, (y - m.world_offset[1]) * m.pixels_per_meter];
+    },
+    tileUrl(z, x, y) {
+      const url = this.tiles.replace("{z}", z).replace("{x}", x).replace("{y}", y);
+      return (window.path_prefix || "") + url;
+    },
+    getTile(z, x, y) {
+      const key = `${z}/${x}/${y}`;
+      let img = this.tileImages.get(key);
+      if (img === undefined) {
+        img = new Image();
+        img.onload = () => this.scheduleDraw();
+        img.src = this.tileUrl(z, x, y);
+        this.tileImages.set(key, img);
+        // 只保留最近请求的瓦片
+        if (this.tileImages.size > 512) {
+          this.tileImages.delete(this.tileImages.keys().next().value);
+        }
+      }
+      return img.complete && img.naturalWidth > 0 ? img : null;
+    },
+    draw() {
+      const ctx = this.$refs.canvas.getContext("2d");
+      ctx.fillStyle = "rgb(84, 84, 84)";
+      ctx.fillRect(0, 0, this.width, this.height);
+      if (!this.meta || !this.view) return;
+      if (this.vector) this.drawRoads(ctx);
+      else this.drawTiles(ctx);
+      this.drawOverlay(ctx);
+    },
+    drawRoads(ctx) {
+      if (!this.roads) return;
+      const v = this.view;
+      ctx.save();
+      ctx.setTransform(v.scale, 0, 0, v.scale, this.width / 2 - v.cx * v.scale, this.height / 2 - v.cy * v.scale);
+      ctx.lineJoin = "round";
+      // 线宽与栅格底图一致（底图像素单位），随缩放变化
+      ctx.fillStyle = ctx.strokeStyle = "rgb(50, 50, 50)";
+      ctx.lineWidth = 5;
+      ctx.fill(this.roads.polygons);
+      ctx.stroke(this.roads.polygons);
+      ctx.lineWidth = 2;
+      ctx.strokeStyle = "rgb(255, 255, 255)";
+      ctx.stroke(this.roads.white);
+      ctx.strokeStyle = "rgb(255, 255, 0)";
+      ctx.stroke(this.roads.yellow);
+      ctx.restore();
+    },
+    drawTiles(ctx) {
+      const m = this.meta;
+      const v = this.view;
+      // 选择分辨率不低于屏幕的最粗一级
+      const z = Math.max(0, Math.min(m.max_zoom, m.max_zoom + Math.ceil(Math.log2(v.scale) - 1e-9)));
+      const span = m.tile_size * Math.pow(2, m.max_zoom - z);
+      const [x0, y0] = this.toBase(0, 0);
+      const [x1, y1] = this.toBase(this.width, this.height);
+      const maxX = Math.ceil(m.pixel_width / span) - 1;
+      const maxY = Math.ceil(m.pixel_height / span) - 1;
+      ctx.imageSmoothingEnabled = v.scale * span / m.tile_size < 2;
+      for (let ty = Math.max(0, Math.floor(y0 / span)); ty <= Math.min(maxY, Math.floor(y1 / span)); ty++) {
+        for (let tx = Math.max(0, Math.floor(x0 / span)); tx <= Math.min(maxX, Math.floor(x1 / span)); tx++) {
+          const img = this.getTile(z, tx, ty);
+          if (!img) continue;
+          const [sx, sy] = this.toScreen(tx * span, ty * span);
+          ctx.drawImage(img, sx, sy, span * v.scale + 0.5, span * v.scale + 0.5);
+        }
+      }
+    },
+    drawOverlay(ctx) {
+      const project = (x, y) => this.toScreen(...this.worldToBase(x, y));
+      const route = this.route;
+      if (route && route.length > 1) {
+        ctx.strokeStyle = "rgb(85, 255, 120)";
+        ctx.lineWidth = 3;
+        ctx.beginPath();
+        route.forEach(([x, y], i) => {
+          const [sx, sy] = project(x, y);
+          if (i === 0) ctx.moveTo(sx, sy);
+          else ctx.lineTo(sx, sy);
+        });
+        ctx.stroke();
+      }
+      const o = this.overlay;
+      if (!o || !o.ids) return;
+      let egoIndex = -1;
+      ctx.lineWidth = 1;
+      ctx.strokeStyle = "white";
+      for (let i = 0; i < o.ids.length; i++) {
+        if (o.ids[i] === o.ego) {
+          egoIndex = i;
+          continue;
+        }
+        const [sx, sy] = project(o.xy[2 * i], o.xy[2 * i + 1]);
+        // 0: 车辆（蓝色）, 1: 行人（橙色）
+        ctx.fillStyle = o.cls[i] === 1 ? "rgb(255, 170, 60)" : "rgb(80, 160, 255)";
+        ctx.beginPath();
+        ctx.arc(sx, sy, o.cls[i] === 1 ? 3 : 4, 0, 2 * Math.PI);
+        ctx.fill();
+        ctx.stroke();
+      }
+      if (egoIndex >= 0) {
+        const [sx, sy] = project(o.xy[2 * egoIndex], o.xy[2 * egoIndex + 1]);
+        const rad = (o.yaw[egoIndex] * Math.PI) / 180;
+        ctx.lineWidth = 2;
+        ctx.fillStyle = "rgb(255, 85, 85)";
+        ctx.beginPath();
+        ctx.arc(sx, sy, 5, 0, 2 * Math.PI);
+        ctx.fill();
+        ctx.stroke();
+        ctx.strokeStyle = "rgb(255, 255, 85)";
+        ctx.beginPath();
+        ctx.moveTo(sx, sy);
+        ctx.lineTo(sx + 12 * Math.cos(rad), sy + 12 * Math.sin(rad));
+        ctx.stroke();
+      }
+    },
+    onWheel(e) {
+      if (!this.view) return;
+      e.preventDefault();
+      const rect = this.$refs.canvas.getBoundingClientRect();
+      const sx = ((e.clientX - rect.left) * this.width) / rect.width;
+      const sy = ((e.clientY - rect.top) * this.height) / rect.height;
+      const [bx, by] = this.toBase(sx, sy);
+      const factor = Math.exp(-e.deltaY * 0.0015);
+      const scale = Math.min(4, Math.max(this.fitScale / 2, this.view.scale * factor));
+      // 缩放时保持光标下的点不动
+      this.view.scale = scale;
+      this.view.cx = bx - (sx - this.width / 2) / scale;
+      this.view.cy = by - (sy - this.height / 2) / scale;
+      this.scheduleDraw();
+    },
+    onPointerDown(e) {
+      if (!this.view) return;
+      this.drag = { x: e.clientX, y: e.clientY, moved: false };
+      this.$refs.canvas.setPointerCapture(e.pointerId);
+    },
+    onPointerMove(e) {
+      if (!this.drag) return;
+      const rect = this.$refs.canvas.getBoundingClientRect();
+      const dx = ((e.clientX - this.drag.x) * this.width) / rect.width;
+      const dy = ((e.clientY - this.drag.y) * this.height) / rect.height;
+      if (Math.abs(dx) + Math.abs(dy) > 2) this.drag.moved = true;
+      this.view.cx -= dx / this.view.scale;
+      this.view.cy -= dy / this.view.scale;
+      this.drag.x = e.clientX;
+      this.drag.y = e.clientY;
+      this.scheduleDraw();
+    },
+    onPointerUp(e) {
+      if (!this.drag) return;
+      const clicked = !this.drag.moved && e.type === "pointerup";
+      this.drag = null;
+      if (!clicked || !this.meta) return;
+      // 未拖动的单击：以世界坐标上报
+      const rect = this.$refs.canvas.getBoundingClientRect();
+      const [bx, by] = this.toBase(
+        ((e.clientX - rect.left) * this.width) / rect.width,
+        ((e.clientY - rect.top) * this.height) / rect.height,
+      );
+      this.$emit("map_click", {
+        x: bx / this.meta.pixels_per_meter + this.meta.world_offset[0],
+        y: by / this.meta.pixels_per_meter + this.meta.world_offset[1],
+      });
+    },
+  },
+};
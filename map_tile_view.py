@@ -0,0 +1,42 @@
+from nicegui import ui
+
+
+class MapTileView(ui.element, component="map_tile_view.js"):
+    """
+    地图组件：底图通过 HTTP 按需加载瓦片，或一次性下载矢量道路几何在浏览器端绘制；
+    车辆状态通过 set_overlay、路线通过 set_route 单独推送。
+    """
+
+    def __init__(self, width=500, height=400, on_click=None):
+        super().__init__()
+        self._props["width"] = width
+        self._props["height"] = height
+        self._props["meta"] = None
+        self._props["tiles"] = ""
+        self._props["vector"] = ""
+        self._route = None
+        if on_click is not None:
+            self.on("map_click", on_click)
+
+    def set_map(self, meta, tile_url_template, vector_url=""):
+        """vector_url 非空时使用矢量底图，否则使用瓦片"""
+        if (
+            self._props["meta"] == meta
+            and self._props["tiles"] == tile_url_template
+            and self._props["vector"] == vector_url
+        ):
+            return
+        self._props["meta"] = meta
+        self._props["tiles"] = tile_url_template
+        self._props["vector"] = vector_url
+        self.update()
+
+    def set_overlay(self, overlay):
+        self.run_method("setOverlay", overlay)
+
+    def set_route(self, route):
+        """route 为 [[x, y], ...] 世界坐标；只在路线变化时推送"""
+        if route == self._route:
+            return
+        self._route = route
+        self.run_method("setRoute", route)
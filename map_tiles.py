@@ -0,0 +1,190 @@
+"""
+2D 地图瓦片金字塔与 HTTP 瓦片接口
+
+最高一级 (max_zoom) 为 MapGenerator 的原始分辨率，每降低一级边长减半，
+瓦片按 z/x/y 编址。浏览器只请求视口内、当前缩放级别的瓦片，
+URL 中带有地图标识，瓦片内容不变，可以被浏览器长期缓存。地图标识由 OpenDRIVE 哈希、
+比例尺、瓦片尺寸和绘制格式版本共同决定，修改绘制样式后需要增加 TILE_FORMAT_VERSION。
+
+瓦片只在被请求时才渲染：有整张底图时从底图裁剪，懒渲染模式（大地图）下
+直接按该缩放级别绘制相交的路段。渲染结果放在有内存上限的 LRU 缓存中。
+"""
+
+import hashlib
+import math
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import pygame
+
+from fastapi import Response
+from PIL import Image
+
+from carla_client import CarlaClientManager
+from map_2d_viewer import MapCache
+from map_disk_cache import CACHE_VERSION
+
+
+TILE_SIZE = 256
+TILE_ROUTE = "/map/tiles/{map_id}/{z}/{x}/{y}.png"
+TILE_BACKGROUND = (84, 84, 84)
+# 已编码瓦片的缓存上限（字节）
+TILE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 瓦片的绘制样式或编码方式变化时加一，让浏览器不再使用旧的长期缓存
+TILE_FORMAT_VERSION = 1
+
+
+def make_map_id(opendrive_hash, pixels_per_meter, tile_size):
+    text = f"{opendrive_hash}:{pixels_per_meter}:{tile_size}:{CACHE_VERSION}:{TILE_FORMAT_VERSION}"
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class TileLRUCache:
+    """按字节数限制容量的 LRU 缓存"""
+
+    def __init__(self, max_bytes=TILE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._items[key] = data
+            self.current_bytes += len(data)
+            while self.current_bytes > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class MapTilePyramid:
+    def __init__(self, map_gen, tile_size=TILE_SIZE, max_cache_bytes=TILE_CACHE_MAX_BYTES):
+        self.map_gen = map_gen
+        self.tile_size = tile_size
+        cache_key = getattr(map_gen, "cache_key", None)
+        if cache_key:
+            self.map_id = make_map_id(cache_key[1], map_gen._pixels_per_meter, tile_size)
+        else:
+            self.map_id = f"{id(map_gen):x}"
+        longest = max(map_gen.pixel_width, map_gen.pixel_height)
+        self.max_zoom = max(0, math.ceil(math.log2(longest / tile_size)))
+        self._tiles = TileLRUCache(max_cache_bytes)
+
+    def get_metadata(self):
+        """前端需要的坐标换算参数"""
+        return {
+            "map_id": self.map_id,
+            "tile_size": self.tile_size,
+            "max_zoom": self.max_zoom,
+            "pixel_width": self.map_gen.pixel_width,
+            "pixel_height": self.map_gen.pixel_height,
+            "world_offset": list(self.map_gen._world_offset),
+            "pixels_per_meter": self.map_gen._pixels_per_meter * self.map_gen.scale,
+        }
+
+    def get_tile_url_template(self):
+        return TILE_ROUTE.replace("{map_id}", self.map_id)
+
+    def tile_span(self, z):
+        """z 级一张瓦片覆盖的原始像素边长"""
+        return self.tile_size * (2 ** (self.max_zoom - z))
+
+    def tile_count(self, z):
+        span = self.tile_span(z)
+        return (
+            math.ceil(self.map_gen.pixel_width / span),
+            math.ceil(self.map_gen.pixel_height / span),
+        )
+
+    def get_tile_png(self, z, x, y):
+        """返回 PNG 字节；坐标越界时返回 None"""
+        if not 0 <= z <= self.max_zoom:
+            return None
+        count_x, count_y = self.tile_count(z)
+        if not (0 <= x < count_x and 0 <= y < count_y):
+            return None
+        key = (z, x, y)
+        png = self._tiles.get(key)
+        if png is None:
+            png = self._render_tile(z, x, y)
+            self._tiles.put(key, png)
+        return png
+
+    def _render_tile(self, z, x, y):
+        if self.map_gen.big_map_surface is None:
+            tile = self._draw_tile(z, x, y)
+        else:
+            tile = self._crop_tile(z, x, y)
+        buffer = BytesIO()
+        tile.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def _draw_tile(self, z, x, y):
+        """懒渲染：按该缩放级别直接绘制与瓦片相交的路段"""
+        zoom = 2.0 ** (z - self.max_zoom)
+        size = self.tile_size
+        surface = self.map_gen.render_region(x * size, y * size, size, size, zoom)
+        return Image.frombytes("RGB", (size, size), pygame.image.tostring(surface, "RGB"))
+
+    def _crop_tile(self, z, x, y):
+        """从整张底图裁剪；subsurface 只拷贝瓦片覆盖的部分"""
+        span = self.tile_span(z)
+        left, top = x * span, y * span
+        width = min(span, self.map_gen.pixel_width - left)
+        height = min(span, self.map_gen.pixel_height - top)
+        region = self.map_gen.big_map_surface.subsurface((left, top, width, height))
+        tile = Image.new("RGB", (span, span), TILE_BACKGROUND)
+        tile.paste(Image.frombytes("RGB", (width, height), pygame.image.tostring(region, "RGB")), (0, 0))
+        if span != self.tile_size:
+            tile = tile.resize((self.tile_size, self.tile_size), Image.Resampling.BOX)
+        return tile
+
+
+_pyramid = None
+_pyramid_lock = threading.Lock()
+
+
+def get_tile_pyramid(world):
+    """返回当前地图的瓦片金字塔，地图变化后自动重建"""
+    global _pyramid
+    map_gen = MapCache().get(world)
+    with _pyramid_lock:
+        if _pyramid is None or _pyramid.map_gen is not map_gen:
+            _pyramid = MapTilePyramid(map_gen)
+        return _pyramid
+
+
+def register_tile_routes(app):
+    """在 NiceGUI (FastAPI) 应用上注册瓦片接口"""
+
+    @app.get(TILE_ROUTE)
+    def map_tile(map_id: str, z: int, x: int, y: int):
+        # 同步函数由 FastAPI 放到线程池执行，不阻塞事件循环
+        client_manager = CarlaClientManager()
+        if not client_manager.is_connected or client_manager.world is None:
+            return Response(status_code=404)
+        pyramid = get_tile_pyramid(client_manager.world)
+        if pyramid.map_id != map_id:
+            return Response(status_code=404)
+        png = pyramid.get_tile_png(z, x, y)
+        if png is None:
+            return Response(status_code=404)
+        return Response(
+            content=png,
+            media_type="image/png",
+            headers={"Cache-Control": "public, max-age=86400, immutable"},
+        )
@@ -0,0 +1,107 @@
+"""
+矢量地图流
+
+道路几何只发送一次：多边形与车道线以量化后的 uint16 坐标打包成紧凑的二进制，
+通过 HTTP 下发并在浏览器端用 canvas 绘制；之后每次刷新只推送车辆状态（id, x, y, yaw, 类别）。
+
+二进制格式（小端）:
+    magic "SPV1"
+    uint32 polygon_count, polygon_point_count, line_count, line_point_count
+    float64 origin_x, origin_y, step       量化: 世界坐标 = origin + q * step
+    uint32 padding
+    uint32 polygon_offsets[polygon_count + 1]
+    uint32 line_offsets[line_count + 1]
+    uint16 polygon_points[polygon_point_count * 2]
+    uint16 line_points[line_point_count * 2]
+    uint8  line_colors[line_count]
+"""
+
+import struct
+import threading
+
+import numpy as np
+from fastapi import Response
+
+from carla_client import CarlaClientManager
+from map_tiles import get_tile_pyramid
+
+
+VECTOR_ROUTE = "/map/vector/{map_id}.bin"
+VECTOR_MAGIC = b"SPV1"
+# 量化步长下限（米）；大地图按坐标范围自动放大以适配 uint16
+MIN_QUANTIZATION_STEP = 0.05
+
+_HEADER = struct.Struct("<4s4I3dI")
+
+
+def encode_road_geometry(geometry):
+    """把 RoadGeometry 编码为上面描述的二进制格式"""
+    points = [p for p in (geometry.polygon_points, geometry.line_points) if len(p)]
+    if points:
+        all_points = np.concatenate(points)
+        origin = all_points.min(axis=0)
+        extent = float((all_points.max(axis=0) - origin).max())
+    else:
+        origin = np.zeros(2)
+        extent = 0.0
+    step = max(MIN_QUANTIZATION_STEP, extent / 65535.0)
+
+    def quantize(array):
+        return np.clip(np.rint((array - origin) / step), 0, 65535).astype("<u2")
+
+    header = _HEADER.pack(
+        VECTOR_MAGIC,
+        geometry.num_polygons,
+        len(geometry.polygon_points),
+        geometry.num_lines,
+        len(geometry.line_points),
+        float(origin[0]),
+        float(origin[1]),
+        step,
+        0,
+    )
+    return b"".join((
+        header,
+        geometry.polygon_offsets.astype("<u4").tobytes(),
+        geometry.line_offsets.astype("<u4").tobytes(),
+        quantize(geometry.polygon_points).tobytes(),
+        quantize(geometry.line_points).tobytes(),
+        geometry.line_colors.astype(np.uint8).tobytes(),
+    ))
+
+
+_payload_lock = threading.Lock()
+_payload = None
+
+
+def get_vector_payload(world):
+    """返回 (map_id, 二进制)，每张地图只编码一次"""
+    global _payload
+    pyramid = get_tile_pyramid(world)
+    with _payload_lock:
+        if _payload is None or _payload[0] != pyramid.map_id:
+            data = encode_road_geometry(pyramid.map_gen.get_geometry())
+            _payload = (pyramid.map_id, data)
+        return _payload
+
+
+def get_vector_url(map_id):
+    return VECTOR_ROUTE.replace("{map_id}", map_id)
+
+
+def register_vector_routes(app):
+    """在 NiceGUI (FastAPI) 应用上注册矢量地图接口"""
+
+    @app.get(VECTOR_ROUTE)
+    def map_vector(map_id: str):
+        client_manager = CarlaClientManager()
+        if not client_manager.is_connected or client_manager.world is None:
+            return Response(status_code=404)
+        current_id, data = get_vector_payload(client_manager.world)
+        if current_id != map_id:
+            return Response(status_code=404)
+        return Response(
+            content=data,
+            media_type="application/octet-stream",
+            headers={"Cache-Control": "public, max-age=86400, immutable"},
+        )
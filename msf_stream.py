@@ -0,0 +1,292 @@
+"""
+多传感器画面的 MJPEG 推流
+
+之前页面每 0.1 秒把 960x540 的合成画面编码成 PNG、再转 base64 推给浏览器，
+编码占满一个核，base64 还让流量增加三分之一。现在改为 HTTP 长连接推送
+multipart/x-mixed-replace 的 JPEG 帧，浏览器的 <img> 直接显示:
+
+- 每帧只编码一次，所有订阅者共享同一份 JPEG 数据
+- 画面的 sequence 没有变化时不重新编码、也不推送
+- 只有存在订阅者时编码线程才运行
+- JPEG 质量可调，对所有订阅者生效
+
+画面来源需要提供 read() 上下文管理器，返回 (H, W, 3) uint8 RGB 数组与 sequence，
+例如 sensor_compositor.GridCompositor。
+
+除了六宫格合成画面，每个传感器还有独立的推流地址 /msf/sensor/<名称>.mjpg。
+SensorStreamHub 按订阅数给传感器做引用计数：某个传感器（或合成画面）有第一个
+订阅者时才在服务器上生成该传感器，最后一个订阅者断开后立即销毁，
+没人观看的传感器既不占用服务器渲染，也不占用客户端解码。
+MSFViewer 的创建、销毁以及传感器的生成 / 销毁都在 carla_async 的顺序执行器中进行，
+与其他修改状态的 RPC 按顺序执行：编码线程只更新引用计数并提交同步任务。
+"""
+
+import asyncio
+import functools
+import io
+import threading
+import time
+
+import numpy as np
+from fastapi.responses import Response, StreamingResponse
+from PIL import Image
+
+from carla_async import AsyncCarlaClient
+from msf_viewer import MSFViewer
+
+
+MSF_STREAM_ROUTE = "/msf/stream.mjpg"
+MSF_SENSOR_ROUTE = "/msf/sensor/{name}.mjpg"
+DEFAULT_JPEG_QUALITY = 75
+MAX_STREAM_FPS = 20
+_BOUNDARY = "msfframe"
+
+
+class _Subscriber:
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+        self.seen = 0
+
+
+class FrameBroadcaster:
+    def __init__(self, name, quality=DEFAULT_JPEG_QUALITY, max_fps=MAX_STREAM_FPS, on_start=None, on_stop=None):
+        self.name = name
+        self.quality = quality
+        self.max_fps = max_fps
+        # 编码线程开始 / 结束时在该线程中调用，用于按需启停画面来源
+        self.on_start = on_start
+        self.on_stop = on_stop
+        self._lock = threading.Lock()
+        self._source = None
+        # 上次编码时来源的 sequence，相同则跳过
+        self._source_seq = None
+        # 持锁期间只把画面复制到这里，JPEG 编码在释放来源的锁之后进行，
+        # 不阻塞传感器回调写入画布。退订后立即重新订阅时新旧编码线程可能短暂并存，
+        # 所以每个线程各用一份
+        self._local = threading.local()
+        self._subscribers = set()
+        self._thread = None
+        self._stop = threading.Event()
+        # 最近一次编码结果；frame_seq 为本广播器的帧序号，与来源的 sequence 无关
+        self.frame = None
+        self.frame_seq = 0
+        self.encoded = 0
+        self.skipped = 0
+
+    def set_source(self, source):
+        """切换画面来源；None 表示停止推送新帧"""
+        with self._lock:
+            self._source = source
+            self._source_seq = None
+
+    def set_quality(self, quality):
+        self.quality = min(max(int(quality), 5), 95)
+        # 质量变化后即使画面不变也重新编码一次
+        with self._lock:
+            self._source_seq = None
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def subscribe(self):
+        subscriber = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.add(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._stop = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._encode_loop, args=(self._stop,), name=f"mjpeg-{self.name}", daemon=True
+                )
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+            if not self._subscribers:
+                self._stop.set()
+                self._thread = None
+
+    async def next_frame(self, subscriber):
+        """等待比该订阅者上次拿到的更新的一帧"""
+        while subscriber.seen >= self.frame_seq or self.frame is None:
+            await subscriber.event.wait()
+            subscriber.event.clear()
+        subscriber.seen = self.frame_seq
+        return self.frame
+
+    def _encode_once(self):
+        with self._lock:
+            source = self._source
+            last_seq = self._source_seq
+        if source is None:
+            return False
+        with source.read() as (canvas, sequence):
+            if sequence == last_seq:
+                self.skipped += 1
+                return False
+            copy = getattr(self._local, "copy", None)
+            if copy is None or copy.shape != canvas.shape:
+                copy = self._local.copy = np.empty_like(canvas)
+            np.copyto(copy, canvas)
+        buffer = io.BytesIO()
+        Image.fromarray(copy).save(buffer, format="JPEG", quality=self.quality)
+        with self._lock:
+            # 编码期间来源被替换时丢弃这一帧
+            if self._source is not source:
+                return False
+            self._source_seq = sequence
+            self.frame = buffer.getvalue()
+            self.frame_seq += 1
+            subscribers = list(self._subscribers)
+        self.encoded += 1
+        for subscriber in subscribers:
+            subscriber.loop.call_soon_threadsafe(subscriber.event.set)
+        return True
+
+    def _encode_loop(self, stop):
+        period = 1.0 / self.max_fps
+        if self.on_start is not None:
+            self.on_start()
+        try:
+            while not stop.is_set():
+                t_start = time.perf_counter()
+                try:
+                    self._encode_once()
+                except Exception as e:
+                    print(f"⚠️ {self.name} 画面编码失败: {e}")
+                stop.wait(max(period - (time.perf_counter() - t_start), 0.0))
+        finally:
+            if self.on_stop is not None:
+                self.on_stop()
+
+    async def stream(self):
+        """multipart/x-mixed-replace 的数据块生成器；连接断开时自动退订"""
+        subscriber = self.subscribe()
+        try:
+            while True:
+                frame = await self.next_frame(subscriber)
+                yield (
+                    f"--{_BOUNDARY}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(frame)}\r\n\r\n"
+                ).encode("ascii") + frame + b"\r\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def response(self):
+        return StreamingResponse(
+            self.stream(),
+            media_type=f"multipart/x-mixed-replace; boundary={_BOUNDARY}",
+            headers={"Cache-Control": "no-cache, no-store", "Pragma": "no-cache"},
+        )
+
+
+class SensorStreamHub:
+    """合成画面与各传感器的推流，当前的 MSFViewer，以及传感器的引用计数"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._viewer = None
+        self._refs = {name: 0 for name in MSFViewer.SENSOR_NAMES}
+        self.composite = FrameBroadcaster(
+            "msf",
+            on_start=lambda: self.acquire(*MSFViewer.SENSOR_NAMES),
+            on_stop=lambda: self.release(*MSFViewer.SENSOR_NAMES),
+        )
+        self.sensors = {
+            name: FrameBroadcaster(
+                f"msf-{name}",
+                on_start=functools.partial(self.acquire, name),
+                on_stop=functools.partial(self.release, name),
+            )
+            for name in MSFViewer.SENSOR_NAMES
+        }
+
+    @property
+    def quality(self):
+        return self.composite.quality
+
+    def set_quality(self, quality):
+        for broadcaster in (self.composite, *self.sensors.values()):
+            broadcaster.set_quality(quality)
+
+    def replace_viewer(self, factory=None):
+        """
+        在顺序执行器中调用，例如 await carla_async.run(hub.replace_viewer, factory)。
+        销毁当前的 MSFViewer；factory 不为 None 时用它创建新的 viewer，
+        并立即生成当前有人订阅的传感器。返回新的 viewer
+        """
+        old = self._set_viewer(None)
+        if old is not None:
+            old.destroy()
+        if factory is None:
+            return None
+        viewer = factory()
+        self._set_viewer(viewer)
+        self._sync()
+        return viewer
+
+    def _set_viewer(self, viewer):
+        with self._lock:
+            old, self._viewer = self._viewer, viewer
+            for name, broadcaster in self.sensors.items():
+                broadcaster.set_source(None if viewer is None else viewer.get_source(name))
+            self.composite.set_source(None if viewer is None else viewer.get_source())
+        return old
+
+    def acquire(self, *names):
+        """编码线程开始时调用：增加引用计数，传感器的生成交给顺序执行器"""
+        with self._lock:
+            for name in names:
+                self._refs[name] += 1
+        AsyncCarlaClient().submit(self._sync)
+
+    def release(self, *names):
+        with self._lock:
+            for name in names:
+                self._refs[name] -= 1
+        AsyncCarlaClient().submit(self._sync)
+
+    def _sync(self):
+        """在顺序执行器中执行：让当前 viewer 正在运行的传感器与引用计数一致"""
+        with self._lock:
+            viewer = self._viewer
+            wanted = {name for name, count in self._refs.items() if count > 0}
+        if viewer is None:
+            return
+        for name in MSFViewer.SENSOR_NAMES:
+            try:
+                if name in wanted and name not in viewer.sensors:
+                    viewer.start_sensor(name)
+                elif name not in wanted and name in viewer.sensors:
+                    viewer.stop_sensor(name)
+            except Exception as e:
+                print(f"❌ 传感器 {name} 启停失败: {e}")
+
+    def refs(self):
+        """{传感器名: 订阅数}"""
+        with self._lock:
+            return dict(self._refs)
+
+
+_hub = SensorStreamHub()
+
+
+def get_sensor_stream_hub():
+    return _hub
+
+
+def register_msf_stream_routes(app):
+    """在 NiceGUI (FastAPI) 应用上注册多传感器画面的推流接口"""
+
+    @app.get(MSF_STREAM_ROUTE)
+    async def msf_stream():
+        return _hub.composite.response()
+
+    @app.get(MSF_SENSOR_ROUTE)
+    async def msf_sensor_stream(name: str):
+        broadcaster = _hub.sensors.get(name)
+        if broadcaster is None:
+            return Response(status_code=404)
+        return broadcaster.response()
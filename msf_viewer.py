@@ -10,6 +10,7 @@ To do that, check lines 290-308.
 
 import carla
 import argparse
+import contextlib
 import random
 import time
 import numpy as np
@@ -17,13 +18,18 @@ import io
 import base64
 from PIL import Image
 
+from sensor_pipeline import SensorPipeline
+from sensor_compositor import GridCompositor, copy_bgra_to_rgb
+from lidar_bev import LidarBevRasterizer
 
+
+# pygame is only needed for the on-screen window; the headless path composites with NumPy
 try:
     import pygame
     from pygame.locals import K_ESCAPE
     from pygame.locals import K_q
 except ImportError:
-    raise RuntimeError("cannot import pygame, make sure pygame package is installed")
+    pygame = None
 
 class CustomTimer:
     def __init__(self):
@@ -37,20 +43,27 @@ class CustomTimer:
 
 class DisplayManager:
     def __init__(self, grid_size, window_size, offscreen=False):
-        pygame.init()
-        pygame.font.init()
         self.offscreen = offscreen
+        self.display = None
+        self.compositor = None
         if not offscreen:
+            if pygame is None:
+                raise RuntimeError("cannot import pygame, make sure pygame package is installed")
+            pygame.init()
+            pygame.font.init()
             pygame.display.set_caption("CARLA Multi-Sensor Fusion")
             self.display = pygame.display.set_mode(
                 window_size, pygame.HWSURFACE | pygame.DOUBLEBUF
             )
         else:
-            self.display = pygame.Surface(window_size)
+            # Sensors write their frames straight into the cells of one preallocated RGB canvas
+            self.compositor = GridCompositor(grid_size, window_size)
 
         self.grid_size = grid_size
         self.window_size = window_size
         self.sensor_list = []
+        # Sensor callbacks only enqueue; decoding runs on the pipeline workers
+        self.pipeline = SensorPipeline()
 
     def get_window_size(self):
         return [int(self.window_size[0]), int(self.window_size[1])]
@@ -65,39 +78,63 @@ class DisplayManager:
     def add_sensor(self, sensor):
         self.sensor_list.append(sensor)
 
+    def remove_sensor(self, sensor):
+        if sensor in self.sensor_list:
+            self.sensor_list.remove(sensor)
+
     def get_sensor_list(self):
         return self.sensor_list
 
     def render(self):
         if not self.render_enabled():
             return
+        if self.compositor is not None:
+            # The canvas is already up to date, nothing to blit
+            return
 
         for s in self.sensor_list:
             s.render()
 
-        if not self.offscreen:
-            pygame.display.flip()
+        pygame.display.flip()
 
     def destroy(self):
         for s in self.sensor_list:
             s.destroy()
+        self.pipeline.stop()
+
+    def get_pipeline_stats(self):
+        """Per-sensor queue depth, dropped frames and decode time"""
+        return self.pipeline.stats()
 
     def render_enabled(self):
-        return self.display != None
+        return self.display is not None or self.compositor is not None
 
     def get_image_base64(self):
-        if self.display is None:
+        if not self.render_enabled():
             return None
         buffer = io.BytesIO()
-        size = self.display.get_size()
-        raw_str = pygame.image.tostring(self.display, "RGB")
-        pil_image = Image.frombytes("RGB", size, raw_str)
-        pil_image.save(buffer, format="PNG")
+        if self.compositor is not None:
+            with self.compositor.read() as (canvas, _):
+                Image.fromarray(canvas).save(buffer, format="PNG")
+        else:
+            size = self.display.get_size()
+            raw_str = pygame.image.tostring(self.display, "RGB")
+            pil_image = Image.frombytes("RGB", size, raw_str)
+            pil_image.save(buffer, format="PNG")
         data = buffer.getvalue()
         return base64.b64encode(data).decode("ascii")
 
 
 class MSFViewer:
+    """Headless multi-sensor view whose sensors are only spawned while somebody watches them
+
+    All six sensors are described up front, but nothing is spawned until
+    start_sensor(name) is called; stop_sensor(name) destroys it again and blanks
+    its cell. Reference counting across viewers lives in msf_stream.
+    """
+
+    SENSOR_NAMES = ("depth", "dvs", "semantic", "bev", "lidar", "wide")
+
     def __init__(
         self,
         world,
@@ -107,10 +144,18 @@ class MSFViewer:
         lidar_config=None,
         camera_configs=None,
         bev_height=10.0,
+        lidar_mode="density",
+        lidar_align="ego",
     ):
         self.world = world
         self.vehicle = vehicle
         self.display_manager = None
+        self.lidar_mode = lidar_mode
+        self.lidar_align = lidar_align
+        # name -> (sensor_type, transform, sensor_options, display_pos)
+        self.sensor_specs = {}
+        # name -> SensorManager for the sensors currently spawned
+        self.sensors = {}
         if lidar_config is None:
             lidar_config = {
                 "channels": "64",
@@ -129,9 +174,7 @@ class MSFViewer:
             self.display_manager = DisplayManager(
                 grid_size=[2, 3], window_size=[width, height], offscreen=True
             )
-            SensorManager(
-                world,
-                self.display_manager,
+            self.sensor_specs["depth"] = (
                 "DepthCamera",
                 carla.Transform(
                     carla.Location(x=4, z=2.4),
@@ -141,13 +184,10 @@ class MSFViewer:
                         roll=0.0,
                     ),
                 ),
-                vehicle,
                 {"fov": str(camera_configs["depth"]["fov"])},
-                display_pos=[0, 0],
+                [0, 0],
             )
-            SensorManager(
-                world,
-                self.display_manager,
+            self.sensor_specs["dvs"] = (
                 "DvsCamera",
                 carla.Transform(
                     carla.Location(x=4, z=2.4),
@@ -157,13 +197,10 @@ class MSFViewer:
                         roll=0.0,
                     ),
                 ),
-                vehicle,
                 {"fov": str(camera_configs["dvs"]["fov"])},
-                display_pos=[0, 1],
+                [0, 1],
             )
-            SensorManager(
-                world,
-                self.display_manager,
+            self.sensor_specs["semantic"] = (
                 "SemanticCamera",
                 carla.Transform(
                     carla.Location(x=4, z=2.4),
@@ -173,34 +210,25 @@ class MSFViewer:
                         roll=0.0,
                     ),
                 ),
-                vehicle,
                 {"fov": str(camera_configs["semantic"]["fov"])},
-                display_pos=[0, 2],
+                [0, 2],
             )
-            SensorManager(
-                world,
-                self.display_manager,
+            self.sensor_specs["lidar"] = (
                 "LiDAR",
                 carla.Transform(carla.Location(x=0, z=3.2)),
-                vehicle,
                 lidar_config,
-                display_pos=[1, 1],
+                [1, 1],
             )
-            SensorManager(
-                world,
-                self.display_manager,
+            self.sensor_specs["bev"] = (
                 "RGBCamera",
                 carla.Transform(
                     carla.Location(x=0, z=float(bev_height)),
                     carla.Rotation(yaw=0, pitch=-90, roll=0),
                 ),
-                vehicle,
                 {},
-                display_pos=[1, 0],
+                [1, 0],
             )
-            SensorManager(
-                world,
-                self.display_manager,
+            self.sensor_specs["wide"] = (
                 "RGBCamera",
                 carla.Transform(
                     carla.Location(x=3, z=2.4),
@@ -210,11 +238,46 @@ class MSFViewer:
                         roll=0.0,
                     ),
                 ),
-                vehicle,
                 {"fov": str(camera_configs["wide"]["fov"])},
-                display_pos=[1, 2],
+                [1, 2],
             )
 
+    def start_sensor(self, name):
+        """Spawn the named sensor if it is not running yet"""
+        if self.display_manager is None or name in self.sensors:
+            return
+        sensor_type, transform, sensor_options, display_pos = self.sensor_specs[name]
+        self.sensors[name] = SensorManager(
+            self.world,
+            self.display_manager,
+            sensor_type,
+            transform,
+            self.vehicle,
+            sensor_options,
+            display_pos=display_pos,
+            lidar_mode=self.lidar_mode,
+            lidar_align=self.lidar_align,
+        )
+
+    def stop_sensor(self, name):
+        """Destroy the named sensor and blank its cell"""
+        sensor = self.sensors.pop(name, None)
+        if sensor is None or self.display_manager is None:
+            return
+        self.display_manager.remove_sensor(sensor)
+        # destroy() waits for an in-flight decode, so nothing redraws the cell after it is cleared
+        sensor.destroy()
+        self.display_manager.compositor.clear(self.sensor_specs[name][3])
+
+    def get_source(self, name=None):
+        """Frame source for one sensor's cell, or for the whole grid when name is None"""
+        if self.display_manager is None:
+            return None
+        compositor = self.display_manager.compositor
+        if name is None:
+            return compositor
+        return compositor.cell_source(self.sensor_specs[name][3])
+
     def update(self):
         if self.display_manager is None:
             return None
@@ -225,21 +288,32 @@ class MSFViewer:
         if self.display_manager is not None:
             self.display_manager.destroy()
             self.display_manager = None
+        self.sensors.clear()
 
 
 class SensorManager:
-    def __init__(self, world, display_man, sensor_type, transform, attached, sensor_options, display_pos):
+    def __init__(self, world, display_man, sensor_type, transform, attached, sensor_options, display_pos,
+                 lidar_mode="density", lidar_align="ego"):
         self.surface = None
+        # LiDAR bird's-eye view, created on the first point cloud
+        self.lidar_mode = lidar_mode
+        self.lidar_align = lidar_align
+        self._lidar_bev = None
+        # Reused frame buffer for the on-screen path; headless sensors draw into their canvas cell
+        self._scratch = None
         self.world = world
         self.display_man = display_man
         self.display_pos = display_pos
-        self.sensor = self.init_sensor(sensor_type, transform, attached, sensor_options)
+        self.name = f"{sensor_type}{list(display_pos)}"
+        # Set before listening: decoders may run as soon as the first frame arrives
         self.sensor_options = sensor_options
         self.timer = CustomTimer()
 
         self.time_processing = 0.0
         self.tics_processing = 0
 
+        self.sensor = self.init_sensor(sensor_type, transform, attached, sensor_options)
+
         self.display_man.add_sensor(self)
 
     def init_sensor(self, sensor_type, transform, attached, sensor_options):
@@ -253,7 +327,7 @@ class SensorManager:
                 camera_bp.set_attribute(key, sensor_options[key])
 
             camera = self.world.spawn_actor(camera_bp, transform, attach_to=attached)
-            camera.listen(self.save_rgb_image)
+            self._listen(camera, self.save_rgb_image)
 
             return camera
         
@@ -267,7 +341,7 @@ class SensorManager:
                 camera_bp.set_attribute(key, sensor_options[key])
 
             camera = self.world.spawn_actor(camera_bp, transform, attach_to=attached)
-            camera.listen(self.save_depth_image)
+            self._listen(camera, self.save_depth_image)
 
             return camera
     
@@ -281,7 +355,7 @@ class SensorManager:
                 camera_bp.set_attribute(key, sensor_options[key])
 
             camera = self.world.spawn_actor(camera_bp, transform, attach_to=attached)
-            camera.listen(self.save_semantic_image)
+            self._listen(camera, self.save_semantic_image)
 
             return camera
         
@@ -295,7 +369,7 @@ class SensorManager:
                 camera_bp.set_attribute(key, sensor_options[key])
 
             camera = self.world.spawn_actor(camera_bp, transform, attach_to=attached)
-            camera.listen(self.save_dvs_image)
+            self._listen(camera, self.save_dvs_image)
 
             return camera
 
@@ -310,7 +384,7 @@ class SensorManager:
                 camera_bp.set_attribute(key, sensor_options[key])
 
             camera = self.world.spawn_actor(camera_bp, transform, attach_to=attached)
-            camera.listen(self.save_optical_flow_image)
+            self._listen(camera, self.save_optical_flow_image)
 
             return camera
         
@@ -328,7 +402,7 @@ class SensorManager:
 
             lidar = self.world.spawn_actor(lidar_bp, transform, attach_to=attached)
 
-            lidar.listen(self.save_lidar_image)
+            self._listen(lidar, self.save_lidar_image)
 
             return lidar
         
@@ -341,7 +415,7 @@ class SensorManager:
 
             lidar = self.world.spawn_actor(lidar_bp, transform, attach_to=attached)
 
-            lidar.listen(self.save_semanticlidar_image)
+            self._listen(lidar, self.save_semanticlidar_image)
 
             return lidar
         
@@ -351,7 +425,7 @@ class SensorManager:
                 radar_bp.set_attribute(key, sensor_options[key])
 
             radar = self.world.spawn_actor(radar_bp, transform, attach_to=attached)
-            radar.listen(self.save_radar_image)
+            self._listen(radar, self.save_radar_image)
 
             return radar
         
@@ -361,134 +435,93 @@ class SensorManager:
     def get_sensor(self):
         return self.sensor
 
-    def save_rgb_image(self, image):
-        t_start = self.timer.time()
-
-        image.convert(carla.ColorConverter.Raw)
-        array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-        array = np.reshape(array, (image.height, image.width, 4))
-        array = array[:, :, :3]
-        array = array[:, :, ::-1]
-
+    def _listen(self, sensor, decode):
+        """The callback runs on CARLA's streaming thread, so it only hands the data to the pipeline"""
+        pipeline = self.display_man.pipeline
+        pipeline.register(self.name, decode)
+        name = self.name
+        sensor.listen(lambda data: pipeline.submit(name, data))
+
+    @contextlib.contextmanager
+    def _frame(self):
+        """Yield the (H, W, 3) RGB array to draw the current frame into"""
+        compositor = self.display_man.compositor
+        if compositor is not None:
+            with compositor.write(self.display_pos) as cell:
+                yield cell
+            return
+        if self._scratch is None:
+            disp_size = self.display_man.get_display_size()
+            self._scratch = np.zeros((disp_size[1], disp_size[0], 3), dtype=np.uint8)
+        yield self._scratch
         if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+            self.surface = pygame.surfarray.make_surface(self._scratch.swapaxes(0, 1))
 
-        t_end = self.timer.time()
-        self.time_processing += (t_end-t_start)
-        self.tics_processing += 1
-    
-    def save_depth_image(self, image):
+    def _save_bgra_image(self, image):
         t_start = self.timer.time()
 
-        image.convert(carla.ColorConverter.LogarithmicDepth)
-        array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-        array = np.reshape(array, (image.height, image.width, 4))
-        array = array[:, :, :3]
-        array = array[:, :, ::-1]
-
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+        with self._frame() as frame:
+            copy_bgra_to_rgb(frame, image.raw_data, image.height, image.width)
 
         t_end = self.timer.time()
         self.time_processing += (t_end-t_start)
         self.tics_processing += 1
 
-    def save_semantic_image(self, image):
-        t_start = self.timer.time()
+    def save_rgb_image(self, image):
+        image.convert(carla.ColorConverter.Raw)
+        self._save_bgra_image(image)
 
-        image.convert(carla.ColorConverter.CityScapesPalette)
-        array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-        array = np.reshape(array, (image.height, image.width, 4))
-        array = array[:, :, :3]
-        array = array[:, :, ::-1]
+    def save_depth_image(self, image):
+        image.convert(carla.ColorConverter.LogarithmicDepth)
+        self._save_bgra_image(image)
 
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+    def save_semantic_image(self, image):
+        image.convert(carla.ColorConverter.CityScapesPalette)
+        self._save_bgra_image(image)
 
-        t_end = self.timer.time()
-        self.time_processing += (t_end-t_start)
-        self.tics_processing += 1
     def save_dvs_image(self, image):
         t_start = self.timer.time()
         dvs_events = np.frombuffer(image.raw_data, dtype=np.dtype([
             ('x', np.uint16), ('y', np.uint16), ('t', np.int64), ('pol', bool)]))
-        dvs_img = np.zeros((image.height, image.width, 3), dtype=np.uint8)
-        # Blue is positive, red is negative
-        dvs_img[dvs_events[:]['y'], dvs_events[:]['x'], dvs_events[:]['pol'] * 2] = 255
-
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(dvs_img.swapaxes(0, 1))
+        with self._frame() as frame:
+            frame.fill(0)
+            # Blue is positive, red is negative
+            frame[dvs_events['y'], dvs_events['x'], dvs_events['pol'] * 2] = 255
 
         t_end = self.timer.time()
         self.time_processing += (t_end-t_start)
         self.tics_processing += 1
+
     def save_optical_flow_image(self, image):
+        self._save_bgra_image(image.get_color_coded_flow())
+
+    def _save_lidar_points(self, points, yaw):
         t_start = self.timer.time()
 
-        image = image.get_color_coded_flow()
-        array = np.frombuffer(image.raw_data, dtype=np.dtype("uint8"))
-        array = np.reshape(array, (image.height, image.width, 4))
-        array = array[:, :, :3]
-        array = array[:, :, ::-1]
+        if self._lidar_bev is None:
+            disp_size = self.display_man.get_display_size()
+            self._lidar_bev = LidarBevRasterizer(
+                disp_size[0],
+                disp_size[1],
+                float(self.sensor_options['range']),
+                mode=self.lidar_mode,
+                align=self.lidar_align,
+            )
 
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(array.swapaxes(0, 1))
+        with self._frame() as frame:
+            self._lidar_bev.rasterize(points, yaw=yaw, out=frame)
 
         t_end = self.timer.time()
         self.time_processing += (t_end-t_start)
         self.tics_processing += 1
 
     def save_lidar_image(self, image):
-        t_start = self.timer.time()
-
-        disp_size = self.display_man.get_display_size()
-        lidar_range = 2.0*float(self.sensor_options['range'])
-
         points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-        points = np.reshape(points, (int(points.shape[0] / 4), 4))
-        lidar_data = np.array(points[:, :2])
-        lidar_data *= min(disp_size) / lidar_range
-        lidar_data += (0.5 * disp_size[0], 0.5 * disp_size[1])
-        lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-        lidar_data = lidar_data.astype(np.int32)
-        lidar_data = np.reshape(lidar_data, (-1, 2))
-        lidar_img_size = (disp_size[0], disp_size[1], 3)
-        lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-
-        lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(lidar_img)
-
-        t_end = self.timer.time()
-        self.time_processing += (t_end-t_start)
-        self.tics_processing += 1
+        self._save_lidar_points(np.reshape(points, (int(points.shape[0] / 4), 4)), image.transform.rotation.yaw)
 
     def save_semanticlidar_image(self, image):
-        t_start = self.timer.time()
-
-        disp_size = self.display_man.get_display_size()
-        lidar_range = 2.0*float(self.sensor_options['range'])
-
         points = np.frombuffer(image.raw_data, dtype=np.dtype('f4'))
-        points = np.reshape(points, (int(points.shape[0] / 6), 6))
-        lidar_data = np.array(points[:, :2])
-        lidar_data *= min(disp_size) / lidar_range
-        lidar_data += (0.5 * disp_size[0], 0.5 * disp_size[1])
-        lidar_data = np.fabs(lidar_data)  # pylint: disable=E1111
-        lidar_data = lidar_data.astype(np.int32)
-        lidar_data = np.reshape(lidar_data, (-1, 2))
-        lidar_img_size = (disp_size[0], disp_size[1], 3)
-        lidar_img = np.zeros((lidar_img_size), dtype=np.uint8)
-
-        lidar_img[tuple(lidar_data.T)] = (255, 255, 255)
-
-        if self.display_man.render_enabled():
-            self.surface = pygame.surfarray.make_surface(lidar_img)
-
-        t_end = self.timer.time()
-        self.time_processing += (t_end-t_start)
-        self.tics_processing += 1
+        self._save_lidar_points(np.reshape(points, (int(points.shape[0] / 6), 6)), image.transform.rotation.yaw)
 
     def save_radar_image(self, radar_data):
         t_start = self.timer.time()
@@ -500,11 +533,15 @@ class SensorManager:
         self.tics_processing += 1
 
     def render(self):
-        if self.surface is not None:
+        if self.surface is not None and self.display_man.display is not None:
             offset = self.display_man.get_display_offset(self.display_pos)
             self.display_man.display.blit(self.surface, offset)
 
     def destroy(self):
+        if self.sensor is None:
+            return
+        self.sensor.stop()
+        self.display_man.pipeline.unregister(self.name)
         self.sensor.destroy()
 
 
@@ -6,58 +6,105 @@ import subprocess
 import carla
 from carla_manager import CarlaSimulatorManager
 from carla_client import CarlaClientManager
+from carla_async import AsyncCarlaClient
 from map_2d_viewer import Map2dViewer
+from map_tiles import get_tile_pyramid
+from map_tile_view import MapTileView
+from map_vector_stream import get_vector_payload, get_vector_url
+from route_planner import RouteTracker
 from i18n import t, add_language_listener
 
 
 def build_navigation_tab():
     client_manager = CarlaClientManager()
+    carla_async = AsyncCarlaClient()
     map_viewer = Map2dViewer()
+    route_tracker = RouteTracker()
     has_shown_map = False
     view_switch_updating = False
     shoulder_switch = None
     monitor_switch = None
     bev_switch = None
 
-    def on_show_map():
+    def collect_map_data(world, ego_vehicle, with_vector):
+        """在只读线程池中执行：首次构建瓦片 / 矢量数据，读取叠加层和主车位置"""
+        pyramid = get_tile_pyramid(world)
+        vector_url = get_vector_url(get_vector_payload(world)[0]) if with_vector else ""
+        overlay = map_viewer.get_overlay(world, ego_vehicle)
+        # 主车位置取自同一帧的快照
+        ego_xy = None
+        if ego_vehicle is not None:
+            poses = client_manager.world_state.get(world).actor_poses()
+            ego_index = poses.index_of(ego_vehicle.id)
+            if ego_index is not None:
+                ego_xy = poses.xy[ego_index].tolist()
+        return pyramid.get_metadata(), pyramid.get_tile_url_template(), vector_url, overlay, ego_xy
+
+    async def show_map_and_overlay():
+        world = client_manager.world
+        # get_ego_vehicle 可能改写 client_manager.ego_vehicle，与生成车辆一样按顺序执行
+        ego_vehicle = await carla_async.get_ego_vehicle()
+        # 同一页面的定时刷新与点击刷新重叠时只读取一次
+        ego_id = ego_vehicle.id if ego_vehicle is not None else None
+        meta, tile_url, vector_url, overlay, ego_xy = await carla_async.run(
+            collect_map_data, world, ego_vehicle, vector_map_switch.value,
+            key=("navigation_map", id(route_tracker), ego_id), read_only=True,
+        )
+        # 偏离路线时 update 内部会重新规划，属于修改状态的调用
+        route = await carla_async.run(route_tracker.update, world, ego_vehicle, ego_xy)
+        # 底图只在地图变化时重新指向，叠加层每次刷新单独推送
+        map_view.set_map(meta, tile_url, vector_url)
+        map_view.set_overlay(overlay)
+        map_view.set_route(route)
+
+    async def on_map_click(e):
+        if not client_manager.is_connected or client_manager.world is None:
+            ui.notify("请先连接到 CARLA 并加载地图", type="warning")
+            return
+        ego_vehicle = await carla_async.get_ego_vehicle()
+        if ego_vehicle is None:
+            ui.notify("请先生成主车", type="warning")
+            return
+        try:
+            planned = await carla_async.run(
+                route_tracker.set_destination, client_manager.world, ego_vehicle, e.args["x"], e.args["y"]
+            )
+            if planned:
+                # remaining_length 与刷新线程共用一把锁，不在事件循环里等待
+                length = await carla_async.run(route_tracker.remaining_length, read_only=True)
+                ui.notify(f"已规划路线，全程约 {length:.0f} 米", type="positive")
+            else:
+                ui.notify("无法到达该目的地", type="warning")
+            await show_map_and_overlay()
+        except Exception as ex:
+            ui.notify(f"路径规划失败: {ex}", type="negative")
+
+    def on_clear_route():
+        route_tracker.clear()
+        map_view.set_route(None)
+
+    async def on_show_map():
         nonlocal has_shown_map
         has_shown_map = True
         if not client_manager.is_connected or client_manager.world is None:
             ui.notify("请先连接到 CARLA 并加载地图", type="warning")
             return
         try:
-            ego_vehicle = client_manager.get_ego_vehicle()
-            b64_img = None
-            if ego_vehicle is None:
-                b64_img = map_viewer.update(client_manager.world)
-            if ego_vehicle is not None:
-                b64_img = map_viewer.update_with_ego(client_manager.world, ego_vehicle)
-            if not b64_img:
-                ui.notify("生成地图失败", type="negative")
-                return
-            img_map.set_source(f"data:image/png;base64,{b64_img}")
+            await show_map_and_overlay()
         except Exception as e:
             ui.notify(f"显示地图失败: {e}", type="negative")
 
-    def refresh_map_periodically():
+    async def refresh_map_periodically():
         if not has_shown_map:
             return
         if not client_manager.is_connected or client_manager.world is None:
             return
         try:
-            ego_vehicle = client_manager.get_ego_vehicle()
-            b64_img = None
-            if ego_vehicle is None:
-                b64_img = map_viewer.update(client_manager.world)
-            if ego_vehicle is not None:
-                b64_img = map_viewer.update_with_ego(client_manager.world, ego_vehicle)
-            if not b64_img:
-                return
-            img_map.set_source(f"data:image/png;base64,{b64_img}")
+            await show_map_and_overlay()
         except Exception:
             return
 
-    def on_set_spectator_pose():
+    async def on_set_spectator_pose():
         if not client_manager.is_connected:
             ui.notify("请先连接到 CARLA 服务器", type="warning")
             return
@@ -72,17 +119,17 @@ def build_navigation_tab():
                     roll=float(move_roll.value),
                 ),
             )
-            client_manager.set_spectator_pose(transform)
+            await carla_async.set_spectator_pose(transform)
             ui.notify("已将观察者视角设置到指定位置", type="positive")
         except Exception as e:
             ui.notify(f"设置观察者视角失败: {e}", type="negative")
 
-    def on_set_spectator_to_vehicle():
+    async def on_set_spectator_to_vehicle():
         if not client_manager.is_connected:
             ui.notify("请先连接到 CARLA 服务器", type="warning")
             return
         try:
-            client_manager.set_spectator_to_vehicle()
+            await carla_async.set_spectator_to_vehicle()
         except Exception as e:
             ui.notify(f"设置观察者视角失败: {e}", type="negative")
 
@@ -95,23 +142,23 @@ def build_navigation_tab():
                     color="blue",
                     on_click=on_set_spectator_to_vehicle,
                 )
-                def on_shoulder_change(e):
+                async def on_shoulder_change(e):
                     nonlocal view_switch_updating
                     if view_switch_updating:
                         return
                     enabled = e.value
-                    client_manager.set_spectator_follow_vehicle_shoulder_view(enabled)
+                    await carla_async.set_spectator_follow_vehicle_shoulder_view(enabled)
                     if enabled:
                         view_switch_updating = True
                         try:
                             if monitor_switch and monitor_switch.value:
                                 monitor_switch.value = False
-                                client_manager.set_spectator_follow_vehicle_monitor_view(
+                                await carla_async.set_spectator_follow_vehicle_monitor_view(
                                     False
                                 )
                             if bev_switch and bev_switch.value:
                                 bev_switch.value = False
-                                client_manager.set_spectator_follow_vehicle_bev_view(
+                                await carla_async.set_spectator_follow_vehicle_bev_view(
                                     False
                                 )
                         finally:
@@ -119,23 +166,23 @@ def build_navigation_tab():
 
                 shoulder_switch = ui.switch(t("nav.switch_shoulder"), on_change=on_shoulder_change)
             with ui.row():
-                def on_monitor_change(e):
+                async def on_monitor_change(e):
                     nonlocal view_switch_updating
                     if view_switch_updating:
                         return
                     enabled = e.value
-                    client_manager.set_spectator_follow_vehicle_monitor_view(enabled)
+                    await carla_async.set_spectator_follow_vehicle_monitor_view(enabled)
                     if enabled:
                         view_switch_updating = True
                         try:
                             if shoulder_switch and shoulder_switch.value:
                                 shoulder_switch.value = False
-                                client_manager.set_spectator_follow_vehicle_shoulder_view(
+                                await carla_async.set_spectator_follow_vehicle_shoulder_view(
                                     False
                                 )
                             if bev_switch and bev_switch.value:
                                 bev_switch.value = False
-                                client_manager.set_spectator_follow_vehicle_bev_view(
+                                await carla_async.set_spectator_follow_vehicle_bev_view(
                                     False
                                 )
                         finally:
@@ -143,23 +190,23 @@ def build_navigation_tab():
 
                 monitor_switch = ui.switch(t("nav.switch_monitor"), on_change=on_monitor_change)
 
-                def on_bev_change(e):
+                async def on_bev_change(e):
                     nonlocal view_switch_updating
                     if view_switch_updating:
                         return
                     enabled = e.value
-                    client_manager.set_spectator_follow_vehicle_bev_view(enabled)
+                    await carla_async.set_spectator_follow_vehicle_bev_view(enabled)
                     if enabled:
                         view_switch_updating = True
                         try:
                             if shoulder_switch and shoulder_switch.value:
                                 shoulder_switch.value = False
-                                client_manager.set_spectator_follow_vehicle_shoulder_view(
+                                await carla_async.set_spectator_follow_vehicle_shoulder_view(
                                     False
                                 )
                             if monitor_switch and monitor_switch.value:
                                 monitor_switch.value = False
-                                client_manager.set_spectator_follow_vehicle_monitor_view(
+                                await carla_async.set_spectator_follow_vehicle_monitor_view(
                                     False
                                 )
                         finally:
@@ -200,43 +247,51 @@ def build_navigation_tab():
                     on_click=on_set_spectator_pose,
                 )
         with ui.grid(rows=1, columns='1fr 3fr'):
-            def locate_vehicle_by_id(vehicle_id: str):
+            def locate_vehicle(vehicle_id):
+                vehicle = client_manager.world.get_actor(vehicle_id)
+                if vehicle is None:
+                    return False
+                client_manager.set_spectator_pose(client_manager.get_actor_transform(vehicle))
+                return True
+
+            def delete_vehicle(vehicle_id):
+                vehicle = client_manager.world.get_actor(vehicle_id)
+                if vehicle is None:
+                    return False
+                vehicle.destroy()
+                return True
+
+            async def locate_vehicle_by_id(vehicle_id: str):
                 if not client_manager.is_connected or client_manager.world is None:
                     ui.notify("请先连接到 CARLA 并加载地图", type="warning")
                     return
                 try:
-                    vehicle = client_manager.world.get_actor(int(vehicle_id))
-                    if vehicle is None:
+                    if not await carla_async.run(locate_vehicle, int(vehicle_id)):
                         ui.notify(f"未找到ID为 {vehicle_id} 的车辆", type="negative")
                         return
-                    spectator = client_manager.world.get_spectator()
-                    transform = vehicle.get_transform()
-                    spectator.set_transform(transform)
                     ui.notify(f"已将视角定位到车辆 {vehicle_id}", type="positive")
                 except Exception as e:
                     ui.notify(f"定位车辆失败: {e}", type="negative")
 
-            def delete_vehicle_by_id(vehicle_id: str):
+            async def delete_vehicle_by_id(vehicle_id: str):
                 if not client_manager.is_connected or client_manager.world is None:
                     ui.notify("请先连接到 CARLA 并加载地图", type="warning")
                     return
                 try:
-                    vehicle = client_manager.world.get_actor(int(vehicle_id))
-                    if vehicle is None:
+                    if not await carla_async.run(delete_vehicle, int(vehicle_id)):
                         ui.notify(f"未找到ID为 {vehicle_id} 的车辆", type="negative")
                         return
-                    vehicle.destroy()
                     ui.notify(f"已删除车辆 {vehicle_id}", type="positive")
-                    on_list_all_vehicles()
+                    await on_list_all_vehicles()
                 except Exception as e:
                     ui.notify(f"删除车辆失败: {e}", type="negative")
 
-            def on_list_all_vehicles():
+            async def on_list_all_vehicles():
                 nonlocal row_vehicles
                 if not client_manager.is_connected:
                     ui.notify("请先连接到 CARLA 服务器", type="warning")
                     return
-                vehicles = client_manager.get_vehicles()
+                vehicles = await carla_async.get_vehicles()
                 row_vehicles.clear()
                 with row_vehicles:
                     with ui.grid(columns='64px auto auto auto').classes("gap-0 items-center w-full"):
@@ -259,15 +314,21 @@ def build_navigation_tab():
 
             with ui.card().classes("w-full"):
                 map_title_label = ui.label(t("nav.card_map_title"))
-                btn_show_map = ui.button(
-                    t("nav.btn_show_map"),
-                    color="blue-100",
-                    on_click=on_show_map,
-                )
+                with ui.row().classes("items-center"):
+                    btn_show_map = ui.button(
+                        t("nav.btn_show_map"),
+                        color="blue-100",
+                        on_click=on_show_map,
+                    )
+                    btn_clear_route = ui.button(
+                        t("nav.btn_clear_route"),
+                        color="blue-100",
+                        on_click=on_clear_route,
+                    )
+                    vector_map_switch = ui.switch(t("nav.switch_vector_map"), value=True)
                 with ui.row():
-                    img_map = ui.interactive_image(
-                        f"data:image/png;base64,{map_viewer.placeholder}"
-                    ).classes("w-128")
+                    # 点击地图设置导航目的地
+                    map_view = MapTileView(width=500, height=400, on_click=on_map_click)
 
     def apply_language(lang):
         dynamic_title_label.text = t("nav.card_dynamic_title")
@@ -281,6 +342,8 @@ def build_navigation_tab():
         btn_list_vehicles.text = t("nav.btn_list_vehicles")
         map_title_label.text = t("nav.card_map_title")
         btn_show_map.text = t("nav.btn_show_map")
+        btn_clear_route.text = t("nav.btn_clear_route")
+        vector_map_switch.label = t("nav.switch_vector_map")
 
     add_language_listener(apply_language)
 
@@ -0,0 +1,365 @@
+"""
+基于 carla.Map.get_topology() 的路径规划
+
+每张地图只构建一次带权车道图：拓扑中每一段车道为一条有向边，
+沿车道按 ROUTE_RESOLUTION 采样的折线作为边的几何，折线长度为边权。
+车道图保存在内存中，并以 .npz 写入磁盘缓存，热启动时无需再次采样路点。
+查询时把起点、终点吸附到最近的边上，在图上做 A* 搜索，
+返回拼接好的路线折线（世界坐标）。
+
+当前只沿车道行驶方向连接，不生成变道边。
+"""
+
+import heapq
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from carla_client import CarlaClientManager
+from map_disk_cache import CACHE_DIR as MAP_CACHE_DIR
+from map_identity import get_current_map
+
+
+ROUTE_CACHE_DIR = os.path.join(os.path.dirname(MAP_CACHE_DIR), "routes")
+# 图结构或采样逻辑变化时递增
+ROUTE_CACHE_VERSION = 1
+# 车道折线的采样间隔（米）
+ROUTE_RESOLUTION = 2.0
+# 偏离路线超过该距离（米）时重新规划
+OFF_ROUTE_DISTANCE = 5.0
+# 距终点小于该距离（米）视为到达
+ARRIVAL_DISTANCE = 3.0
+# 每次检查偏离时，只在当前进度之后的这些路线点里查找
+TRACKING_WINDOW = 50
+# 途中重新规划失败后，等待该时间（秒）再重试，避免每次刷新都做一次 A*
+REPLAN_BACKOFF = 2.0
+
+
+class LaneGraph:
+    """
+    有向车道图，全部以 NumPy 数组保存，可直接写入 .npz:
+    node_xy (N, 2) / edge_src, edge_dst (E,) / edge_length (E,) /
+    edge_lane (E, 3) 为 (road_id, section_id, lane_id) /
+    path_points (P, 2) 与 path_offsets (E + 1,) 为每条边的采样折线
+    """
+
+    FIELDS = ("node_xy", "edge_src", "edge_dst", "edge_length", "edge_lane", "path_points", "path_offsets")
+
+    def __init__(self, node_xy, edge_src, edge_dst, edge_length, edge_lane, path_points, path_offsets):
+        self.node_xy = node_xy
+        self.edge_src = edge_src
+        self.edge_dst = edge_dst
+        self.edge_length = edge_length
+        self.edge_lane = edge_lane
+        self.path_points = path_points
+        self.path_offsets = path_offsets
+        # 出边按起点排序，adj_edges[adj_offsets[n]:adj_offsets[n + 1]] 为节点 n 的出边
+        order = np.argsort(edge_src, kind="stable")
+        self.adj_edges = order.astype(np.int32)
+        self.adj_offsets = np.searchsorted(edge_src[order], np.arange(len(node_xy) + 1)).astype(np.int32)
+        self.point_edge = np.repeat(np.arange(len(edge_src), dtype=np.int32), np.diff(path_offsets))
+
+    @property
+    def num_nodes(self):
+        return len(self.node_xy)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_src)
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*(arrays[name] for name in cls.FIELDS))
+
+    def edge_path(self, edge):
+        return self.path_points[self.path_offsets[edge]:self.path_offsets[edge + 1]]
+
+    def locate(self, x, y, lane=None):
+        """
+        把世界坐标吸附到最近的边上，返回 (边, 折线内下标)。
+        lane 为 (road_id, section_id, lane_id) 时优先在该车道的边中查找。
+        """
+        if len(self.path_points) == 0:
+            return None
+        d2 = (self.path_points[:, 0] - x) ** 2 + (self.path_points[:, 1] - y) ** 2
+        if lane is not None:
+            lane_edges = np.all(self.edge_lane == np.asarray(lane), axis=1)
+            mask = lane_edges[self.point_edge]
+            if mask.any():
+                d2 = np.where(mask, d2, np.inf)
+        point = int(np.argmin(d2))
+        edge = int(self.point_edge[point])
+        return edge, point - int(self.path_offsets[edge])
+
+    def shortest_path(self, source, target):
+        """A* 搜索节点之间的最短路径，返回依次经过的边；不可达时返回 None"""
+        if source == target:
+            return []
+        node_xy = self.node_xy
+        tx, ty = node_xy[target]
+        # 边长不小于两端点的直线距离，直线距离是可采纳的启发函数
+        def heuristic(n):
+            return math.hypot(node_xy[n, 0] - tx, node_xy[n, 1] - ty)
+
+        best = {source: 0.0}
+        came_from = {}
+        heap = [(heuristic(source), 0.0, source)]
+        closed = set()
+        while heap:
+            _, cost, node = heapq.heappop(heap)
+            if node == target:
+                edges = []
+                while node != source:
+                    edge = came_from[node]
+                    edges.append(edge)
+                    node = int(self.edge_src[edge])
+                edges.reverse()
+                return edges
+            if node in closed:
+                continue
+            closed.add(node)
+            for edge in self.adj_edges[self.adj_offsets[node]:self.adj_offsets[node + 1]].tolist():
+                nxt = int(self.edge_dst[edge])
+                new_cost = cost + float(self.edge_length[edge])
+                if new_cost < best.get(nxt, math.inf):
+                    best[nxt] = new_cost
+                    came_from[nxt] = edge
+                    heapq.heappush(heap, (new_cost + heuristic(nxt), new_cost, nxt))
+        return None
+
+    def plan(self, start, goal):
+        """
+        start / goal 为 locate() 的结果，返回路线折线 (M, 2)；不可达时返回 None
+        """
+        start_edge, start_index = start
+        goal_edge, goal_index = goal
+        if start_edge == goal_edge and goal_index >= start_index:
+            return self.edge_path(start_edge)[start_index:goal_index + 1].copy()
+        edges = self.shortest_path(int(self.edge_dst[start_edge]), int(self.edge_src[goal_edge]))
+        if edges is None:
+            return None
+        # 相邻边在节点处首尾相接，拼接时去掉后一条边的第一个点
+        parts = [self.edge_path(start_edge)[start_index:]]
+        parts.extend(self.edge_path(edge)[1:] for edge in edges)
+        parts.append(self.edge_path(goal_edge)[1:goal_index + 1])
+        return np.concatenate(parts)
+
+
+def _node_key(location):
+    # 与 CARLA GlobalRoutePlanner 相同，端点取整到米，消除拓扑端点间的微小误差
+    return (round(location.x), round(location.y), round(location.z))
+
+
+def build_lane_graph(carla_map, resolution=ROUTE_RESOLUTION):
+    """由地图拓扑构建车道图"""
+    nodes = {}
+    node_xy = []
+    edge_src, edge_dst, edge_length, edge_lane = [], [], [], []
+    paths = []
+
+    def node_index(location):
+        key = _node_key(location)
+        index = nodes.get(key)
+        if index is None:
+            index = nodes[key] = len(node_xy)
+            node_xy.append((location.x, location.y))
+        return index
+
+    for entry_wp, exit_wp in carla_map.get_topology():
+        entry_loc = entry_wp.transform.location
+        exit_loc = exit_wp.transform.location
+        points = [(entry_loc.x, entry_loc.y)]
+        wp = entry_wp
+        # 沿车道前进直到接近出口路点，上限防止异常拓扑导致死循环
+        for _ in range(100000):
+            next_wps = wp.next(resolution)
+            if not next_wps:
+                break
+            wp = next_wps[0]
+            loc = wp.transform.location
+            if loc.distance(exit_loc) <= resolution:
+                break
+            points.append((loc.x, loc.y))
+        points.append((exit_loc.x, exit_loc.y))
+
+        path = np.asarray(points, dtype=np.float64)
+        edge_src.append(node_index(entry_loc))
+        edge_dst.append(node_index(exit_loc))
+        edge_length.append(float(np.linalg.norm(np.diff(path, axis=0), axis=1).sum()))
+        edge_lane.append((entry_wp.road_id, entry_wp.section_id, entry_wp.lane_id))
+        paths.append(path)
+
+    path_offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+    path_offsets[1:] = np.cumsum([len(p) for p in paths])
+    return LaneGraph(
+        np.asarray(node_xy, dtype=np.float64).reshape(-1, 2),
+        np.asarray(edge_src, dtype=np.int32),
+        np.asarray(edge_dst, dtype=np.int32),
+        np.asarray(edge_length, dtype=np.float64),
+        np.asarray(edge_lane, dtype=np.int32).reshape(-1, 3),
+        np.concatenate(paths) if paths else np.empty((0, 2), dtype=np.float64),
+        path_offsets,
+    )
+
+
+class RoutePlanner:
+    """
+    进程级的车道图缓存与路径查询，键与 MapCache 相同（地图名称 + OpenDRIVE 哈希）。
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, "_initialized", False):
+            return
+        self._lock = threading.Lock()
+        self._graph = None
+        self._graph_key = None
+        self._initialized = True
+        CarlaClientManager().add_map_change_listener(self.invalidate)
+
+    def get_graph(self, world):
+        """返回 (车道图, carla.Map)；地图和键取自 CurrentMap，不会触发 2D 栅格地图的构建"""
+        carla_map, key = get_current_map(world)
+        with self._lock:
+            if self._graph is None or self._graph_key != key:
+                self._graph = self._load_or_build(carla_map, key[1])
+                self._graph_key = key
+            return self._graph, carla_map
+
+    def _cache_path(self, opendrive_hash):
+        name = f"{opendrive_hash}_{ROUTE_RESOLUTION}_{ROUTE_CACHE_VERSION}.npz"
+        return os.path.join(ROUTE_CACHE_DIR, name)
+
+    def _load_or_build(self, carla_map, opendrive_hash):
+        path = self._cache_path(opendrive_hash)
+        if os.path.isfile(path):
+            try:
+                with np.load(path) as arrays:
+                    return LaneGraph.from_arrays(arrays)
+            except Exception as e:
+                print(f"⚠️ 读取路网缓存失败: {e}")
+        graph = build_lane_graph(carla_map)
+        try:
+            os.makedirs(ROUTE_CACHE_DIR, exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.savez(f, **graph.to_arrays())
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"⚠️ 写入路网缓存失败: {e}")
+        return graph
+
+    def plan(self, world, start_location, goal_xy):
+        """
+        从 start_location（carla.Location，通常是主车位置）规划到 goal_xy (x, y)。
+        起点和终点先用路点索引确定所在车道，起点带 z 以区分立交层，避免吸附到对向车道。
+        """
+        from waypoint_index import get_waypoint_index
+
+        graph, _ = self.get_graph(world)
+        waypoint_index = get_waypoint_index(world)
+        start_wp, _ = waypoint_index.query_nearest([(start_location.x, start_location.y, start_location.z)])
+        goal_wp, _ = waypoint_index.query_nearest([goal_xy[:2]])
+        start_lane = waypoint_index.lane_key(start_wp[0]) if start_wp[0] >= 0 else None
+        goal_lane = waypoint_index.lane_key(goal_wp[0]) if goal_wp[0] >= 0 else None
+        start = graph.locate(start_location.x, start_location.y, start_lane)
+        goal = graph.locate(goal_xy[0], goal_xy[1], goal_lane)
+        if start is None or goal is None:
+            return None
+        return graph.plan(start, goal)
+
+    def invalidate(self, *args):
+        with self._lock:
+            self._graph = None
+            self._graph_key = None
+
+
+class RouteTracker:
+    """
+    单个界面的导航状态：保存目的地和当前路线，
+    每次刷新按主车位置推进进度，偏离路线时重新规划。
+    set_destination 与 update 可能在不同的线程池线程中执行，状态由锁保护。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.destination = None
+        self.route = None
+        self._progress = 0
+        self._retry_at = 0.0
+
+    def set_destination(self, world, ego_vehicle, x, y):
+        """设置目的地并立即规划，返回是否成功；不可达的目的地不会保留"""
+        with self._lock:
+            self.destination = (x, y)
+            if self._replan(world, ego_vehicle):
+                return True
+            self._reset()
+            return False
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.destination = None
+        self.route = None
+        self._progress = 0
+        self._retry_at = 0.0
+
+    def remaining_length(self):
+        with self._lock:
+            if self.route is None or len(self.route) < 2:
+                return 0.0
+            return float(np.linalg.norm(np.diff(self.route[self._progress:], axis=0), axis=1).sum())
+
+    def _replan(self, world, ego_vehicle):
+        if ego_vehicle is None or self.destination is None:
+            self.route = None
+            return False
+        self.route = RoutePlanner().plan(world, ego_vehicle.get_location(), self.destination)
+        self._progress = 0
+        if self.route is None:
+            self._retry_at = time.monotonic() + REPLAN_BACKOFF
+            return False
+        return True
+
+    def update(self, world, ego_vehicle, ego_xy=None):
+        """
+        推进路线进度并返回剩余路线 [[x, y], ...]；没有目的地或已到达时返回 None。
+        ego_xy 可由调用方从快照中给出，避免额外的 get_location 调用。
+        """
+        with self._lock:
+            if self.destination is None or ego_vehicle is None:
+                return None
+            if ego_xy is None:
+                loc = ego_vehicle.get_location()
+                ego_xy = (loc.x, loc.y)
+            if self.route is None:
+                if time.monotonic() < self._retry_at or not self._replan(world, ego_vehicle):
+                    return None
+            else:
+                window = self.route[self._progress:self._progress + TRACKING_WINDOW]
+                distances = np.hypot(window[:, 0] - ego_xy[0], window[:, 1] - ego_xy[1])
+                nearest = int(np.argmin(distances))
+                if distances[nearest] > OFF_ROUTE_DISTANCE:
+                    if not self._replan(world, ego_vehicle):
+                        return None
+                else:
+                    self._progress += nearest
+            end = self.route[-1]
+            if math.hypot(end[0] - ego_xy[0], end[1] - ego_xy[1]) < ARRIVAL_DISTANCE:
+                self._reset()
+                return None
+            return np.round(self.route[self._progress:], 1).tolist()
@@ -0,0 +1,94 @@
+"""
+多传感器画面的无头合成
+
+GridCompositor 预先分配一张 (H, W, 3) uint8 的 RGB 画布，按网格切分成若干单元格视图。
+各传感器的解码函数把转换结果直接写入自己的单元格（例如 BGRA -> RGB 用一次
+np.copyto 完成），不再经过 pygame Surface，也不产生逐帧的整帧拷贝。
+
+写入和读取都持有同一把锁，读取方（编码 JPEG/PNG）拿到的是完整的一帧；
+每次写入后 sequence 加一，读取方可据此跳过没有变化的画面。单元格各自还有
+一个 sequence，cell_source(pos) 可作为单个传感器画面的读取来源。
+"""
+
+import contextlib
+import threading
+
+import numpy as np
+
+
+def copy_bgra_to_rgb(dst, raw_data, height, width):
+    """把 carla 相机的 BGRA 原始数据写入 (h, w, 3) 的 RGB 视图，尺寸不同时只复制重叠部分"""
+    src = np.frombuffer(raw_data, dtype=np.uint8).reshape(height, width, 4)
+    h = min(dst.shape[0], height)
+    w = min(dst.shape[1], width)
+    # [..., 2::-1] 是 BGR -> RGB 的视图，copyto 一次完成通道重排与复制
+    np.copyto(dst[:h, :w], src[:h, :w, 2::-1])
+
+
+class GridCompositor:
+    def __init__(self, grid_size, window_size):
+        self.rows, self.cols = int(grid_size[0]), int(grid_size[1])
+        self.width, self.height = int(window_size[0]), int(window_size[1])
+        self.cell_width = self.width // self.cols
+        self.cell_height = self.height // self.rows
+        self.canvas = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        self._lock = threading.Lock()
+        self.sequence = 0
+        self._cell_sequence = {}
+
+    def cell(self, grid_pos):
+        """grid_pos = [行, 列] 对应单元格的视图（不复制）"""
+        row, col = int(grid_pos[0]), int(grid_pos[1])
+        top, left = row * self.cell_height, col * self.cell_width
+        return self.canvas[top:top + self.cell_height, left:left + self.cell_width]
+
+    @contextlib.contextmanager
+    def write(self, grid_pos):
+        """
+        用法:
+            with compositor.write(pos) as cell:
+                copy_bgra_to_rgb(cell, image.raw_data, image.height, image.width)
+        """
+        key = (int(grid_pos[0]), int(grid_pos[1]))
+        with self._lock:
+            yield self.cell(grid_pos)
+            self.sequence += 1
+            self._cell_sequence[key] = self._cell_sequence.get(key, 0) + 1
+
+    @contextlib.contextmanager
+    def read(self):
+        """持锁访问整张画布，返回 (画布, sequence)；不要在锁外保留画布引用"""
+        with self._lock:
+            yield self.canvas, self.sequence
+
+    @contextlib.contextmanager
+    def read_cell(self, grid_pos):
+        """持锁访问单个单元格，返回 (单元格视图, 该单元格的 sequence)"""
+        key = (int(grid_pos[0]), int(grid_pos[1]))
+        with self._lock:
+            yield self.cell(grid_pos), self._cell_sequence.get(key, 0)
+
+    def cell_source(self, grid_pos):
+        """单元格的读取来源，接口与 GridCompositor.read() 相同"""
+        return _CellSource(self, grid_pos)
+
+    def clear(self, grid_pos=None):
+        with self._lock:
+            if grid_pos is None:
+                self.canvas.fill(0)
+                keys = list(self._cell_sequence)
+            else:
+                self.cell(grid_pos).fill(0)
+                keys = [(int(grid_pos[0]), int(grid_pos[1]))]
+            self.sequence += 1
+            for key in keys:
+                self._cell_sequence[key] = self._cell_sequence.get(key, 0) + 1
+
+
+class _CellSource:
+    def __init__(self, compositor, grid_pos):
+        self.compositor = compositor
+        self.grid_pos = grid_pos
+
+    def read(self):
+        return self.compositor.read_cell(self.grid_pos)
@@ -0,0 +1,161 @@
+"""
+传感器数据处理流水线
+
+carla 的传感器回调运行在客户端的数据流线程中，在回调里做 NumPy 转换和绘制会拖慢
+所有传感器的接收。SensorPipeline 让回调只把收到的 carla.SensorData 放进该传感器的
+有界队列（默认只保留最新一帧），解码交给工作线程池完成:
+
+    pipeline = SensorPipeline(workers=2)
+    pipeline.register("lidar", decode_lidar)      # decode_lidar(data) 在工作线程中执行
+    sensor.listen(lambda data: pipeline.submit("lidar", data))
+
+- 同一个传感器的帧按顺序串行处理，不同传感器并行
+- 队列已满时丢弃最旧的帧并计数，处理跟不上时总是处理最新的数据
+- stats() 返回每个传感器的在途深度（排队 + 处理中）、丢帧数和平均处理耗时
+"""
+
+import collections
+import queue
+import threading
+import time
+
+
+DEFAULT_WORKERS = 2
+# 每个传感器最多排队的帧数；1 表示只保留最新一帧
+DEFAULT_QUEUE_SIZE = 1
+# unregister 等待正在处理的帧完成的最长时间（秒）
+UNREGISTER_TIMEOUT = 1.0
+
+
+class _SensorChannel:
+    def __init__(self, name, decode, maxlen):
+        self.name = name
+        self.decode = decode
+        self.frames = collections.deque(maxlen=maxlen)
+        # 已放入就绪队列或正在被工作线程处理
+        self.scheduled = False
+        self.processing = False
+        # 正在处理该传感器的工作线程
+        self.worker = None
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.last_error = None
+
+
+class SensorPipeline:
+    def __init__(self, workers=DEFAULT_WORKERS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.queue_size = max(int(queue_size), 1)
+        self._lock = threading.Lock()
+        # 某个传感器的一帧处理完成时通知，unregister 用它等待在途的解码
+        self._idle = threading.Condition(self._lock)
+        self._channels = {}
+        self._ready = queue.Queue()
+        self._running = True
+        self._workers = [
+            threading.Thread(target=self._work, name=f"sensor-worker-{i}", daemon=True)
+            for i in range(max(int(workers), 1))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def register(self, name, decode):
+        """注册传感器；decode(data) 在工作线程中处理一帧数据"""
+        with self._lock:
+            self._channels[name] = _SensorChannel(name, decode, self.queue_size)
+
+    def unregister(self, name):
+        """
+        移除传感器，尚未处理的帧一并丢弃。正在处理的帧会等它处理完再返回，
+        之后 decode 不会再被调用，调用方可以放心清理它写入的画面
+        （在该传感器自己的 decode 中调用时不等待）
+        """
+        with self._lock:
+            channel = self._channels.pop(name, None)
+            if channel is None:
+                return
+            channel.dropped += len(channel.frames)
+            channel.frames.clear()
+            if channel.worker is not threading.current_thread():
+                if not self._idle.wait_for(lambda: not channel.processing, timeout=UNREGISTER_TIMEOUT):
+                    print(f"⚠️ 传感器 {name} 的数据处理未在 {UNREGISTER_TIMEOUT} 秒内完成")
+
+    def submit(self, name, data):
+        """传感器回调中调用：只入队，不做任何处理"""
+        with self._lock:
+            channel = self._channels.get(name)
+            if channel is None or not self._running:
+                return
+            channel.received += 1
+            if len(channel.frames) == channel.frames.maxlen:
+                channel.dropped += 1
+            channel.frames.append(data)
+            if channel.scheduled:
+                return
+            channel.scheduled = True
+        self._ready.put(channel)
+
+    def _work(self):
+        while True:
+            channel = self._ready.get()
+            if channel is None:
+                return
+            with self._lock:
+                if not channel.frames:
+                    channel.scheduled = False
+                    continue
+                data = channel.frames.popleft()
+                channel.processing = True
+                channel.worker = threading.current_thread()
+            t_start = time.perf_counter()
+            try:
+                channel.decode(data)
+            except Exception as e:
+                channel.errors += 1
+                if channel.last_error is None:
+                    print(f"⚠️ 传感器 {channel.name} 数据处理失败: {e}")
+                channel.last_error = str(e)
+            elapsed = time.perf_counter() - t_start
+            with self._lock:
+                channel.processing = False
+                channel.worker = None
+                channel.processed += 1
+                channel.total_time += elapsed
+                # 处理期间又有新帧到达时继续排队，否则释放调度标记
+                again = bool(channel.frames) and self._running and self._channels.get(channel.name) is channel
+                channel.scheduled = again
+                self._idle.notify_all()
+            if again:
+                self._ready.put(channel)
+
+    def stats(self):
+        """{传感器名: {depth, received, processed, dropped, errors, avg_ms}}"""
+        with self._lock:
+            return {
+                name: {
+                    "depth": len(c.frames) + (1 if c.processing else 0),
+                    "received": c.received,
+                    "processed": c.processed,
+                    "dropped": c.dropped,
+                    "errors": c.errors,
+                    "avg_ms": c.total_time * 1000 / c.processed if c.processed else 0.0,
+                }
+                for name, c in self._channels.items()
+            }
+
+    def stop(self):
+        """停止工作线程；正在处理的帧会处理完"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            for channel in self._channels.values():
+                channel.dropped += len(channel.frames)
+                channel.frames.clear()
+        for _ in self._workers:
+            self._ready.put(None)
+        for worker in self._workers:
+            if worker is not threading.current_thread():
+                worker.join(timeout=1.0)
@@ -1,12 +1,17 @@
+import functools
+import time
 from nicegui import ui
 from carla_client import CarlaClientManager
+from carla_async import AsyncCarlaClient
 from msf_viewer import MSFViewer
+from msf_stream import MSF_STREAM_ROUTE, MSF_SENSOR_ROUTE, get_sensor_stream_hub
 from i18n import t, add_language_listener
 
 
 def build_sensors_settings_tab():
     client_manager = CarlaClientManager()
-    msf_viewer = None
+    carla_async = AsyncCarlaClient()
+    stream_hub = get_sensor_stream_hub()
     has_started_msf = False
     img_sensor = None
     scale_label = None
@@ -36,56 +41,73 @@ def build_sensors_settings_tab():
         "wide": {"yaw": 0, "pitch": 0, "fov": 120},
     }
     bev_height = 10.0
+    lidar_mode = "density"
+    lidar_align = "ego"
     bev_height_label = None
+    quality_label = None
+    stream_name = "all"
 
-    def on_start_msf():
-        nonlocal msf_viewer, has_started_msf
-        if not client_manager.is_connected or client_manager.world is None:
-            ui.notify("请先连接到 CARLA 并加载地图", type="warning")
-            return
-        vehicle = client_manager.get_ego_vehicle()
-        if vehicle is None:
-            ui.notify("未找到 hero 车辆，请先生成车辆", type="warning")
-            return
-        if msf_viewer is not None:
-            msf_viewer.destroy()
-        msf_viewer = MSFViewer(
+    def stream_options():
+        return {
+            "all": t("sensors.stream_all"),
+            "depth": t("sensors.depth_title"),
+            "dvs": t("sensors.dvs_title"),
+            "semantic": t("sensors.semantic_title"),
+            "bev": t("sensors.bev_title"),
+            "lidar": "LiDAR",
+            "wide": t("sensors.stream_wide"),
+        }
+
+    def show_msf_stream():
+        # 画面由 MJPEG 长连接推送，传感器在有人订阅时才会生成；
+        # 时间戳参数让浏览器在重启或切换画面后重新建立连接
+        if stream_name == "all":
+            route = MSF_STREAM_ROUTE
+        else:
+            route = MSF_SENSOR_ROUTE.format(name=stream_name)
+        img_sensor.set_source(f"{route}?t={time.time()}")
+
+    def viewer_factory(vehicle):
+        # 配置在事件循环中复制一份，MSFViewer 在顺序执行器中创建
+        return functools.partial(
+            MSFViewer,
             client_manager.world,
             vehicle,
             width=960,
             height=540,
-            lidar_config=lidar_config,
-            camera_configs=camera_configs,
+            lidar_config=dict(lidar_config),
+            camera_configs={name: dict(config) for name, config in camera_configs.items()},
             bev_height=bev_height,
+            lidar_mode=lidar_mode,
+            lidar_align=lidar_align,
         )
-        has_started_msf = True
-        b64_img = msf_viewer.update()
-        if b64_img:
-            img_sensor.set_source(f"data:image/png;base64,{b64_img}")
 
-    def refresh_msf():
-        nonlocal msf_viewer
-        if not has_started_msf:
-            return
+    async def on_start_msf():
+        nonlocal has_started_msf
         if not client_manager.is_connected or client_manager.world is None:
+            ui.notify("请先连接到 CARLA 并加载地图", type="warning")
             return
-        if msf_viewer is None:
+        vehicle = await carla_async.get_ego_vehicle()
+        if vehicle is None:
+            ui.notify("未找到 hero 车辆，请先生成车辆", type="warning")
             return
         try:
-            b64_img = msf_viewer.update()
-            if not b64_img:
-                return
-            img_sensor.set_source(f"data:image/png;base64,{b64_img}")
-        except Exception:
+            # 传感器的生成与销毁和其他修改状态的 RPC 一起按顺序执行
+            await carla_async.run(stream_hub.replace_viewer, viewer_factory(vehicle))
+        except Exception as e:
+            ui.notify(f"启动多传感器画面失败: {e}", type="negative")
             return
+        has_started_msf = True
+        show_msf_stream()
 
-    def on_stop_msf():
-        nonlocal msf_viewer, has_started_msf
+    async def on_stop_msf():
+        nonlocal has_started_msf
         has_started_msf = False
-        if msf_viewer is not None:
-            msf_viewer.destroy()
-            msf_viewer = None
         img_sensor.set_source("")
+        try:
+            await carla_async.run(stream_hub.replace_viewer)
+        except Exception as e:
+            ui.notify(f"停止多传感器画面失败: {e}", type="negative")
 
     def on_scale_change(e):
         nonlocal img_sensor, scale_label
@@ -99,26 +121,33 @@ def build_sensors_settings_tab():
         if scale_label is not None:
             scale_label.text = f"{int(value)}%"
 
-    def restart_msf():
-        nonlocal msf_viewer, has_started_msf
+    async def restart_msf():
         if not has_started_msf:
             return
         if not client_manager.is_connected or client_manager.world is None:
             return
-        vehicle = client_manager.get_ego_vehicle()
+        vehicle = await carla_async.get_ego_vehicle()
         if vehicle is None:
             return
-        if msf_viewer is not None:
-            msf_viewer.destroy()
-        msf_viewer = MSFViewer(
-            client_manager.world,
-            vehicle,
-            width=960,
-            height=540,
-            lidar_config=lidar_config,
-            camera_configs=camera_configs,
-            bev_height=bev_height,
-        )
+        try:
+            await carla_async.run(stream_hub.replace_viewer, viewer_factory(vehicle))
+        except Exception as e:
+            ui.notify(f"重启多传感器画面失败: {e}", type="negative")
+            return
+        show_msf_stream()
+
+    def on_quality_change(e):
+        nonlocal quality_label
+        value = int(e.value)
+        stream_hub.set_quality(value)
+        if quality_label is not None:
+            quality_label.text = f"{value}"
+
+    def on_stream_change(e):
+        nonlocal stream_name
+        stream_name = e.value
+        if has_started_msf:
+            show_msf_stream()
 
     def on_lidar_range_change(e):
         nonlocal lidar_range_label
@@ -127,6 +156,21 @@ def build_sensors_settings_tab():
         if lidar_range_label is not None:
             lidar_range_label.text = f"{value} m"
 
+    def lidar_mode_options():
+        return {
+            "density": t("sensors.lidar_color_density"),
+            "height": t("sensors.lidar_color_height"),
+            "intensity": t("sensors.lidar_color_intensity"),
+        }
+
+    def on_lidar_mode_change(e):
+        nonlocal lidar_mode
+        lidar_mode = e.value
+
+    def on_lidar_align_change(e):
+        nonlocal lidar_align
+        lidar_align = "world" if e.value else "ego"
+
     def on_lidar_points_change(e):
         nonlocal lidar_points_label
         value = int(e.value)
@@ -148,8 +192,8 @@ def build_sensors_settings_tab():
         if fov_label is not None:
             fov_label.text = f"{value}°"
 
-    def on_apply_sensor_config():
-        restart_msf()
+    async def on_apply_sensor_config():
+        await restart_msf()
 
     def on_bev_height_change(e):
         nonlocal bev_height, bev_height_label
@@ -235,6 +279,11 @@ def build_sensors_settings_tab():
                     color="red-100",
                     on_click=on_stop_msf,
                 )
+            with ui.row().classes("items-center"):
+                stream_label_title = ui.label(t("sensors.label_stream"))
+                stream_select = ui.select(
+                    options=stream_options(), value=stream_name, on_change=on_stream_change
+                ).classes("w-48")
             with ui.row():
                 img_sensor = ui.interactive_image("").style("width:100%")
             with ui.row():
@@ -243,6 +292,12 @@ def build_sensors_settings_tab():
                     min=30, max=200, value=100, on_change=on_scale_change
                 ).classes("w-128")
                 scale_label = ui.label(f"{int(scale_slider.value)}%")
+            with ui.row():
+                quality_label_title = ui.label(t("sensors.label_jpeg_quality"))
+                quality_slider = ui.slider(
+                    min=5, max=95, value=stream_hub.quality, on_change=on_quality_change
+                ).classes("w-128")
+                quality_label = ui.label(f"{int(quality_slider.value)}")
         with ui.card():
             config_title_label = ui.label(t("sensors.card_config_title"))
             depth_title_label = ui.label(t("sensors.depth_title"))
@@ -368,6 +423,14 @@ def build_sensors_settings_tab():
                     on_change=on_lidar_rotation_change,
                 ).classes("w-64")
                 lidar_rotation_label = ui.label(f"{int(lidar_rotation_slider.value)} Hz")
+            with ui.row().classes("items-center"):
+                lidar_mode_title = ui.label(t("sensors.lidar_color"))
+                lidar_mode_select = ui.select(
+                    options=lidar_mode_options(), value=lidar_mode, on_change=on_lidar_mode_change
+                ).classes("w-48")
+                lidar_align_switch = ui.switch(
+                    t("sensors.lidar_world_align"), value=lidar_align == "world", on_change=on_lidar_align_change
+                )
             bev_title_label = ui.label(t("sensors.bev_title"))
             with ui.row():
                 bev_height_title = ui.label(t("sensors.bev_height"))
@@ -397,6 +460,9 @@ def build_sensors_settings_tab():
         btn_start.text = t("sensors.btn_start")
         btn_stop.text = t("sensors.btn_stop")
         scale_label_title.text = t("sensors.label_scale")
+        quality_label_title.text = t("sensors.label_jpeg_quality")
+        stream_label_title.text = t("sensors.label_stream")
+        stream_select.set_options(stream_options(), value=stream_name)
         config_title_label.text = t("sensors.card_config_title")
         depth_title_label.text = t("sensors.depth_title")
         depth_fov_title.text = t("sensors.label_fov")
@@ -413,11 +479,12 @@ def build_sensors_settings_tab():
         lidar_range_title.text = t("sensors.lidar_range")
         lidar_points_title.text = t("sensors.lidar_points")
         lidar_rotation_title.text = t("sensors.lidar_rotation")
+        lidar_mode_title.text = t("sensors.lidar_color")
+        lidar_mode_select.set_options(lidar_mode_options(), value=lidar_mode)
+        lidar_align_switch.text = t("sensors.lidar_world_align")
         bev_title_label.text = t("sensors.bev_title")
         bev_height_title.text = t("sensors.bev_height")
         wide_fov_title.text = t("sensors.wide_fov")
         btn_apply.text = t("sensors.btn_apply")
 
     add_language_listener(apply_language)
-
-    ui.timer(0.1, refresh_msf)
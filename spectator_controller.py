@@ -0,0 +1,146 @@
+"""
+观察者（spectator）相机控制
+
+跟随模式每个 tick 都会算出一个目标位姿。SpectatorController 用临界阻尼弹簧
+（SmoothDamp）把相机从当前位姿平滑地拉向目标，并记录最近一次发送给服务器的位姿：
+只有位置或角度的变化超过阈值时才调用 spectator.set_transform，
+车辆静止或几乎不动时不产生任何 RPC。
+
+相机的当前位姿由本地维护，不再每帧通过 get_transform 从服务器读取。
+"""
+
+import time
+
+import carla
+import numpy as np
+
+
+# 平滑时间（秒）：相机追上目标大约需要的时间，越小越跟手
+SMOOTH_TIME = 0.25
+# 位置与角度的死区，变化低于该值时不发送 set_transform
+POSITION_THRESHOLD = 0.05
+ANGLE_THRESHOLD = 0.2
+# 两次更新间隔超过该值（秒）时直接跳到目标，避免暂停后相机长距离飞行
+MAX_SMOOTH_DT = 0.5
+
+
+def _wrap_angles(angles, reference):
+    """把角度换算到 reference 附近 (-180, 180] 的范围，插值时走最短的方向"""
+    return reference + (angles - reference + 180.0) % 360.0 - 180.0
+
+
+def smooth_damp(current, target, velocity, smooth_time, dt):
+    """
+    临界阻尼弹簧的一步积分，返回 (新值, 新速度)；current/target/velocity 为同形数组。
+    不会越过目标，也不会振荡。
+    """
+    omega = 2.0 / max(smooth_time, 1e-4)
+    x = omega * dt
+    decay = 1.0 / (1.0 + x + 0.48 * x * x + 0.235 * x * x * x)
+    change = current - target
+    temp = (velocity + omega * change) * dt
+    new_velocity = (velocity - omega * temp) * decay
+    new_value = target + (change + temp) * decay
+    # 已越过目标时停在目标上
+    overshoot = (target - current) * (new_value - target) > 0
+    if np.any(overshoot):
+        new_value = np.where(overshoot, target, new_value)
+        new_velocity = np.where(overshoot, 0.0, new_velocity)
+    return new_value, new_velocity
+
+
+class SpectatorController:
+    """
+    用法:
+        controller = SpectatorController()
+        controller.move_to(world, target_transform, sim_time)   # 每个 tick 调用
+        controller.move_to(world, target_transform, snap=True)  # 立即跳到目标
+    位姿以 numpy 数组保存: location (x, y, z)，rotation (pitch, yaw, roll)
+    """
+
+    def __init__(self, smooth_time=SMOOTH_TIME, position_threshold=POSITION_THRESHOLD,
+                 angle_threshold=ANGLE_THRESHOLD):
+        self.smooth_time = smooth_time
+        self.position_threshold = position_threshold
+        self.angle_threshold = angle_threshold
+        self._world_id = None
+        self._spectator = None
+        self.sent = 0
+        self.skipped = 0
+        self.reset()
+
+    def reset(self):
+        """清空相机状态，下一次 move_to 直接跳到目标"""
+        self._location = None
+        self._rotation = None
+        self._velocity = np.zeros(6)
+        self._sent_location = None
+        self._sent_rotation = None
+        self._last_time = None
+
+    @property
+    def location(self):
+        """本地维护的相机位置 carla.Location，尚未设置时为 None"""
+        if self._location is None:
+            return None
+        x, y, z = self._location.tolist()
+        return carla.Location(x=x, y=y, z=z)
+
+    def _get_spectator(self, world):
+        if self._spectator is None or self._world_id != world.id:
+            self._spectator = world.get_spectator()
+            self._world_id = world.id
+            self.reset()
+        return self._spectator
+
+    def move_to(self, world, transform, sim_time=None, snap=False):
+        """把相机移向 transform；返回本次是否调用了 set_transform"""
+        spectator = self._get_spectator(world)
+        if sim_time is None:
+            sim_time = time.monotonic()
+        target_location = np.array(
+            [transform.location.x, transform.location.y, transform.location.z], dtype=np.float64
+        )
+        target_rotation = np.array(
+            [transform.rotation.pitch, transform.rotation.yaw, transform.rotation.roll], dtype=np.float64
+        )
+
+        dt = None if self._last_time is None else sim_time - self._last_time
+        if snap or self._location is None or dt is None or dt > MAX_SMOOTH_DT:
+            self._location = target_location
+            self._rotation = target_rotation
+            self._velocity = np.zeros(6)
+        elif dt > 0:
+            target_rotation = _wrap_angles(target_rotation, self._rotation)
+            current = np.concatenate((self._location, self._rotation))
+            target = np.concatenate((target_location, target_rotation))
+            pose, self._velocity = smooth_damp(current, target, self._velocity, self.smooth_time, dt)
+            self._location = pose[:3]
+            self._rotation = _wrap_angles(pose[3:], 0.0)
+        self._last_time = sim_time
+
+        # snap 时总是发送：用户可能手动移动过相机，上次发送的位置不代表相机当前的位置
+        if not snap and self._sent_location is not None:
+            moved = np.linalg.norm(self._location - self._sent_location)
+            turned = np.max(np.abs(_wrap_angles(self._rotation - self._sent_rotation, 0.0)))
+            if moved < self.position_threshold and turned < self.angle_threshold:
+                self.skipped += 1
+                return False
+
+        x, y, z = self._location.tolist()
+        pitch, yaw, roll = self._rotation.tolist()
+        spectator.set_transform(carla.Transform(
+            carla.Location(x=x, y=y, z=z), carla.Rotation(pitch=pitch, yaw=yaw, roll=roll)
+        ))
+        self._sent_location = self._location.copy()
+        self._sent_rotation = self._rotation.copy()
+        self.sent += 1
+        return True
+
+    def stats(self):
+        total = self.sent + self.skipped
+        return {
+            "sent": self.sent,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / total if total else 0.0,
+        }
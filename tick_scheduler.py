@@ -0,0 +1,225 @@
+"""
+按 tick 驱动的任务调度
+
+车辆信息显示、观察者跟随等周期任务不再各自起线程轮询 world.wait_for_tick()，
+而是注册到 TickScheduler。调度器只有一个专用 tick 线程：每个服务器 tick 取一次快照，
+刷新共享的 WorldState，然后按优先级依次执行到期的任务。
+
+- 同名任务重复注册时替换旧任务，快速切换开关不会产生重复的轮询
+- 每个任务可设置最小执行间隔（默认按仿真时间，秒）；wall_clock=True 的任务按墙钟计时，
+  没有 tick 到达时（例如同步模式下暂停了仿真）也会在每次等待超时后执行
+- 取消任务后在下一个 tick 前生效；没有任务时 tick 线程退出并被 join
+- 统计每个任务的执行次数与耗时，供 report() 打印
+"""
+
+import threading
+import time
+
+
+# 连续出错达到该次数的任务会被自动取消，避免对已关闭的服务器反复调用
+MAX_CONSECUTIVE_ERRORS = 10
+# wait_for_tick 的超时（秒）；同步模式下无人推进仿真时借此检查是否需要退出
+TICK_WAIT_TIMEOUT = 1.0
+
+
+class TickJob:
+    """已注册的周期任务；fn(world, state) 中 state 为本 tick 的 WorldState"""
+
+    def __init__(self, name, fn, priority=0, interval=0.0, wall_clock=False):
+        self.name = name
+        self.fn = fn
+        self.priority = priority
+        self.interval = interval
+        self.wall_clock = wall_clock
+        self.cancelled = False
+        self.last_run = None
+        self.runs = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_error = None
+
+    def cancel(self):
+        self.cancelled = True
+
+    def clock(self, sim_time, now):
+        """本任务计时用的时间：仿真时间或 time.monotonic()"""
+        return now if self.wall_clock else sim_time
+
+    def due(self, sim_time, now):
+        if self.last_run is None or self.interval <= 0:
+            return True
+        return self.clock(sim_time, now) - self.last_run >= self.interval
+
+    def stats(self):
+        """耗时单位为毫秒"""
+        return {
+            "name": self.name,
+            "priority": self.priority,
+            "interval": self.interval,
+            "wall_clock": self.wall_clock,
+            "runs": self.runs,
+            "avg_ms": self.total_time * 1000 / self.runs if self.runs else 0.0,
+            "max_ms": self.max_time * 1000,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+
+class TickScheduler:
+    """
+    用法:
+        scheduler = TickScheduler(world_state)
+        scheduler.attach(world)
+        scheduler.register("display_info", draw, priority=50, interval=0.1)
+        scheduler.cancel("display_info")
+    priority 越小越先执行。
+    """
+
+    def __init__(self, world_state):
+        self.world_state = world_state
+        self._lock = threading.Lock()
+        self._world = None
+        self._jobs = {}
+        # 按优先级排好序的任务列表，注册/取消时整体替换，tick 线程遍历时无需加锁
+        self._ordered = ()
+        self._thread = None
+        self._stop = threading.Event()
+        self.ticks = 0
+        self.tick_time = 0.0
+
+    def attach(self, world):
+        """切换到新的 world；world 为 None 时停止 tick 线程，已注册的任务保留"""
+        self._stop_thread()
+        with self._lock:
+            self._world = world
+        self._ensure_thread()
+
+    def register(self, name, fn, priority=0, interval=0.0, wall_clock=False):
+        """注册任务，同名任务会被替换；返回 TickJob"""
+        job = TickJob(name, fn, priority, interval, wall_clock)
+        with self._lock:
+            old = self._jobs.get(name)
+            if old is not None:
+                old.cancel()
+            self._jobs[name] = job
+            self._reorder()
+        self._ensure_thread()
+        return job
+
+    def cancel(self, name):
+        """取消任务；返回是否存在该任务"""
+        return self._cancel_job(name, None)
+
+    def _cancel_job(self, name, expected):
+        with self._lock:
+            job = self._jobs.get(name)
+            # expected 用于只取消特定的任务实例，不误伤之后同名注册的新任务
+            if job is None or (expected is not None and job is not expected):
+                return False
+            del self._jobs[name]
+            job.cancel()
+            self._reorder()
+            idle = not self._jobs
+        if idle:
+            self._stop_thread()
+        return True
+
+    def is_registered(self, name):
+        return name in self._jobs
+
+    def stats(self):
+        return [job.stats() for job in self._ordered]
+
+    def report(self):
+        """打印每个任务的执行次数与耗时"""
+        if self.ticks:
+            print(f"⏱️ tick 调度: {self.ticks} 次，平均 {self.tick_time * 1000 / self.ticks:.2f} ms")
+        for s in self.stats():
+            print(
+                f"   {s['name']:<20} 优先级 {s['priority']:>3} 执行 {s['runs']:>6} 次 "
+                f"平均 {s['avg_ms']:.2f} ms 最大 {s['max_ms']:.2f} ms 错误 {s['errors']}"
+            )
+
+    def _reorder(self):
+        self._ordered = tuple(sorted(self._jobs.values(), key=lambda job: job.priority))
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._world is None or not self._jobs:
+                return
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._world, self._stop), name="tick-scheduler", daemon=True
+            )
+            self._thread.start()
+
+    def _stop_thread(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+            self._stop.set()
+        # 任务在 tick 线程内取消自身时不能 join 自己
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=TICK_WAIT_TIMEOUT * 2)
+
+    def _run(self, world, stop):
+        while not stop.is_set():
+            try:
+                snapshot = world.wait_for_tick(TICK_WAIT_TIMEOUT)
+            except RuntimeError:
+                # 超时：可能是同步模式下暂停了仿真；按墙钟计时的任务照常执行，然后继续等待或退出
+                if not stop.is_set():
+                    self._run_idle_jobs(world)
+                continue
+            except Exception as e:
+                print(f"❌ tick 线程等待服务器失败，已退出: {e}")
+                break
+            if stop.is_set():
+                break
+            self._run_jobs(world, snapshot)
+
+    def _run_jobs(self, world, snapshot):
+        t_tick = time.perf_counter()
+        state = self.world_state.refresh(world, snapshot)
+        self._run_due(world, state, snapshot.timestamp.elapsed_seconds, time.monotonic(), self._ordered)
+        self.ticks += 1
+        self.tick_time += time.perf_counter() - t_tick
+
+    def _run_idle_jobs(self, world):
+        """没有 tick 到达时只执行到期的墙钟任务，状态退回按快照读取"""
+        now = time.monotonic()
+        jobs = [job for job in self._ordered if job.wall_clock and not job.cancelled and job.due(None, now)]
+        if not jobs:
+            return
+        try:
+            state = self.world_state.get(world)
+        except Exception as e:
+            print(f"⚠️ 读取世界状态失败: {e}")
+            return
+        self._run_due(world, state, None, now, jobs)
+
+    def _run_due(self, world, state, sim_time, now, jobs):
+        for job in jobs:
+            if job.cancelled or not job.due(sim_time, now):
+                continue
+            t_start = time.perf_counter()
+            try:
+                job.fn(world, state)
+                job.consecutive_errors = 0
+            except Exception as e:
+                job.errors += 1
+                job.consecutive_errors += 1
+                job.last_error = str(e)
+                if job.consecutive_errors == 1:
+                    print(f"⚠️ 任务 {job.name} 执行失败: {e}")
+                if job.consecutive_errors >= MAX_CONSECUTIVE_ERRORS:
+                    print(f"❌ 任务 {job.name} 连续失败 {job.consecutive_errors} 次，已取消")
+                    self._cancel_job(job.name, job)
+            elapsed = time.perf_counter() - t_start
+            job.last_run = job.clock(sim_time, now)
+            job.runs += 1
+            job.total_time += elapsed
+            job.max_time = max(job.max_time, elapsed)
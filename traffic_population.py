@@ -0,0 +1,248 @@
+"""
+NPC 交通流生成
+
+批量生成 N 辆自动驾驶车辆和 M 个由 controller.ai.walker 控制的行人:
+- 车辆出生点取自按地图缓存的 get_spawn_points()，剔除已有车辆附近的点，
+  并保证选中的点之间互不重叠
+- 车辆以 SpawnActor(...).then(SetAutopilot(...)) 批量生成，一次往返完成注册
+- 行人与其 AI 控制器各用一次批量命令生成；控制器的 start / go_to_location
+  没有对应的批量命令，只能逐个调用
+"""
+
+import random
+import threading
+import time
+
+import carla
+import numpy as np
+
+from batch_commands import DEFAULT_TM_PORT
+from carla_client import CarlaClientManager
+from map_identity import get_current_map
+from world_state import ACTOR_CLASS_VEHICLE
+
+
+# 出生点与已有车辆、以及选中的出生点之间的最小间距（米）
+SPAWN_CLEARANCE = 8.0
+# 跟车距离（米）
+TM_LEADING_DISTANCE = 2.5
+# 行人中奔跑的比例，以及横穿马路的比例
+WALKER_RUNNING_RATIO = 0.1
+WALKER_CROSSING_FACTOR = 0.1
+
+
+class TrafficPopulation:
+    """进程级的 NPC 交通流管理，记录本模块生成的 actor，便于统一清除"""
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        if getattr(self, "_initialized", False):
+            return
+        self.client_manager = CarlaClientManager()
+        self._lock = threading.Lock()
+        self._spawn_points_key = None
+        self._spawn_transforms = []
+        self._spawn_xyz = np.empty((0, 3))
+        self._blueprint_world_id = None
+        self._vehicle_blueprints = []
+        self._walker_blueprints = []
+        self._controller_blueprint = None
+        self.vehicle_ids = []
+        self.walker_ids = []
+        self.controller_ids = []
+        self._initialized = True
+        self.client_manager.add_map_change_listener(self._on_map_change)
+
+    def _on_map_change(self, world):
+        # 换图后旧 actor 已随旧世界销毁，只需清空记录
+        with self._lock:
+            self.vehicle_ids = []
+            self.walker_ids = []
+            self.controller_ids = []
+
+    def _spawn_points(self, world):
+        """出生点按地图缓存；carla.Map 取自 CurrentMap，不会触发 2D 栅格地图的构建"""
+        carla_map, key = get_current_map(world)
+        if self._spawn_points_key != key:
+            self._spawn_transforms = carla_map.get_spawn_points()
+            self._spawn_xyz = np.array(
+                [(t.location.x, t.location.y, t.location.z) for t in self._spawn_transforms],
+                dtype=np.float64,
+            ).reshape(-1, 3)
+            self._spawn_points_key = key
+        return self._spawn_transforms, self._spawn_xyz
+
+    def _blueprints(self, world):
+        if self._blueprint_world_id != world.id:
+            library = world.get_blueprint_library()
+            # 只用四轮车，摩托和自行车在自动驾驶下容易出事故
+            self._vehicle_blueprints = [
+                bp for bp in library.filter("vehicle.*")
+                if not bp.has_attribute("number_of_wheels") or int(bp.get_attribute("number_of_wheels")) == 4
+            ]
+            self._walker_blueprints = list(library.filter("walker.pedestrian.*"))
+            self._controller_blueprint = library.find("controller.ai.walker")
+            self._blueprint_world_id = world.id
+        return self._vehicle_blueprints, self._walker_blueprints, self._controller_blueprint
+
+    def select_spawn_points(self, world, count, rnd=random):
+        """挑选 count 个互不重叠、附近没有车辆的出生点"""
+        transforms, xyz = self._spawn_points(world)
+        state = self.client_manager.world_state.get(world)
+        occupied = state.location[state.cls == ACTOR_CLASS_VEHICLE]
+        candidates = np.arange(len(xyz))
+        if len(occupied) and len(candidates):
+            diff = xyz[:, None, :2] - occupied[None, :, :2]
+            nearest = np.sqrt(np.einsum("ijk,ijk->ij", diff, diff)).min(axis=1)
+            candidates = candidates[nearest > SPAWN_CLEARANCE]
+        candidates = candidates.tolist()
+        rnd.shuffle(candidates)
+
+        chosen = []
+        chosen_xy = np.empty((0, 2))
+        for index in candidates:
+            if len(chosen) >= count:
+                break
+            point = xyz[index, :2]
+            if len(chosen_xy) and np.min(np.hypot(*(chosen_xy - point).T)) <= SPAWN_CLEARANCE:
+                continue
+            chosen.append(transforms[index])
+            chosen_xy = np.vstack((chosen_xy, point))
+        return chosen
+
+    def spawn(self, num_vehicles, num_walkers, tm_port=DEFAULT_TM_PORT, seed=None):
+        """生成交通流，返回 (车辆数, 行人数)"""
+        client_manager = self.client_manager
+        world = client_manager.world
+        client = client_manager.client
+        if world is None or client is None:
+            print("❌ 请先连接到 CARLA")
+            return 0, 0
+        t_start = time.perf_counter()
+        rnd = random.Random(seed)
+        synchronous = world.get_settings().synchronous_mode
+
+        traffic_manager = client.get_trafficmanager(tm_port)
+        traffic_manager.set_global_distance_to_leading_vehicle(TM_LEADING_DISTANCE)
+        if synchronous:
+            traffic_manager.set_synchronous_mode(True)
+        if seed is not None:
+            traffic_manager.set_random_device_seed(seed)
+        client_manager.tm_port = tm_port
+
+        with self._lock:
+            vehicle_ids = self._spawn_vehicles(world, num_vehicles, tm_port, rnd, synchronous)
+            walker_ids, controller_ids = self._spawn_walkers(world, num_walkers, rnd, synchronous)
+            self.vehicle_ids.extend(vehicle_ids)
+            self.walker_ids.extend(walker_ids)
+            self.controller_ids.extend(controller_ids)
+
+        print(
+            f"✅ 已生成 {len(vehicle_ids)} 辆车、{len(walker_ids)} 个行人 "
+            f"(TM 端口 {tm_port})，用时 {time.perf_counter() - t_start:.1f}s"
+        )
+        return len(vehicle_ids), len(walker_ids)
+
+    def _spawn_vehicles(self, world, count, tm_port, rnd, synchronous):
+        if count <= 0:
+            return []
+        vehicle_blueprints, _, _ = self._blueprints(world)
+        spawn_points = self.select_spawn_points(world, count, rnd)
+        if len(spawn_points) < count:
+            print(f"⚠️ 可用出生点不足，只生成 {len(spawn_points)} 辆车")
+
+        batch = self.client_manager.new_batch()
+        future = carla.command.FutureActor
+        for transform in spawn_points:
+            bp = rnd.choice(vehicle_blueprints)
+            if bp.has_attribute("color"):
+                bp.set_attribute("color", rnd.choice(bp.get_attribute("color").recommended_values))
+            bp.set_attribute("role_name", "autopilot")
+            batch.spawn(bp, transform, carla.command.SetAutopilot(future, True, tm_port))
+        result = batch.apply(do_tick=synchronous)
+        result.report("生成车辆")
+        # 生成失败时 actor_id 为 0；SetAutopilot 失败的车辆已存在，仍需记录以便清除
+        return [actor_id for actor_id in result.actor_ids if actor_id]
+
+    def _spawn_walkers(self, world, count, rnd, synchronous):
+        if count <= 0:
+            return [], []
+        _, walker_blueprints, controller_bp = self._blueprints(world)
+
+        # 行人出生点只能逐个从导航网格上随机获取
+        batch = self.client_manager.new_batch()
+        speeds = []
+        for _ in range(count):
+            location = world.get_random_location_from_navigation()
+            if location is None:
+                continue
+            bp = rnd.choice(walker_blueprints)
+            if bp.has_attribute("is_invincible"):
+                bp.set_attribute("is_invincible", "false")
+            speed = 1.4
+            if bp.has_attribute("speed"):
+                # recommended_values: [停止, 行走, 奔跑]
+                values = bp.get_attribute("speed").recommended_values
+                speed = float(values[2] if rnd.random() < WALKER_RUNNING_RATIO else values[1])
+            speeds.append(speed)
+            batch.spawn(bp, carla.Transform(location))
+        result = batch.apply(do_tick=synchronous)
+        result.report("生成行人")
+        walkers = [(actor_id, speed) for actor_id, speed in zip(result.actor_ids, speeds) if actor_id]
+
+        batch = self.client_manager.new_batch()
+        for walker_id, _ in walkers:
+            batch.spawn(controller_bp, carla.Transform(), parent_id=walker_id)
+        result = batch.apply(do_tick=synchronous)
+        result.report("生成行人控制器")
+        pairs = [
+            (walker_id, controller_id, speed)
+            for (walker_id, speed), controller_id in zip(walkers, result.actor_ids)
+            if controller_id
+        ]
+        # 没挂上控制器的行人不会移动，直接销毁
+        orphans = set(w for w, _ in walkers) - set(w for w, _, _ in pairs)
+        if orphans:
+            batch = self.client_manager.new_batch()
+            for walker_id in orphans:
+                batch.destroy(walker_id)
+            batch.apply(do_tick=synchronous)
+
+        # 控制器需要在生成后的一帧才能启动
+        if synchronous:
+            world.tick()
+        else:
+            world.wait_for_tick()
+        world.set_pedestrians_cross_factor(WALKER_CROSSING_FACTOR)
+        controllers = {actor.id: actor for actor in world.get_actors([c for _, c, _ in pairs])}
+        for _, controller_id, speed in pairs:
+            controller = controllers.get(controller_id)
+            if controller is None:
+                continue
+            controller.start()
+            controller.go_to_location(world.get_random_location_from_navigation())
+            controller.set_max_speed(speed)
+        return [w for w, _, _ in pairs], [c for _, c, _ in pairs]
+
+    def clear(self):
+        """停止行人控制器，并一次批量销毁本模块生成的全部 actor"""
+        client_manager = self.client_manager
+        world = client_manager.world
+        if world is None:
+            return 0
+        with self._lock:
+            vehicle_ids, walker_ids, controller_ids = self.vehicle_ids, self.walker_ids, self.controller_ids
+            self.vehicle_ids, self.walker_ids, self.controller_ids = [], [], []
+        for controller in world.get_actors(controller_ids):
+            controller.stop()
+        batch = client_manager.new_batch()
+        for actor_id in controller_ids + walker_ids + vehicle_ids:
+            batch.destroy(actor_id)
+        result = batch.apply()
+        result.report("清除交通流")
+        return result.succeeded
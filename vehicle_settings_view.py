@@ -6,16 +6,21 @@ import subprocess
 import carla
 from carla_manager import CarlaSimulatorManager
 from carla_client import CarlaClientManager
+from carla_async import AsyncCarlaClient
+from batch_commands import DEFAULT_TM_PORT
+from traffic_population import TrafficPopulation
 from i18n import t, add_language_listener
 
 
 def build_vehicle_settings_tab():
     manager = CarlaSimulatorManager()
     client_manager = CarlaClientManager()
+    carla_async = AsyncCarlaClient()
+    traffic = TrafficPopulation()
 
-    def spawn_vehicle_from_spectator():
+    async def spawn_vehicle_from_spectator():
         # 1. 获取出生点
-        transform = client_manager.get_auto_vehicle_spawnpoint()
+        transform = await carla_async.get_auto_vehicle_spawnpoint()
         if not transform:
             ui.notify("无法获取出生点，请确认已连接 CARLA 并有地图", type="warning")
             return
@@ -32,7 +37,7 @@ def build_vehicle_settings_tab():
         role_name = role_input.value or "hero"
         blueprint_id = vehicle_blueprint_select.value or "vehicle.tesla.model3"
         try:
-            vehicle = client_manager.spawn_vehicle(role_name, transform, blueprint_id=blueprint_id)
+            vehicle = await carla_async.spawn_vehicle(role_name, transform, blueprint_id=blueprint_id)
             if vehicle:
                 ui.notify("车辆生成成功", type="positive")
             else:
@@ -40,7 +45,7 @@ def build_vehicle_settings_tab():
         except Exception as e:
             ui.notify(f"生成车辆失败: {e}", type="negative")
 
-    def spawn_vehicle_manual():
+    async def spawn_vehicle_manual():
         if not client_manager.is_connected:
             ui.notify("请先连接到 CARLA 服务器", type="warning")
             return
@@ -61,7 +66,7 @@ def build_vehicle_settings_tab():
         role_name = role_input.value or "hero"
         blueprint_id = vehicle_blueprint_select.value or "vehicle.tesla.model3"
         try:
-            vehicle = client_manager.spawn_vehicle(role_name, transform, blueprint_id=blueprint_id)
+            vehicle = await carla_async.spawn_vehicle(role_name, transform, blueprint_id=blueprint_id)
             if vehicle:
                 ui.notify("车辆生成成功", type="positive")
             else:
@@ -70,7 +75,7 @@ def build_vehicle_settings_tab():
             ui.notify(f"生成车辆失败: {e}", type="negative")
 
 
-    def move_vehicle_to_specified_pose():
+    async def move_vehicle_to_specified_pose():
         if not client_manager.is_connected:
             ui.notify("请先连接到 CARLA 服务器", type="warning")
             return
@@ -89,7 +94,7 @@ def build_vehicle_settings_tab():
             carla.Rotation(pitch=pitch, yaw=yaw, roll=roll),
         )
         try:
-            client_manager.set_vehicle_pose(transform,rolename=role_input.value or "hero")
+            await carla_async.set_vehicle_pose(transform,rolename=role_input.value or "hero")
             ui.notify("已移动车辆到指定位置", type="positive")
         except Exception as e:
             ui.notify(f"移动车辆失败: {e}", type="negative")
@@ -99,33 +104,35 @@ def build_vehicle_settings_tab():
             spawn_card_title = ui.label(t("vehicle.card_spawn_title"))
             with ui.row():
                 role_input = ui.input("Role Name:", value="hero").classes("w-1/5")
-                vehicle_blueprints = client_manager.get_available_vehicle_blueprints() if client_manager.is_connected else []
-                vehicle_blueprint_options = [bp.id for bp in vehicle_blueprints]
-                vehicle_blueprint_select = ui.select(
-                    vehicle_blueprint_options,
-                    label="车型",
-                    value=vehicle_blueprint_options[0] if vehicle_blueprint_options else None,
-                ).classes("w-2/5")
-                
-                def refresh_vehicle_blueprints():
-                    if not client_manager.is_connected:
-                        ui.notify("请先连接到 CARLA 服务器", type="warning")
-                        return
-                    blueprints = client_manager.get_available_vehicle_blueprints()
+                vehicle_blueprint_select = ui.select([], label="车型", value=None).classes("w-2/5")
+
+                async def load_vehicle_blueprints():
+                    blueprints = await carla_async.get_available_vehicle_blueprints()
                     options = [bp.id for bp in blueprints]
                     vehicle_blueprint_select.options = options
                     vehicle_blueprint_select.value = options[0] if options else None
+                    return options
+
+                async def refresh_vehicle_blueprints():
+                    if not client_manager.is_connected:
+                        ui.notify("请先连接到 CARLA 服务器", type="warning")
+                        return
+                    options = await load_vehicle_blueprints()
                     ui.notify(f"已获取 {len(options)} 种车型", type="positive")
+
+                # 车型列表在页面建好后异步获取，不在构建页面时阻塞事件循环
+                if client_manager.is_connected:
+                    ui.timer(0, load_vehicle_blueprints, once=True)
                 btn_refresh_blueprints = ui.button(t("vehicle.btn_refresh_blueprints"), color="green-200", on_click=refresh_vehicle_blueprints).classes("w-1/5")
                 
                 btn_spawn_at_view = ui.button(t("vehicle.btn_spawn_at_view"), color="green", on_click=spawn_vehicle_from_spectator).classes("w-1/5")
                 btn_spawn_by_coord = ui.button(t("vehicle.btn_spawn_by_coord"), color="blue", on_click=spawn_vehicle_manual).classes("w-1/5")
-                def on_delete_all_vehicles():
+                async def on_delete_all_vehicles():
                     if not client_manager.is_connected:
                         ui.notify("请先连接到 CARLA 服务器", type="warning")
                         return
                     try:
-                        client_manager.delete_all_vehicles()
+                        await carla_async.delete_all_vehicles()
                         ui.notify("已删除所有车辆", type="positive")
                     except Exception as e:
                         ui.notify(f"删除失败: {e}", type="negative")
@@ -152,9 +159,71 @@ def build_vehicle_settings_tab():
                 move_roll = ui.input("Roll:", value="0.00").props("type=number").classes("w-1/4")
             with ui.row():
                 btn_move_to_pose = ui.button(t("vehicle.btn_move_to_pose"), color="green-100", on_click=move_vehicle_to_specified_pose)
-                switch_autopilot = ui.switch(t("vehicle.switch_autopilot"),on_change=lambda e: client_manager.set_autopilot(e.value))
-                switch_show_speed = ui.switch(t("vehicle.switch_show_speed"),on_change=lambda e: client_manager.set_display_speed(e.value))
-                switch_show_pose = ui.switch(t("vehicle.switch_show_pose"),on_change=lambda e: client_manager.set_display_pose(e.value))
+                async def on_autopilot_change(e):
+                    try:
+                        await carla_async.set_autopilot(e.value)
+                    except Exception as ex:
+                        ui.notify(f"设置自动驾驶失败: {ex}", type="negative")
+
+                async def on_show_speed_change(e):
+                    try:
+                        await carla_async.set_display_speed(e.value)
+                    except Exception as ex:
+                        ui.notify(f"设置车速显示失败: {ex}", type="negative")
+
+                async def on_show_pose_change(e):
+                    try:
+                        await carla_async.set_display_pose(e.value)
+                    except Exception as ex:
+                        ui.notify(f"设置坐标显示失败: {ex}", type="negative")
+
+                switch_autopilot = ui.switch(t("vehicle.switch_autopilot"),on_change=on_autopilot_change)
+                switch_show_speed = ui.switch(t("vehicle.switch_show_speed"),on_change=on_show_speed_change)
+                switch_show_pose = ui.switch(t("vehicle.switch_show_pose"),on_change=on_show_pose_change)
+                display_radius = ui.number(
+                    t("vehicle.label_display_radius"), value=client_manager.label_overlay.radius, min=0, step=10, format="%.0f",
+                    on_change=lambda e: client_manager.set_display_radius(e.value or 0),
+                ).classes("w-24")
+
+    async def spawn_traffic():
+        if not client_manager.is_connected:
+            ui.notify("请先连接到 CARLA 服务器", type="warning")
+            return
+        try:
+            num_vehicles = int(traffic_vehicles.value or 0)
+            num_walkers = int(traffic_walkers.value or 0)
+            tm_port = int(traffic_tm_port.value)
+        except (TypeError, ValueError):
+            ui.notify("数量或端口格式有误，请输入整数", type="negative")
+            return
+        try:
+            vehicles, walkers = await carla_async.run(traffic.spawn, num_vehicles, num_walkers, tm_port=tm_port)
+            ui.notify(f"已生成 {vehicles} 辆车、{walkers} 个行人", type="positive")
+        except Exception as e:
+            ui.notify(f"生成交通流失败: {e}", type="negative")
+
+    async def clear_traffic():
+        if not client_manager.is_connected:
+            ui.notify("请先连接到 CARLA 服务器", type="warning")
+            return
+        try:
+            count = await carla_async.run(traffic.clear)
+            ui.notify(f"已清除交通流, 共{count}个", type="positive")
+        except Exception as e:
+            ui.notify(f"清除交通流失败: {e}", type="negative")
+
+    with ui.card():
+        traffic_card_title = ui.label(t("vehicle.card_traffic_title"))
+        with ui.row().classes("items-center"):
+            traffic_vehicles = ui.number(t("vehicle.label_traffic_vehicles"), value=30, min=0, step=10, format="%d").classes("w-24")
+            traffic_walkers = ui.number(t("vehicle.label_traffic_walkers"), value=10, min=0, step=10, format="%d").classes("w-24")
+            traffic_tm_port = ui.number("TM Port", value=DEFAULT_TM_PORT, min=1, max=65535, format="%d").classes("w-24")
+            btn_spawn_traffic = ui.button(t("vehicle.btn_spawn_traffic"), color="green", on_click=spawn_traffic)
+            btn_clear_traffic = ui.button(t("vehicle.btn_clear_traffic"), color="red", on_click=clear_traffic)
+
+    def set_input_label(element, key):
+        element.props["label"] = t(key)
+        element.update()
 
     def apply_language(lang):
         spawn_card_title.text = t("vehicle.card_spawn_title")
@@ -167,5 +236,11 @@ def build_vehicle_settings_tab():
         switch_autopilot.label = t("vehicle.switch_autopilot")
         switch_show_speed.label = t("vehicle.switch_show_speed")
         switch_show_pose.label = t("vehicle.switch_show_pose")
+        set_input_label(display_radius, "vehicle.label_display_radius")
+        traffic_card_title.text = t("vehicle.card_traffic_title")
+        set_input_label(traffic_vehicles, "vehicle.label_traffic_vehicles")
+        set_input_label(traffic_walkers, "vehicle.label_traffic_walkers")
+        btn_spawn_traffic.text = t("vehicle.btn_spawn_traffic")
+        btn_clear_traffic.text = t("vehicle.btn_clear_traffic")
 
     add_language_listener(apply_language)
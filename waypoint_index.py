@@ -0,0 +1,224 @@
+"""
+本地的最近路点索引
+
+每张地图只调用一次 generate_waypoints，把机动车道上密集采样的路点存入
+均匀网格（按格子排序的 CSR 结构）。之后的最近车道、k 近邻、半径查询
+都以 NumPy 批量完成，不再为每个点调用一次 carla_map.get_waypoint。
+
+查询从所在格子开始逐圈扩大搜索范围；只有当找到的距离不超过已搜索范围的
+内切半径时才认为结果确定，因此结果与暴力搜索一致。
+"""
+
+import os
+import threading
+
+import carla
+import numpy as np
+
+from map_identity import get_current_map
+from map_disk_cache import CACHE_DIR as MAP_CACHE_DIR
+
+
+WAYPOINT_CACHE_DIR = os.path.join(os.path.dirname(MAP_CACHE_DIR), "waypoints")
+WAYPOINT_CACHE_VERSION = 1
+# 路点采样间隔与网格边长（米）
+WAYPOINT_SPACING = 2.0
+GRID_CELL_SIZE = 10.0
+
+
+class WaypointIndex:
+    """
+    xyz (N, 3) / rotation (N, 3) 为 pitch, yaw, roll /
+    lane (N, 3) 为 (road_id, section_id, lane_id)
+    """
+
+    FIELDS = ("xyz", "rotation", "lane")
+
+    def __init__(self, xyz, rotation, lane, cell_size=GRID_CELL_SIZE):
+        self.xyz = xyz
+        self.rotation = rotation
+        self.lane = lane
+        self.cell_size = cell_size
+        if len(xyz):
+            self._origin = xyz[:, :2].min(axis=0)
+            extent = xyz[:, :2].max(axis=0) - self._origin
+        else:
+            self._origin = np.zeros(2)
+            extent = np.zeros(2)
+        self._nx, self._ny = (np.floor(extent / cell_size).astype(np.int64) + 1).tolist()
+        cells = self._cell_ids(*self._cell_coords(xyz[:, :2]))
+        self._order = np.argsort(cells, kind="stable").astype(np.int64)
+        self._offsets = np.searchsorted(cells[self._order], np.arange(self._nx * self._ny + 1))
+
+    @classmethod
+    def from_map(cls, carla_map, spacing=WAYPOINT_SPACING):
+        rows = []
+        for wp in carla_map.generate_waypoints(spacing):
+            if wp.lane_type != carla.LaneType.Driving:
+                continue
+            t = wp.transform
+            rows.append((
+                t.location.x, t.location.y, t.location.z,
+                t.rotation.pitch, t.rotation.yaw, t.rotation.roll,
+                wp.road_id, wp.section_id, wp.lane_id,
+            ))
+        table = np.asarray(rows, dtype=np.float64).reshape(-1, 9)
+        return cls(table[:, 0:3].copy(), table[:, 3:6].copy(), table[:, 6:9].astype(np.int32))
+
+    def to_arrays(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(*(arrays[name] for name in cls.FIELDS))
+
+    def __len__(self):
+        return len(self.xyz)
+
+    def _cell_coords(self, xy):
+        cell = np.floor((xy - self._origin) / self.cell_size).astype(np.int64)
+        return cell[:, 0], cell[:, 1]
+
+    def _cell_ids(self, cx, cy):
+        return cy * self._nx + cx
+
+    def _candidates(self, queries, ring):
+        """
+        收集每个查询点周围 (2 * ring + 1)^2 个格子里的路点，
+        返回 (查询下标, 路点下标) 两个等长数组
+        """
+        qx, qy = self._cell_coords(queries[:, :2])
+        span = np.arange(-ring, ring + 1)
+        dx, dy = np.meshgrid(span, span)
+        cx = qx[:, None] + dx.ravel()
+        cy = qy[:, None] + dy.ravel()
+        valid = (cx >= 0) & (cx < self._nx) & (cy >= 0) & (cy < self._ny)
+        cells = np.where(valid, self._cell_ids(cx, cy), 0)
+        starts = self._offsets[cells]
+        counts = np.where(valid, self._offsets[cells + 1] - starts, 0).ravel()
+        total = int(counts.sum())
+        query_of = np.repeat(np.repeat(np.arange(len(queries)), cx.shape[1]), counts)
+        group_start = np.repeat(np.cumsum(counts) - counts, counts)
+        slots = np.repeat(starts.ravel(), counts) + (np.arange(total) - group_start)
+        return query_of, self._order[slots]
+
+    def _distances(self, queries, query_of, points):
+        dims = queries.shape[1]
+        diff = self.xyz[points, :dims] - queries[query_of]
+        return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+
+    def query_knn(self, points, k=1):
+        """
+        points 为 (M, 2) 或 (M, 3) 世界坐标（带 z 时按三维距离，可区分立交层）。
+        返回 (indices, distances)，形状均为 (M, k)；路点不足 k 个时用 -1 / inf 填充。
+        """
+        queries = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        m = len(queries)
+        indices = np.full((m, k), -1, dtype=np.int64)
+        distances = np.full((m, k), np.inf)
+        if m == 0 or len(self) == 0:
+            return indices, distances
+        pending = np.arange(m)
+        ring = 1
+        while len(pending):
+            if (2 * ring + 1) ** 2 > self._nx * self._ny:
+                # 远离路网的点：搜索块已比整个网格还大，直接逐个暴力比较
+                dims = queries.shape[1]
+                for q in pending.tolist():
+                    dist = np.linalg.norm(self.xyz[:, :dims] - queries[q], axis=1)
+                    nearest = np.argsort(dist, kind="stable")[:k]
+                    indices[q, :len(nearest)] = nearest
+                    distances[q, :len(nearest)] = dist[nearest]
+                break
+            sub = queries[pending]
+            query_of, cand = self._candidates(sub, ring)
+            dist = self._distances(sub, query_of, cand)
+            order = np.lexsort((dist, query_of))
+            query_of, cand, dist = query_of[order], cand[order], dist[order]
+            group_start = np.searchsorted(query_of, np.arange(len(sub)))
+            rank = np.arange(len(query_of)) - group_start[query_of]
+            keep = rank < k
+            found_idx = np.full((len(sub), k), -1, dtype=np.int64)
+            found_dist = np.full((len(sub), k), np.inf)
+            found_idx[query_of[keep], rank[keep]] = cand[keep]
+            found_dist[query_of[keep], rank[keep]] = dist[keep]
+            # 第 k 近的距离不超过已搜索范围的内切半径时结果确定
+            done = found_dist[:, -1] <= ring * self.cell_size
+            indices[pending[done]] = found_idx[done]
+            distances[pending[done]] = found_dist[done]
+            pending = pending[~done]
+            ring *= 2
+        return indices, distances
+
+    def query_nearest(self, points):
+        """每个点最近的车道路点，返回 (indices (M,), distances (M,))"""
+        indices, distances = self.query_knn(points, 1)
+        return indices[:, 0], distances[:, 0]
+
+    def query_radius(self, points, radius):
+        """返回每个点 radius 米内的路点下标列表（按距离升序）"""
+        queries = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        if len(queries) == 0 or len(self) == 0:
+            return [np.empty(0, dtype=np.int64) for _ in range(len(queries))]
+        ring = max(1, int(np.ceil(radius / self.cell_size)))
+        query_of, cand = self._candidates(queries, ring)
+        dist = self._distances(queries, query_of, cand)
+        inside = dist <= radius
+        query_of, cand, dist = query_of[inside], cand[inside], dist[inside]
+        order = np.lexsort((dist, query_of))
+        query_of, cand = query_of[order], cand[order]
+        bounds = np.searchsorted(query_of, np.arange(len(queries) + 1))
+        return [cand[bounds[i]:bounds[i + 1]] for i in range(len(queries))]
+
+    def transform(self, index, z_offset=0.0):
+        """把路点下标转换为 carla.Transform，例如作为出生点"""
+        x, y, z = self.xyz[index].tolist()
+        pitch, yaw, roll = self.rotation[index].tolist()
+        return carla.Transform(
+            carla.Location(x=x, y=y, z=z + z_offset),
+            carla.Rotation(pitch=pitch, yaw=yaw, roll=roll),
+        )
+
+    def lane_key(self, index):
+        return tuple(self.lane[index].tolist())
+
+
+_index = None
+_index_key = None
+_index_lock = threading.Lock()
+
+
+def _cache_path(opendrive_hash):
+    name = f"{opendrive_hash}_{WAYPOINT_SPACING}_{WAYPOINT_CACHE_VERSION}.npz"
+    return os.path.join(WAYPOINT_CACHE_DIR, name)
+
+
+def _load_or_build(carla_map, opendrive_hash):
+    path = _cache_path(opendrive_hash)
+    if os.path.isfile(path):
+        try:
+            with np.load(path) as arrays:
+                return WaypointIndex.from_arrays(arrays)
+        except Exception as e:
+            print(f"⚠️ 读取路点索引缓存失败: {e}")
+    index = WaypointIndex.from_map(carla_map)
+    try:
+        os.makedirs(WAYPOINT_CACHE_DIR, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **index.to_arrays())
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ 写入路点索引缓存失败: {e}")
+    return index
+
+
+def get_waypoint_index(world):
+    """返回当前地图的路点索引，地图变化后自动重建"""
+    global _index, _index_key
+    carla_map, key = get_current_map(world)
+    with _index_lock:
+        if _index is None or _index_key != key:
+            _index = _load_or_build(carla_map, key[1])
+            _index_key = key
+        return _index
@@ -0,0 +1,348 @@
+"""
+按 tick 共享的世界状态
+
+WorldStateCache 每个服务器 tick 只读取一次 world.get_snapshot()，把所有 actor 的
+位姿、速度整理成 NumPy 数组，发布为不可变的 WorldState。地图刷新、车辆信息显示、
+观察者跟随等所有读取方共享同一份状态，不再各自调用 get_actors() 和 get_transform()。
+
+快照不包含 type_id 和 role_name，这些在 actor 生成后不会改变，由 ActorMetadataIndex
+按 id 缓存；只有快照中出现新 id 时才用 world.get_actors(ids) 批量查询一次，
+并维护 role_name 到 actor 的索引。
+
+发布采用双缓冲：新状态在后台构建完成后才替换引用，读取方拿到的状态不会再被修改，
+因此读取时不需要加锁。
+"""
+
+import threading
+import time
+
+import carla
+import numpy as np
+
+
+ACTOR_CLASS_OTHER = -1
+ACTOR_CLASS_VEHICLE = 0
+ACTOR_CLASS_WALKER = 1
+
+# attach 后超过该时间（秒）没有被 tick 线程刷新时，get 退回按快照帧号刷新
+STATE_STALE_AFTER = 1.0
+# 登记的 actor 连续这么多帧没有出现在快照中，视为在出现之前就已销毁
+REGISTERED_GRACE_FRAMES = 3
+
+
+def classify_type_id(type_id):
+    if type_id.startswith("vehicle."):
+        return ACTOR_CLASS_VEHICLE
+    if type_id.startswith("walker.pedestrian"):
+        return ACTOR_CLASS_WALKER
+    return ACTOR_CLASS_OTHER
+
+
+def _readonly(array):
+    array.flags.writeable = False
+    return array
+
+
+class ActorPoses:
+    """
+    某一帧的 actor 位姿，数组按 actor 对齐:
+    ids (N,) int64 / xy (N, 2) float64 / yaw (N,) float64 度 / cls (N,) int8 (ACTOR_CLASS_*)
+    """
+
+    def __init__(self, frame, ids, xy, yaw, cls):
+        self.frame = frame
+        self.ids = ids
+        self.xy = xy
+        self.yaw = yaw
+        self.cls = cls
+
+    @classmethod
+    def empty(cls, frame=None):
+        return cls(
+            frame,
+            np.empty(0, dtype=np.int64),
+            np.empty((0, 2), dtype=np.float64),
+            np.empty(0, dtype=np.float64),
+            np.empty(0, dtype=np.int8),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, actor_id):
+        """返回 actor 在数组中的下标，不存在时返回 None"""
+        if actor_id is None:
+            return None
+        hits = np.flatnonzero(self.ids == actor_id)
+        return int(hits[0]) if len(hits) else None
+
+    def select(self, mask):
+        return ActorPoses(self.frame, self.ids[mask], self.xy[mask], self.yaw[mask], self.cls[mask])
+
+
+class ActorInfo:
+    """actor 生成后不会改变的元数据"""
+
+    def __init__(self, actor_id, type_id, attributes):
+        self.id = actor_id
+        self.type_id = type_id
+        self.attributes = attributes
+        self.role_name = attributes.get("role_name", "")
+        self.actor_class = classify_type_id(type_id)
+
+    @classmethod
+    def from_actor(cls, actor):
+        return cls(actor.id, actor.type_id, dict(actor.attributes))
+
+
+class ActorMetadataIndex:
+    """
+    actor 元数据索引：id -> ActorInfo，以及 role_name -> 按出现顺序排列的 id 列表。
+    根据相邻两帧快照的 id 差集增删条目；更新时构建新的字典，与角色索引一起作为一个元组
+    整体替换（写时复制），读取方只读一次 _index，无需加锁也不会看到新旧混合的状态。
+    """
+
+    def __init__(self):
+        self._write_lock = threading.Lock()
+        # (id -> ActorInfo, role_name -> [id])
+        self._index = ({}, {})
+        self._seen = frozenset()
+        # 已登记、尚未出现在快照中的 id -> 连续缺席的帧数
+        self._pending = {}
+
+    def get(self, actor_id):
+        return self._index[0].get(actor_id)
+
+    def ids_with_role(self, role_name, type_prefix="vehicle."):
+        """role_name 相同、type_id 以 type_prefix 开头的 actor id，按出现顺序排列"""
+        infos, roles = self._index
+        return [
+            actor_id for actor_id in roles.get(role_name, ())
+            if infos[actor_id].type_id.startswith(type_prefix)
+        ]
+
+    def ids_of_class(self, actor_class):
+        return [actor_id for actor_id, info in self._index[0].items() if info.actor_class == actor_class]
+
+    def register(self, actor):
+        """由本进程生成的 actor 立即登记，不必等它出现在下一帧快照中"""
+        with self._write_lock:
+            self._apply({actor.id: ActorInfo.from_actor(actor)}, ())
+            if actor.id not in self._seen:
+                self._pending[actor.id] = 0
+
+    def update(self, world, ids):
+        """按本帧快照中的 id 更新索引，返回与 ids 对齐的 ActorInfo 列表"""
+        with self._write_lock:
+            return self._update(world, ids)
+
+    def _update(self, world, ids):
+        current = frozenset(ids)
+        infos = self._index[0]
+        added = [actor_id for actor_id in ids if actor_id not in infos]
+        # 上一帧还在、本帧消失的即为已销毁的 actor
+        removed = set(self._seen - current)
+        # 登记后几帧内都没出现在快照里的，是出现之前就已销毁的 actor
+        for actor_id in list(self._pending):
+            if actor_id in current:
+                del self._pending[actor_id]
+                continue
+            self._pending[actor_id] += 1
+            if self._pending[actor_id] > REGISTERED_GRACE_FRAMES:
+                del self._pending[actor_id]
+                removed.add(actor_id)
+        if added or removed:
+            new_infos = {}
+            if added:
+                for actor in world.get_actors(added):
+                    new_infos[actor.id] = ActorInfo.from_actor(actor)
+                for actor_id in added:
+                    # 查询时已销毁的 actor
+                    new_infos.setdefault(actor_id, ActorInfo(actor_id, "", {}))
+            self._apply(new_infos, removed)
+        self._seen = current
+        infos = self._index[0]
+        return [infos[actor_id] for actor_id in ids]
+
+    def _apply(self, added, removed):
+        infos = {k: v for k, v in self._index[0].items() if k not in removed}
+        infos.update(added)
+        roles = {}
+        for actor_id, info in infos.items():
+            roles.setdefault(info.role_name, []).append(actor_id)
+        self._index = (infos, roles)
+
+
+class WorldState:
+    """
+    某一帧全部 actor 的只读视图，数组按 actor 对齐:
+    ids (N,) / cls (N,) ACTOR_CLASS_* / type_ids, role_names (N,) 字符串元组 /
+    location (N, 3) / rotation (N, 3) 为 pitch, yaw, roll /
+    velocity (N, 3) m/s / angular_velocity (N, 3) deg/s
+    """
+
+    def __init__(self, world_id, frame, timestamp, ids, cls, type_ids, role_names,
+                 location, rotation, velocity, angular_velocity):
+        self.world_id = world_id
+        self.frame = frame
+        self.timestamp = timestamp
+        self.ids = _readonly(ids)
+        self.cls = _readonly(cls)
+        self.type_ids = type_ids
+        self.role_names = role_names
+        self.location = _readonly(location)
+        self.rotation = _readonly(rotation)
+        self.velocity = _readonly(velocity)
+        self.angular_velocity = _readonly(angular_velocity)
+        self._positions = None
+        self._poses = None
+
+    @classmethod
+    def empty(cls, world_id=None, frame=None, timestamp=0.0):
+        vectors = np.empty((0, 3), dtype=np.float64)
+        return cls(
+            world_id, frame, timestamp,
+            np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), (), (),
+            vectors, vectors.copy(), vectors.copy(), vectors.copy(),
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def index_of(self, actor_id):
+        """返回 actor 在数组中的下标，不存在时返回 None"""
+        if self._positions is None:
+            # 首次按 id 查找时才建立映射；并发读取时重复构建也只是同样的结果
+            self._positions = {actor_id: i for i, actor_id in enumerate(self.ids.tolist())}
+        return self._positions.get(actor_id)
+
+    def indices_of_class(self, actor_class):
+        return np.flatnonzero(self.cls == actor_class)
+
+    def transform(self, index):
+        x, y, z = self.location[index].tolist()
+        pitch, yaw, roll = self.rotation[index].tolist()
+        return carla.Transform(carla.Location(x=x, y=y, z=z), carla.Rotation(pitch=pitch, yaw=yaw, roll=roll))
+
+    def speed(self, index):
+        """速度大小（m/s）"""
+        return float(np.linalg.norm(self.velocity[index]))
+
+    def actor_poses(self):
+        """车辆和行人的二维位姿，供地图叠加层使用；每帧只计算一次"""
+        if self._poses is None:
+            mask = self.cls != ACTOR_CLASS_OTHER
+            self._poses = ActorPoses(
+                self.frame,
+                self.ids[mask],
+                np.ascontiguousarray(self.location[mask, :2]),
+                self.rotation[mask, 1],
+                self.cls[mask],
+            )
+        return self._poses
+
+
+class WorldStateCache:
+    """
+    WorldState 的唯一写入方。attach 后由 TickScheduler 的 tick 线程每个 tick 调用 refresh；
+    不在 world.on_tick 里刷新，新 actor 的 get_actors 查询不会阻塞 carla 的回调线程。
+    未 attach 的世界（或 tick 线程最近没有刷新）在 get 时按快照帧号按需刷新。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._world = None
+        self._world_id = None
+        self._refreshed_at = 0.0
+        self.metadata = ActorMetadataIndex()
+        self._state = None
+        self._previous = None
+
+    @property
+    def state(self):
+        """最近发布的状态，可能为 None"""
+        return self._state
+
+    @property
+    def previous(self):
+        """上一帧发布的状态，可用于计算帧间差分"""
+        return self._previous
+
+    def attach(self, world):
+        """切换到新的 world 并清空缓存；world 为 None 时表示断开"""
+        with self._lock:
+            if world is not None:
+                self._reset(world)
+            self._world = world
+
+    def get(self, world):
+        """返回 world 的当前状态；已 attach 且 tick 线程在刷新时直接返回最近一次 tick 的结果"""
+        if world is None:
+            return WorldState.empty()
+        state = self._state
+        if (
+            state is not None
+            and state.world_id == world.id
+            and world is self._world
+            and time.monotonic() - self._refreshed_at < STATE_STALE_AFTER
+        ):
+            return state
+        snapshot = world.get_snapshot()
+        if state is not None and state.world_id == world.id and state.frame == snapshot.frame:
+            return state
+        return self.refresh(world, snapshot)
+
+    def refresh(self, world, snapshot):
+        with self._lock:
+            if world.id != self._world_id:
+                self._reset(world)
+            self._refreshed_at = time.monotonic()
+            state = self._state
+            if state is not None and state.frame == snapshot.frame:
+                return state
+            state = self._build(world, snapshot)
+            self._previous = self._state
+            # 引用替换是原子的，读取方要么拿到旧状态，要么拿到完整的新状态
+            self._state = state
+            return state
+
+    def _reset(self, world):
+        # 换图后 actor id 会被复用，元数据缓存失效
+        self._world_id = world.id
+        self.metadata = ActorMetadataIndex()
+        self._state = None
+        self._previous = None
+
+    def _build(self, world, snapshot):
+        rows = []
+        for actor_snapshot in snapshot:
+            t = actor_snapshot.get_transform()
+            v = actor_snapshot.get_velocity()
+            w = actor_snapshot.get_angular_velocity()
+            rows.append((
+                actor_snapshot.id,
+                t.location.x, t.location.y, t.location.z,
+                t.rotation.pitch, t.rotation.yaw, t.rotation.roll,
+                v.x, v.y, v.z,
+                w.x, w.y, w.z,
+            ))
+        timestamp = snapshot.timestamp.elapsed_seconds
+        if not rows:
+            self.metadata.update(world, [])
+            return WorldState.empty(world.id, snapshot.frame, timestamp)
+        table = np.array(rows, dtype=np.float64)
+        ids = table[:, 0].astype(np.int64)
+        infos = self.metadata.update(world, ids.tolist())
+        return WorldState(
+            world.id,
+            snapshot.frame,
+            timestamp,
+            ids,
+            np.fromiter((info.actor_class for info in infos), dtype=np.int8, count=len(ids)),
+            tuple(info.type_id for info in infos),
+            tuple(info.role_name for info in infos),
+            np.ascontiguousarray(table[:, 1:4]),
+            np.ascontiguousarray(table[:, 4:7]),
+            np.ascontiguousarray(table[:, 7:10]),
+            np.ascontiguousarray(table[:, 10:13]),
+        )